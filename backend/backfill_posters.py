@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from utils.db_utils import get_latest_ready_links
+from utils.poster_cache import cache_poster, has_posters
+from utils.upload_link import HEADERS, get_poster_sources
+
+# Fills the poster cache for ready links that have no cached thumbnails yet,
+# e.g. links that were ready before the cache existed or after POSTER_WIDTHS
+# or POSTER_FORMATS changed:
+#
+#   python backfill_posters.py          # only links missing a thumbnail
+#   python backfill_posters.py --force  # re-render every link
+
+BATCH_SIZE = 200
+FIELDS = ("id", "preview_id", "poster_url", "preview_path")
+
+
+def backfill_posters(force: bool = False) -> tuple[int, int]:
+    """Renders the missing posters, newest links first. Returns (rendered, failed)."""
+    rendered = failed = 0
+    after_id = None
+    while True:
+        links = get_latest_ready_links(BATCH_SIZE, after_id=after_id, fields=FIELDS)
+        if not links:
+            return rendered, failed
+        for link in links:
+            if not force and has_posters(link["preview_id"]):
+                continue
+            if cache_poster(link["preview_id"], link["poster_url"], HEADERS, get_poster_sources(link["preview_path"])):
+                rendered += 1
+            else:
+                print(f"{link['preview_id']}: FAILED")
+                failed += 1
+        after_id = links[-1]["id"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render cached posters for ready links that have none.")
+    parser.add_argument("--force", action="store_true", help="re-render posters that are already cached")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rendered, failed = backfill_posters(args.force)
+    print(f"Rendered {rendered} posters, {failed} failed ({time.perf_counter() - started:.2f}s)")
+    raise SystemExit(1 if failed else 0)
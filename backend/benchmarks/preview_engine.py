@@ -0,0 +1,117 @@
+"""
+Preview generation benchmark: wall time and CPU time per strategy.
+
+Generates synthetic sources with ffmpeg's testsrc2 (one short, one long by
+default, keyframe every 250 frames like most web encodes) and renders a
+preview from each with:
+
+- `legacy`: the previous pipeline - one accurately seeked input per clip,
+  default encoder settings
+- `select`: utils.preview_engine single input + select filter
+- `seek`: utils.preview_engine keyframe-aligned input seeking
+
+CPU time is the user + system time of the ffmpeg child processes, so it also
+shows what a strategy costs a busy worker host, not just how long it takes.
+Generated sources are kept in --workdir and reused across runs.
+
+Usage (from the backend folder):
+
+    python -m benchmarks.preview_engine --duration 120 --duration 7200 --repeat 3
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import ffmpeg
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils.preview_engine import build_preview_command, get_clip_count, get_clip_starts  # noqa: E402
+
+
+def make_source(workdir: str, duration: int, size: str) -> str:
+    """Creates (or reuses) a synthetic H.264 source of `duration` seconds."""
+    path = os.path.join(workdir, f"source_{duration}s_{size}.mp4")
+    if not os.path.exists(path):
+        print(f"Generating {duration}s source at {size} ...", flush=True)
+        (
+            ffmpeg.input(f"testsrc2=size={size}:rate=30:duration={duration}", f="lavfi")
+            .output(path, vcodec="libx264", preset="ultrafast", g=250, pix_fmt="yuv420p")
+            .run(overwrite_output=True, quiet=True)
+        )
+    return path
+
+
+def legacy_command(input_path: str, output_path: str, duration: float, num_clips: int):
+    clips = [
+        ffmpeg.input(input_path, ss=start, t=1).filter("setpts", "PTS-STARTPTS")
+        for start in get_clip_starts(duration, num_clips)
+    ]
+    return ffmpeg.concat(*clips, v=1, a=0).output(output_path, movflags="faststart")
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_once(strategy: str, input_path: str, output_path: str, duration: float) -> tuple[float, float]:
+    num_clips = get_clip_count(duration)
+    if strategy == "legacy":
+        command = legacy_command(input_path, output_path, duration, num_clips)
+    else:
+        command = build_preview_command(input_path, output_path, duration, num_clips, strategy)
+
+    cpu_before = children_cpu_seconds()
+    started = time.perf_counter()
+    command.run(overwrite_output=True, quiet=True)
+    return time.perf_counter() - started, children_cpu_seconds() - cpu_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--duration",
+        type=int,
+        action="append",
+        help="source duration in seconds, repeatable (default: 120 and 7200)",
+    )
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=["legacy", "select", "seek"],
+        help="repeatable (default: all)",
+    )
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "smd-preview-bench"))
+    args = parser.parse_args()
+
+    durations = args.duration or [120, 7200]
+    strategies = args.strategy or ["legacy", "select", "seek"]
+    os.makedirs(args.workdir, exist_ok=True)
+    output_path = os.path.join(args.workdir, "preview.mp4")
+
+    print(f"{'source':>10} {'clips':>5} {'strategy':>8} {'wall (s)':>9} {'cpu (s)':>8}")
+    for duration in durations:
+        source = make_source(args.workdir, duration, args.size)
+        for strategy in strategies:
+            walls, cpus = [], []
+            for _ in range(args.repeat):
+                wall, cpu = run_once(strategy, source, output_path, duration)
+                walls.append(wall)
+                cpus.append(cpu)
+            print(
+                f"{duration:>9}s {get_clip_count(duration):>5} {strategy:>8} "
+                f"{statistics.median(walls):>9.2f} {statistics.median(cpus):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
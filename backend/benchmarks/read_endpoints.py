@@ -0,0 +1,196 @@
+"""
+Throughput benchmark: sync threadpool handlers vs. the async DB executor path.
+
+Seeds a throwaway database, then starts two single-worker uvicorn servers
+against it:
+
+- `sync`: the old style `def` handlers that block anyio's threadpool on sqlite
+- `async`: the real application (`main:app`) using utils.async_db
+
+and fires the same concurrent request mix at both.
+
+Usage (from the backend folder):
+
+    python -m benchmarks.read_endpoints --videos 20000 --requests 5000 --concurrency 500
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    "/api/videos/latest?limit=24&page=3",
+    "/api/videos/random?limit=24",
+    "/api/videos/search?query=sonic",
+]
+
+
+def seed_database(path: str, videos: int):
+    """Fills a fresh database with `videos` ready rows."""
+    os.environ["SMD_DATABASE_PATH"] = path
+    sys.path.insert(0, BACKEND_DIR)
+    from setup_db import setup_database
+    from utils import db_utils
+
+    setup_database()
+    words = ["sonic", "tails", "knuckles", "amy", "shadow", "rouge", "eggman"]
+    with db_utils.pool.transaction() as conn:
+        for i in range(videos):
+            preview_id = str(uuid.uuid4())
+            title = f"{words[i % len(words)]} run {i}"
+            conn.execute(
+                "INSERT INTO videos (url, preview_id, status) VALUES (?, ?, 'queued')",
+                (f"https://example.com/v/{i}", preview_id),
+            )
+            conn.execute(
+                "UPDATE videos SET status = 'ready', title = ?, preview_path = ? WHERE preview_id = ?",
+                (title, preview_id, preview_id),
+            )
+    db_utils.close_db_connections()
+
+
+def create_sync_app():
+    """The pre-async handlers: plain `def` routes running on anyio's threadpool."""
+    from fastapi import FastAPI
+    from utils.db_utils import (
+        count_ready_links,
+        get_latest_ready_links,
+        get_random_ready_links,
+        search_videos_by_title,
+    )
+
+    app = FastAPI()
+
+    @app.get("/api/videos/latest")
+    def latest(limit: int = 10, page: int = 1):
+        return {
+            "total_items": count_ready_links(),
+            "videos": get_latest_ready_links(limit=limit, page=page),
+        }
+
+    @app.get("/api/videos/random")
+    def random(limit: int = 10):
+        return get_random_ready_links(limit)
+
+    @app.get("/api/videos/search")
+    def search(query: str):
+        return search_videos_by_title(query)
+
+    return app
+
+
+def start_server(app: str, extra_args: list[str], port: int, env: dict) -> subprocess.Popen:
+    """Starts a single-worker uvicorn server for `app`."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, *extra_args, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_up(client, base_url: str, endpoint: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(base_url + endpoint)
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not come up")
+
+
+async def hammer(base_url: str, endpoints: list[str], total: int, concurrency: int) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        await wait_until_up(client, base_url, endpoints[0])
+        latencies: list[float] = []
+        errors = 0
+        counter = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(base_url + endpoints[i % len(endpoints)])
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        dest="endpoints",
+        help="Request path to include in the mix (repeatable, defaults to latest/random/search)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"Seeding {args.videos} videos into {db_path}")
+        seed_database(db_path, args.videos)
+
+        env = {**os.environ, "SMD_DATABASE_PATH": db_path, "LOG_LEVEL": "WARNING"}
+        servers = {
+            "sync": ("benchmarks.read_endpoints:create_sync_app", ["--factory"], 8101),
+            "async": ("main:app", [], 8102),
+        }
+        results = {}
+        for name, (app, extra_args, port) in servers.items():
+            process = start_server(app, extra_args, port, env)
+            try:
+                results[name] = asyncio.run(
+                    hammer(
+                        f"http://127.0.0.1:{port}",
+                        args.endpoints or ENDPOINTS,
+                        args.requests,
+                        args.concurrency,
+                    )
+                )
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(f"\n{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<8}{result['rps']:>10.0f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import upload
+from routes import status, upload
 from routes.manage import delete
-from routes.preview import preview
+from routes.preview import poster, preview
 from routes.videos import latest, random, search
+from setup_db import setup_database
+from utils.async_db import shutdown_db_executor
+from utils.db_utils import close_db_connections
 from utils.logging_config import get_logger
+from utils.status_events import status_broadcaster
+from utils.task_dispatch import TASK_BACKEND
 
 # Initialize logger for main application
 logger = get_logger("main")
@@ -38,10 +43,16 @@ logger.debug("Registered upload router at /api")
 app.include_router(delete.router, prefix="/api")
 logger.debug("Registered delete router at /api")
 
+app.include_router(status.router, prefix="/api")
+logger.debug("Registered status router at /api")
+
 # Routes that return video elements
 app.include_router(preview.router, prefix="/api")
 logger.debug("Registered preview router at /api")
 
+app.include_router(poster.router, prefix="/api")
+logger.debug("Registered poster router at /api")
+
 app.include_router(random.router, prefix="/api/videos")
 logger.debug("Registered random videos router at /api/videos")
 
@@ -56,11 +67,23 @@ logger.info("Application startup completed successfully")
 
 @app.on_event("startup")
 async def startup_event():
-    """Log application startup event."""
+    """Log application startup event and make sure the schema is up to date."""
     logger.info("FastAPI application startup event triggered")
+    setup_database()
+    if TASK_BACKEND == "local":
+        from utils.local_runner import local_runner
+
+        await local_runner.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Log application shutdown event."""
+    """Log application shutdown event and release pooled database connections."""
     logger.info("FastAPI application shutdown event triggered")
+    if TASK_BACKEND == "local":
+        from utils.local_runner import local_runner
+
+        await local_runner.stop()
+    await status_broadcaster.close()
+    shutdown_db_executor()
+    close_db_connections()
@@ -0,0 +1,62 @@
+import argparse
+import sqlite3
+import time
+
+from setup_db import DATABASE_PATH
+
+# Runs FTS5 maintenance commands against the videos_fts index:
+#
+#   python maintain_fts.py rebuild          # re-index every title from the videos table
+#   python maintain_fts.py optimize         # merge all index segments into one
+#   python maintain_fts.py integrity-check  # verify the index matches the videos table
+#   python maintain_fts.py all              # all of the above, in that order
+
+
+def rebuild_fts_index(conn: sqlite3.Connection):
+    """Discards the index and rebuilds it from the titles in the videos table."""
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+
+
+def optimize_fts_index(conn: sqlite3.Connection):
+    """Merges all index b-trees into one, which makes MATCH queries cheaper."""
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('optimize')")
+
+
+def check_fts_integrity(conn: sqlite3.Connection):
+    """Raises sqlite3.DatabaseError if the index is corrupt or out of sync with the videos table."""
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('integrity-check')")
+
+
+COMMANDS = {
+    "rebuild": rebuild_fts_index,
+    "optimize": optimize_fts_index,
+    "integrity-check": check_fts_integrity,
+}
+
+
+def run_maintenance(commands: list[str]) -> bool:
+    """Runs the given maintenance commands in order. Returns False if any of them failed."""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    ok = True
+    try:
+        for name in commands:
+            started = time.perf_counter()
+            try:
+                with conn:
+                    COMMANDS[name](conn)
+                print(f"{name}: ok ({time.perf_counter() - started:.2f}s)")
+            except sqlite3.Error as e:
+                print(f"{name}: FAILED - {e}")
+                ok = False
+    finally:
+        conn.close()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the videos_fts search index.")
+    parser.add_argument("command", choices=[*COMMANDS, "all"])
+    args = parser.parse_args()
+
+    selected = list(COMMANDS) if args.command == "all" else [args.command]
+    raise SystemExit(0 if run_maintenance(selected) else 1)
@@ -1,8 +1,11 @@
 import os
 
 from fastapi import APIRouter, HTTPException
+from routes.preview.preview import PREVIEW_DIR, preview_path_cache
 from utils.db_utils import delete_link_by_preview_id
 from utils.logging_config import get_logger
+from utils.poster_cache import delete_posters
+from utils.preview_engine import get_rendition_names
 
 router = APIRouter()
 logger = get_logger("routes.manage.delete")
@@ -21,11 +24,24 @@ def delete_item(preview_id: str):
         if not deleted_record:
             logger.warning(f"Delete failed - no record found for preview_id: {preview_id}")
             raise HTTPException(status_code=404, detail="Item not found")
+        preview_path_cache.pop(preview_id)
+        delete_posters(preview_id)
 
         # After deleting the DB record, try to delete the video file
         preview_file_name = deleted_record.get("preview_path")
+        if preview_file_name and deleted_record["preview_in_use"]:
+            logger.info(f"Keeping preview file {preview_file_name}, other links still use it")
+            return {
+                "status": "success",
+                "detail": f"Record for '{preview_id}' was deleted. Its preview file is shared and was kept.",
+            }
         if preview_file_name:
-            file_path = os.path.join("routes", "preview_videos", f"{preview_file_name}.mp4")
+            for name in get_rendition_names():
+                rendition_path = os.path.join(PREVIEW_DIR, f"{preview_file_name}.{name}")
+                if os.path.exists(rendition_path):
+                    os.remove(rendition_path)
+                    logger.debug(f"Deleted preview rendition: {rendition_path}")
+            file_path = os.path.join(PREVIEW_DIR, f"{preview_file_name}.mp4")
             if os.path.exists(file_path):
                 os.remove(file_path)
                 logger.info(f"Successfully deleted preview file: {file_path}")
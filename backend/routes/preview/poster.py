@@ -0,0 +1,132 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from routes.preview.preview import PREVIEW_DIR
+from utils.async_db import run_db
+from utils.db_utils import get_link_by_preview_id
+from utils.downloader import DEFAULT_HEADERS
+from utils.file_delivery import serve_file
+from utils.logging_config import get_logger
+from utils.poster_cache import (
+    POSTER_FORMATS,
+    cache_poster,
+    get_poster_path,
+    select_poster_width,
+    touch_poster,
+)
+from utils.query_cache import TTLLRUCache
+
+router = APIRouter()
+logger = get_logger("routes.poster")
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+POSTER_MAX_AGE = int(os.getenv("POSTER_MAX_AGE", "86400"))
+POSTER_ACCEL_PREFIX = os.getenv("POSTER_ACCEL_PREFIX", "/internal/posters/")
+
+# Links whose poster could not be made aren't retried on every request
+failed_posters = TTLLRUCache(max_entries=4096, ttl=float(os.getenv("POSTER_RETRY_SECONDS", "600")))
+
+# Renders of evicted posters run in the API's threadpool, so only a few at a
+# time, and only one per link. Further requests get a 503 instead of queueing.
+POSTER_RENDER_CONCURRENCY = int(os.getenv("POSTER_RENDER_CONCURRENCY", "2"))
+POSTER_RETRY_AFTER = "5"
+render_slots = asyncio.Semaphore(POSTER_RENDER_CONCURRENCY)
+rendering: set[str] = set()
+
+
+def select_poster_format(format: str | None, accept: str) -> str:
+    """The requested format, else AVIF if enabled and accepted, else the first configured format."""
+    if format in POSTER_FORMATS:
+        return format
+    if "avif" in POSTER_FORMATS and "image/avif" in accept:
+        return "avif"
+    return "webp" if "webp" in POSTER_FORMATS else POSTER_FORMATS[0]
+
+
+async def render_missing_poster(preview_id: str) -> bool:
+    """
+    Renders the posters of a link that has none cached, e.g. after eviction.
+
+    Raises a 503 if the link is already being rendered or all render slots
+    are busy. The remote poster is only fetched if its host's rate limit
+    allows it right away; otherwise the poster is cut from the preview.
+    """
+    if failed_posters.get(preview_id):
+        return False
+    # Checked and taken without awaiting in between, so this can't race
+    if preview_id in rendering or render_slots.locked():
+        raise HTTPException(
+            status_code=503, detail="Poster is being rendered, try again", headers={"Retry-After": POSTER_RETRY_AFTER}
+        )
+    rendering.add(preview_id)
+    try:
+        async with render_slots:
+            return await _render_poster(preview_id)
+    finally:
+        rendering.discard(preview_id)
+
+
+async def _render_poster(preview_id: str) -> bool:
+    record = await run_db(get_link_by_preview_id, preview_id)
+    if not record:
+        logger.warning(f"Preview ID not found: {preview_id}")
+        raise HTTPException(status_code=404, detail="Preview ID not found")
+    if record["status"] != "ready":
+        raise HTTPException(status_code=404, detail="Poster not available yet")
+
+    preview_sources = []
+    if record["preview_path"]:
+        preview_sources = [
+            os.path.join(PREVIEW_DIR, f"{record['preview_path']}.poster.jpg"),
+            os.path.join(PREVIEW_DIR, f"{record['preview_path']}.mp4"),
+        ]
+    cached = await run_in_threadpool(
+        cache_poster, preview_id, record["poster_url"], DEFAULT_HEADERS, preview_sources, max_wait=0
+    )
+    if not cached:
+        failed_posters.put(preview_id, True)
+    return cached
+
+
+@router.get("/poster/{preview_id}")
+async def get_poster(
+    preview_id: str,
+    request: Request,
+    width: int | None = Query(None, ge=1),
+    format: str | None = Query(None, pattern=r"^(webp|avif)$"),
+):
+    """
+    Serves a locally cached poster thumbnail of a link.
+
+    `width` picks the smallest cached width of at least that many pixels;
+    `format` is webp or avif (by default AVIF if enabled and accepted).
+    """
+    logger.debug(f"Received poster request for preview_id: {preview_id}")
+
+    try:
+        format = select_poster_format(format, request.headers.get("accept", ""))
+        path = get_poster_path(preview_id, select_poster_width(width), format)
+        if not os.path.exists(path) and not await render_missing_poster(preview_id):
+            raise HTTPException(status_code=404, detail="No poster available")
+
+        touch_poster(path)
+        return serve_file(
+            request,
+            path,
+            MEDIA_TYPES[format],
+            f"public, max-age={POSTER_MAX_AGE}",
+            headers={"Access-Control-Allow-Origin": "*", "Vary": "Accept"},
+            accel_prefix=POSTER_ACCEL_PREFIX,
+        )
+
+    except HTTPException:
+        # Re-raise HTTP exceptions as they are already handled
+        raise
+    except FileNotFoundError:
+        # Evicted between rendering and serving
+        raise HTTPException(status_code=503, detail="Poster is being regenerated, try again")
+    except Exception as e:
+        logger.error(f"Unexpected error serving poster for preview_id {preview_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error serving poster")
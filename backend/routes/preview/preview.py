@@ -1,9 +1,13 @@
 import os
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from utils.db_utils import get_link_by_preview_id
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from pydantic import BaseModel
+from utils.async_db import run_db
+from utils.db_utils import SQL_IN_CHUNK_SIZE, get_link_by_preview_id, get_preview_summaries
+from utils.file_delivery import IMMUTABLE_CACHE_CONTROL, serve_file
 from utils.logging_config import get_logger
+from utils.preview_engine import PREVIEW_RENDITION_HEIGHTS
+from utils.query_cache import TTLLRUCache
 
 router = APIRouter()
 logger = get_logger("routes.preview")
@@ -14,64 +18,246 @@ PREVIEW_DIR = os.path.join(current_dir, "preview_videos")
 os.makedirs(PREVIEW_DIR, exist_ok=True)
 logger.info(f"Preview directory initialized: {PREVIEW_DIR}")
 
+MEDIA_TYPES = {"mp4": "video/mp4", "webm": "video/webm", "webp": "image/webp", "jpg": "image/jpeg"}
+IMAGE_SIZES = {"hover": "hover.webp", "poster": "poster.jpg"}
+SIZE_PATTERN = r"^(\d+|full|hover|poster)$"
+FORMAT_PATTERN = r"^(mp4|webm)$"
 
-@router.get("/preview/{preview_id}")
-def get_preview(preview_id: str):
+# /preview/{preview_id} URLs resolve through the database, so browsers only
+# keep them briefly; /previews/{preview_path} URLs name the content itself
+PREVIEW_MAX_AGE = int(os.getenv("PREVIEW_MAX_AGE", "300"))
+PREVIEW_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Headers": "Content-Type, Range",
+    "Access-Control-Expose-Headers": "Accept-Ranges, Content-Encoding, Content-Length, Content-Range",
+    # The response depends on Accept when no format is given
+    "Vary": "Accept",
+}
+
+# preview_id -> preview_path of ready previews, so repeated requests skip SQLite
+preview_path_cache = TTLLRUCache(
+    max_entries=int(os.getenv("PREVIEW_PATH_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PREVIEW_PATH_CACHE_TTL", "60")),
+)
+
+
+# One IN query per batch
+PREVIEW_BATCH_MAX_IDS = SQL_IN_CHUNK_SIZE
+
+
+class PreviewBatch(BaseModel):
+    preview_ids: list[str]
+
+
+def select_preview_file(preview_path: str, size: str, format: str | None, accept: str) -> tuple[str, bool] | None:
     """
-    Serves a preview video file based on its unique ID
+    Picks the file to serve for a `size` (a height such as 240, "full",
+    "hover" or "poster") and `format` ("mp4" or "webm"; without one, WebM is
+    served if the client's Accept header lists it). Video sizes fall back to
+    larger renditions and finally to the full preview when a rendition is
+    missing, e.g. for previews rendered before renditions existed. An
+    explicit `format` is never swapped for another one, so a
+    `<source type="video/webm">` gets a 404 and the browser moves on to the
+    next source instead of receiving an MP4.
+
+    Returns the path and whether it is the file that was asked for rather
+    than a fallback, or None if nothing in the requested format exists.
     """
-    logger.info(f"Received preview request for preview_id: {preview_id}")
+    if size in IMAGE_SIZES:
+        file_path = os.path.join(PREVIEW_DIR, f"{preview_path}.{IMAGE_SIZES[size]}")
+        return (file_path, True) if os.path.exists(file_path) else None
+
+    required_format = format
+    if format is None:
+        format = "webm" if "video/webm" in accept else "mp4"
+    candidates = []
+    if size != "full":
+        heights = [height for height in PREVIEW_RENDITION_HEIGHTS if height >= int(size)]
+        for height in heights:
+            if format == "webm":
+                candidates.append(f"{height}.webm")
+            if required_format != "webm":
+                candidates.append(f"{height}.mp4")
+    for index, name in enumerate(candidates):
+        file_path = os.path.join(PREVIEW_DIR, f"{preview_path}.{name}")
+        if os.path.exists(file_path):
+            return file_path, index == 0
+    if required_format == "webm":
+        # The full preview only exists as MP4
+        return None
+    return os.path.join(PREVIEW_DIR, f"{preview_path}.mp4"), not candidates
+
+
+def serve_preview_file(request: Request, file_path: str, download_name: str, cache_control: str):
+    extension = file_path.rsplit(".", 1)[1]
+    return serve_file(
+        request,
+        file_path,
+        MEDIA_TYPES[extension],
+        cache_control,
+        filename=f"{download_name}.{extension}",
+        headers=PREVIEW_HEADERS,
+    )
+
+
+async def get_ready_preview_path(preview_id: str) -> str:
+    """Looks up the preview_path of a ready preview, raising the HTTP error for any other state."""
+    record = await run_db(get_link_by_preview_id, preview_id)
+
+    if not record:
+        logger.warning(f"Preview ID not found: {preview_id}")
+        raise HTTPException(status_code=404, detail="Preview ID not found")
+
+    logger.debug(f"Found record for preview_id {preview_id} with status: {record['status']}")
+
+    if record["status"] == "queued":
+        logger.info(f"Preview is queued for processing: {preview_id}")
+        raise HTTPException(
+            status_code=202, detail="Preview is in queue to be processed"
+        )
+
+    if record["status"] == "processing":
+        logger.info(f"Preview is still being processed: {preview_id}")
+        raise HTTPException(status_code=409, detail="Preview is still being processed")
+
+    if record["status"] != "ready" or not record.get("preview_path"):
+        logger.warning(f"Preview not available or failed - status: {record['status']}, path: {record.get('preview_path')}")
+        raise HTTPException(
+            status_code=404, detail="Preview not available or failed to generate"
+        )
+    return record["preview_path"]
+
+
+@router.post("/preview/batch")
+async def get_preview_batch(batch: PreviewBatch):
+    """
+    Resolves many previews in one round trip: status, playable URLs, size,
+    duration and poster of up to PREVIEW_BATCH_MAX_IDS preview_ids. Previews
+    are returned in the order asked for; unknown ids are listed in `missing`.
+
+    `preview_url` (and the `hover_url`/`poster_frame_url` derived from it) is
+    the immutable /previews URL of a ready preview; append `?size=` for a
+    smaller rendition. Nothing is read from disk, so a URL may still 404 for
+    an image a preview doesn't have.
+    """
+    preview_ids = list(dict.fromkeys(batch.preview_ids))
+    logger.info(f"Received preview batch request for {len(preview_ids)} preview_id(s)")
+    if len(preview_ids) > PREVIEW_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {PREVIEW_BATCH_MAX_IDS} preview_ids per batch")
 
     try:
-        record = get_link_by_preview_id(preview_id)
+        records = {record["preview_id"]: record for record in await run_db(get_preview_summaries, preview_ids)}
+    except Exception as e:
+        logger.error(f"Error resolving preview batch of {len(preview_ids)} preview_id(s): {e}")
+        raise HTTPException(status_code=500, detail="Internal server error resolving previews")
 
-        if not record:
-            logger.warning(f"Preview ID not found: {preview_id}")
-            raise HTTPException(status_code=404, detail="Preview ID not found")
+    previews = []
+    for preview_id in preview_ids:
+        record = records.get(preview_id)
+        if record is None:
+            continue
+        preview_url = None
+        if record["status"] == "ready" and record["preview_path"]:
+            preview_url = f"/api/previews/{record['preview_path']}"
+            # Warms the cache for tiles that still use /preview/{preview_id}
+            preview_path_cache.put(preview_id, record["preview_path"])
+        previews.append(
+            {
+                "preview_id": preview_id,
+                "status": record["status"],
+                "stage": record["stage"],
+                "error_message": record["error_message"],
+                "title": record["title"],
+                "poster_url": record["poster_url"],
+                "preview_url": preview_url,
+                "hover_url": f"{preview_url}?size=hover" if preview_url else None,
+                "poster_frame_url": f"{preview_url}?size=poster" if preview_url else None,
+                "duration": record["duration"],
+                "preview_size": record["preview_size"],
+            }
+        )
 
-        logger.debug(f"Found record for preview_id {preview_id} with status: {record['status']}")
+    return {
+        "previews": previews,
+        "missing": [preview_id for preview_id in preview_ids if preview_id not in records],
+    }
 
-        if record["status"] == "queued":
-            logger.info(f"Preview is queued for processing: {preview_id}")
-            raise HTTPException(
-                status_code=202, detail="Preview is in queue to be processed"
-            )
 
-        if record["status"] == "processing":
-            logger.info(f"Preview is still being processed: {preview_id}")
-            raise HTTPException(status_code=409, detail="Preview is still being processed")
+@router.get("/preview/{preview_id}")
+async def get_preview(
+    preview_id: str,
+    request: Request,
+    size: str = Query("full", pattern=SIZE_PATTERN),
+    format: str | None = Query(None, pattern=FORMAT_PATTERN),
+):
+    """
+    Serves a preview video file based on its unique ID
 
-        if record["status"] != "ready" or not record.get("preview_path"):
-            logger.warning(f"Preview not available or failed - status: {record['status']}, path: {record.get('preview_path')}")
-            raise HTTPException(
-                status_code=404, detail="Preview not available or failed to generate"
-            )
+    `size` selects a smaller rendition (`240`, `480`, ...), the animated
+    `hover` image or the `poster` frame instead of the full preview.
+    """
+    logger.info(f"Received preview request for preview_id: {preview_id}")
 
-        file_path = os.path.join(PREVIEW_DIR, f"{ record["preview_path"] }.mp4")
+    try:
+        preview_path = preview_path_cache.get(preview_id)
+        cached = preview_path is not None
+        if not cached:
+            preview_path = await get_ready_preview_path(preview_id)
+
+        selected = select_preview_file(preview_path, size, format, request.headers.get("accept", ""))
+        if selected is None:
+            logger.info(f"No {size} {format or 'image'} for preview_id: {preview_id}")
+            raise HTTPException(status_code=404, detail=f"Preview has no {size} {format or 'image'}")
+        file_path, _ = selected
         logger.debug(f"Looking for preview file at: {file_path}")
 
-        if not os.path.exists(file_path):
+        try:
+            response = serve_preview_file(request, file_path, preview_id, f"public, max-age={PREVIEW_MAX_AGE}")
+        except FileNotFoundError:
+            if cached:
+                # The link may have been deleted by another process since it was cached
+                preview_path_cache.pop(preview_id)
+                return await get_preview(preview_id, request, size, format)
             logger.error(f"Preview file missing on server: {file_path}")
             raise HTTPException(
                 status_code=500, detail="Preview file is missing on the Server"
             )
 
-        logger.info(f"Serving preview file for preview_id: {preview_id}")
-        return FileResponse(
-            path=file_path,
-            media_type="video/mp4",
-            filename=f"{preview_id}.mp4",
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Headers": "Content-Type, Range",
-                "Access-Control-Expose-Headers": "Accept-Ranges, Content-Encoding, Content-Length, Content-Range",
-            },
-        )
-    
+        if not cached:
+            preview_path_cache.put(preview_id, preview_path)
+        logger.info(f"Serving {os.path.basename(file_path)} for preview_id: {preview_id}")
+        return response
+
     except HTTPException:
         # Re-raise HTTP exceptions as they are already handled
         raise
     except Exception as e:
         logger.error(f"Unexpected error serving preview for preview_id {preview_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error serving preview")
+
+
+@router.get("/previews/{preview_path}")
+async def get_preview_by_path(
+    request: Request,
+    preview_path: str = Path(pattern=r"^[A-Za-z0-9_-]+$"),
+    size: str = Query("full", pattern=SIZE_PATTERN),
+    format: str | None = Query(None, pattern=FORMAT_PATTERN),
+):
+    """
+    Serves a preview by its `preview_path` (as returned by the video lists)
+    instead of its preview_id. The path is derived from the preview's
+    content, so these URLs are cached as immutable and need no database
+    lookup. Takes the same `size` and `format` as /preview/{preview_id}.
+    """
+    selected = select_preview_file(preview_path, size, format, request.headers.get("accept", ""))
+    if selected is None:
+        raise HTTPException(status_code=404, detail=f"Preview has no {size} {format or 'image'}")
+    file_path, exact = selected
+    # A fallback is not what the URL names, so it is only cached until revalidated
+    cache_control = IMMUTABLE_CACHE_CONTROL if exact else "public, no-cache"
+    try:
+        return serve_preview_file(request, file_path, preview_path, cache_control)
+    except FileNotFoundError:
+        logger.warning(f"Preview file not found: {file_path}")
+        raise HTTPException(status_code=404, detail="Preview not found")
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from utils.async_db import run_db
+from utils.db_utils import SQL_IN_CHUNK_SIZE, get_link_statuses
+from utils.logging_config import get_logger
+from utils.status_events import status_broadcaster
+
+router = APIRouter()
+logger = get_logger("routes.status")
+
+# Comment lines keep proxies from closing idle streams
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event: dict) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/status/stream")
+async def stream_status(request: Request, preview_id: list[str] | None = Query(None)):
+    """
+    Server-Sent Events stream of processing status changes.
+
+    Pass `preview_id` (repeatable) to follow specific uploads; their current
+    status is sent first, so nothing is missed between upload and subscribe.
+    Without it, every status change is streamed.
+    """
+    if preview_id and len(preview_id) > SQL_IN_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {SQL_IN_CHUNK_SIZE} preview_id values per stream")
+
+    wanted = set(preview_id or ())
+    # Subscribe before reading the snapshot so no transition falls in between
+    queue = status_broadcaster.subscribe()
+    try:
+        snapshot = await run_db(get_link_statuses, list(wanted)) if wanted else []
+    except Exception as e:
+        status_broadcaster.unsubscribe(queue)
+        logger.error(f"Error reading statuses for status stream: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error reading statuses")
+    logger.info(f"Status stream opened for {len(wanted) or 'all'} preview_id(s)")
+
+    async def events():
+        try:
+            for record in snapshot:
+                yield format_event(record)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if not wanted or event.get("preview_id") in wanted:
+                    yield format_event(event)
+        finally:
+            status_broadcaster.unsubscribe(queue)
+            logger.debug("Status stream closed")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
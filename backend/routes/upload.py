@@ -1,19 +1,30 @@
+import json
+import os
 import uuid
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from utils.db_utils import add_link, get_link_by_url
-from utils.upload_link import process_link_task
+from utils.async_db import run_db
+from utils.db_utils import add_link, add_links_bulk, get_link_by_url
 from utils.logging_config import get_logger
+from utils.status_events import publish_status, publish_status_events, status_event
+from utils.task_dispatch import enqueue_link, enqueue_links
 
 router = APIRouter()
 logger = get_logger("routes.upload")
 
+BULK_UPLOAD_MAX_URLS = int(os.getenv("BULK_UPLOAD_MAX_URLS", "10000"))
+
 
 class LinkItem(BaseModel):
     url: str
 
 
+class BulkLinkItems(BaseModel):
+    urls: list[str]
+
+
 @router.post("/upload")
 def upload_link(link: LinkItem):
     logger.info(f"Received upload request for URL: {link.url}")
@@ -31,7 +42,9 @@ def upload_link(link: LinkItem):
         add_link(link.url, preview_id)
         logger.info(f"Successfully added link to database - preview_id: {preview_id}")
 
-        process_link_task.delay(link.url, preview_id)
+        # Published before dispatch so it can't arrive after the worker's first update
+        publish_status(preview_id, "queued")
+        enqueue_link(link.url, preview_id)
         logger.info(f"Queued processing task for preview_id: {preview_id}")
         
         return {"status": "queued", "preview_id": preview_id}
@@ -42,3 +55,104 @@ def upload_link(link: LinkItem):
     except Exception as e:
         logger.error(f"Unexpected error during upload for URL {link.url}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error during upload")
+
+
+async def _read_bulk_urls(request: Request) -> list[str]:
+    """
+    Reads the URLs of a bulk upload from either body format:
+
+    - JSON: `{"urls": [...]}` or a plain JSON array of URLs
+    - NDJSON (`Content-Type: application/x-ndjson`): one URL per line, either
+      as a JSON string, a `{"url": ...}` object or bare text. Read as a stream
+      so large imports never have to be buffered as one JSON document.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        urls: list[str] = []
+        buffer = b""
+
+        def parse_line(line: bytes):
+            line = line.strip()
+            if not line:
+                return
+            try:
+                value = json.loads(line)
+            except json.JSONDecodeError:
+                value = line.decode("utf-8", errors="replace")
+            urls.append(str(value.get("url") or "") if isinstance(value, dict) else str(value))
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                parse_line(line)
+            if len(urls) > BULK_UPLOAD_MAX_URLS:
+                break
+        parse_line(buffer)
+        return urls
+
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if isinstance(payload, list):
+        payload = {"urls": payload}
+    try:
+        return BulkLinkItems.model_validate(payload).urls
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Expected {\"urls\": [...]} or a JSON array of URLs")
+
+
+@router.post("/upload/bulk")
+async def upload_links_bulk(request: Request):
+    """
+    Queues many links at once, e.g. from a bookmark export.
+
+    Duplicates are detected in one pass, new links are inserted in a single
+    transaction and their processing tasks are dispatched together (as one
+    Celery group, or a single wake-up of the local runner).
+    Returns the preview_id of every queued link, the existing preview_id of
+    every duplicate (including repeated copies within the request, which get
+    the preview_id of their first copy) and the entries that were rejected as
+    invalid, so every submitted URL is accounted for.
+    """
+    raw_urls = await _read_bulk_urls(request)
+    logger.info(f"Received bulk upload request with {len(raw_urls)} URLs")
+
+    if len(raw_urls) > BULK_UPLOAD_MAX_URLS:
+        logger.warning(f"Bulk upload rejected - more than {BULK_UPLOAD_MAX_URLS} URLs")
+        raise HTTPException(
+            status_code=413, detail=f"At most {BULK_UPLOAD_MAX_URLS} URLs per request"
+        )
+
+    urls, invalid = [], []
+    for url in raw_urls:
+        url = url.strip()
+        if url.startswith(("http://", "https://")):
+            urls.append(url)
+        elif url:
+            invalid.append(url)
+
+    try:
+        queued, duplicates = await run_db(add_links_bulk, urls)
+
+        if queued:
+            await run_in_threadpool(
+                publish_status_events, [status_event(item["preview_id"], "queued") for item in queued]
+            )
+            await run_in_threadpool(enqueue_links, queued)
+            logger.info(f"Queued {len(queued)} processing tasks")
+
+        return {
+            "status": "queued",
+            "queued_count": len(queued),
+            "duplicate_count": len(duplicates),
+            "invalid_count": len(invalid),
+            "queued": queued,
+            "duplicates": duplicates,
+            "invalid": invalid,
+        }
+
+    except Exception as e:
+        logger.error(f"Unexpected error during bulk upload of {len(urls)} URLs: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error during bulk upload")
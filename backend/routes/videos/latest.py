@@ -1,7 +1,8 @@
-import os
+import asyncio
 
-from fastapi import APIRouter
-from utils.db_utils import count_ready_links, get_latest_ready_links
+from fastapi import APIRouter, HTTPException, Query
+from utils.async_db import run_db
+from utils.db_utils import count_ready_links, get_latest_ready_links, parse_list_fields
 from utils.logging_config import get_logger
 
 router = APIRouter()
@@ -9,25 +10,48 @@ logger = get_logger("routes.videos.latest")
 
 
 @router.get("/latest")
-def get_latest(limit: int = 10, page: int = 1):
-    logger.info(f"Received request for latest videos - limit: {limit}, page: {page}")
+async def get_latest(
+    limit: int = Query(10, ge=1, le=200),
+    page: int = Query(1, ge=1),
+    after_id: int | None = None,
+    fields: str | None = None,
+):
+    """
+    Returns the newest ready videos.
+
+    Pass the `next_after_id` of a response back as `after_id` to fetch the
+    following page via keyset pagination; `page` is still supported for
+    clients that jump to an arbitrary page number. `fields` is an optional
+    comma separated list of columns to return per video.
+    """
+    logger.info(f"Received request for latest videos - limit: {limit}, page: {page}, after_id: {after_id}")
+
+    try:
+        columns = parse_list_fields(fields)
+    except ValueError as e:
+        logger.warning(f"Rejected latest videos request - {e}")
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        total_items = count_ready_links()
+        total_items, paginated_videos = await asyncio.gather(
+            run_db(count_ready_links),
+            run_db(get_latest_ready_links, limit=limit, page=page, after_id=after_id, fields=columns),
+        )
         total_pages = (total_items + limit - 1) // limit
         logger.debug(f"Total items: {total_items}, total pages: {total_pages}")
-
-        paginated_videos = get_latest_ready_links(limit=limit, page=page)
         logger.info(f"Successfully retrieved {len(paginated_videos)} videos for page {page}")
 
+        next_after_id = paginated_videos[-1]["id"] if len(paginated_videos) == limit else None
+
         return {
             "page": page,
             "limit": limit,
             "total_pages": total_pages,
             "total_items": total_items,
+            "next_after_id": next_after_id,
             "videos": paginated_videos,
         }
-    
+
     except Exception as e:
         logger.error(f"Error retrieving latest videos - limit: {limit}, page: {page}, error: {e}")
         raise
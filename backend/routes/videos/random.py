@@ -1,5 +1,6 @@
-from fastapi import APIRouter
-from utils.db_utils import get_random_ready_links
+from fastapi import APIRouter, HTTPException, Query
+from utils.async_db import run_db
+from utils.db_utils import get_random_ready_links, get_shuffled_ready_links, parse_list_fields
 from utils.logging_config import get_logger
 
 router = APIRouter()
@@ -7,14 +8,49 @@ logger = get_logger("routes.videos.random")
 
 
 @router.get("/random")
-def get_random(limit: int = 10):
-    logger.info(f"Received request for random videos - limit: {limit}")
+async def get_random(
+    limit: int = Query(10, ge=1, le=200),
+    seed: int | None = None,
+    session: str | None = Query(None, max_length=128),
+    offset: int = Query(0, ge=0),
+    fields: str | None = None,
+):
+    """
+    Returns random ready videos.
+
+    - `seed` makes the selection reproducible.
+    - `session` switches to shuffle mode for infinite scrolling: every session
+      token walks its own shuffled order of all videos without repeats. Pass the
+      returned `next_offset` back as `offset` to continue.
+    - `fields` is an optional comma separated list of columns to return per video.
+    """
+    logger.info(f"Received request for random videos - limit: {limit}, seed: {seed}, session: {session}, offset: {offset}")
+
+    try:
+        columns = parse_list_fields(fields)
+    except ValueError as e:
+        logger.warning(f"Rejected random videos request - {e}")
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        videos = get_random_ready_links(limit)
+        if session is not None:
+            videos, total_items = await run_db(
+                get_shuffled_ready_links, session, offset, limit, fields=columns
+            )
+            next_offset = offset + limit if offset + limit < total_items else None
+            logger.info(f"Successfully retrieved {len(videos)} shuffled videos for session {session}")
+            return {
+                "session": session,
+                "offset": offset,
+                "next_offset": next_offset,
+                "total_items": total_items,
+                "videos": videos,
+            }
+
+        videos = await run_db(get_random_ready_links, limit, seed=seed, fields=columns)
         logger.info(f"Successfully retrieved {len(videos)} random videos")
         return videos
-    
+
     except Exception as e:
         logger.error(f"Error retrieving random videos - limit: {limit}, error: {e}")
         raise
@@ -1,5 +1,6 @@
-from fastapi import APIRouter
-from utils.db_utils import search_videos_by_title
+from fastapi import APIRouter, HTTPException, Query
+from utils.async_db import run_db
+from utils.db_utils import parse_list_fields, search_videos_by_title
 from utils.logging_config import get_logger
 
 router = APIRouter()
@@ -7,14 +8,40 @@ logger = get_logger("routes.videos.search")
 
 
 @router.get("/search")
-def search_videos(query: str):
-    logger.info(f"Received search request with query: '{query}'")
+async def search_videos(
+    query: str,
+    limit: int = Query(24, ge=1, le=200),
+    cursor: int = Query(0, ge=0),
+    fields: str | None = None,
+):
+    """
+    Ranked full text search over video titles.
+
+    Pass the returned `next_cursor` back as `cursor` to fetch the next page;
+    it is null once there are no more results. `fields` is an optional comma
+    separated list of columns to return per video.
+    """
+    logger.info(f"Received search request with query: '{query}', limit: {limit}, cursor: {cursor}")
+
+    try:
+        columns = parse_list_fields(fields)
+    except ValueError as e:
+        logger.warning(f"Rejected search request - {e}")
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        results = search_videos_by_title(query)
+        results, has_more = await run_db(
+            search_videos_by_title, query, limit=limit, offset=cursor, fields=columns
+        )
         logger.info(f"Search completed - found {len(results)} results for query: '{query}'")
-        return results
-    
+        return {
+            "query": query,
+            "limit": limit,
+            "cursor": cursor,
+            "next_cursor": cursor + limit if has_more else None,
+            "results": results,
+        }
+
     except Exception as e:
         logger.error(f"Error during search with query '{query}': {e}")
         raise
@@ -1,50 +1,25 @@
 import os
 import sqlite3
 
+from utils.migrations import LATEST_VERSION, apply_migrations
+
 # Define the path to the db folder
 db_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db")
 os.makedirs(db_folder, exist_ok=True)
-DATABASE_PATH = os.path.join(db_folder, "videos.db")
+DATABASE_PATH = os.getenv("SMD_DATABASE_PATH", os.path.join(db_folder, "videos.db"))
 
 
 def setup_database():
     """
-    Creates the SQLite database and creates all needed tables if they don't exist.
+    Creates the SQLite database if needed and applies all pending schema migrations.
     """
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        # SQL statement to create a table
-        # We add UNIQUE constraints to prevent duplicates at the database level
-        # and an error_message column for better debugging.
-        create_video_table_query = """
-        CREATE TABLE IF NOT EXISTS videos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT UNIQUE NOT NULL,
-            title TEXT,
-            poster_url TEXT,
-            preview_path TEXT,
-            preview_id TEXT UNIQUE NOT NULL,
-            status TEXT NOT NULL,
-            error_message TEXT
-        );
-        """
-        cursor.execute(create_video_table_query)
-
-        create_fts_table_query = """
-        CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(title, content='videos', content_rowid='id');
-        """
-        cursor.execute(create_fts_table_query)
-
-        conn.commit()
-        print("Database, 'videos' and 'videos_fts' table created successfully.")
+        applied = apply_migrations(DATABASE_PATH)
+        print(f"Database schema is at version {LATEST_VERSION} ({applied} migrations applied).")
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-    finally:
-        if conn:
-            conn.close()
+        raise
 
 
 if __name__ == "__main__":
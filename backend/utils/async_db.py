@@ -0,0 +1,53 @@
+"""
+Async access to the SQLite helpers in utils.db_utils.
+
+sqlite3 is blocking, so async routes hand their queries to a small dedicated
+thread pool instead of anyio's shared threadpool. The number of queries waiting
+for a DB thread is bounded; once the limit is reached callers wait on the event
+loop (backpressure) instead of piling up work. Each DB thread keeps its own
+pooled connection, so the executor size is also the number of open connections.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from utils.logging_config import get_logger
+
+logger = get_logger("async_db")
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+DB_EXECUTOR_MAX_PENDING = int(os.getenv("DB_EXECUTOR_MAX_PENDING", "1024"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+_pending: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+
+logger.info(
+    f"DB executor configured - workers: {DB_EXECUTOR_WORKERS}, max pending: {DB_EXECUTOR_MAX_PENDING}"
+)
+
+
+def _pending_slots() -> asyncio.Semaphore:
+    """Returns the semaphore bounding queued queries for the running event loop."""
+    global _pending
+    loop = asyncio.get_running_loop()
+    if _pending is None or _pending[0] is not loop:
+        _pending = (loop, asyncio.Semaphore(DB_EXECUTOR_MAX_PENDING))
+    return _pending[1]
+
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs a blocking database helper on the DB executor and awaits its result."""
+    async with _pending_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _executor, functools.partial(func, *args, **kwargs)
+        )
+
+
+def shutdown_db_executor():
+    """Waits for running queries to finish and stops the DB threads."""
+    _executor.shutdown(wait=True, cancel_futures=True)
+    logger.info("DB executor shut down")
@@ -0,0 +1,224 @@
+"""
+Long-lived Chromium for the Playwright fallbacks.
+
+Launching Chromium costs seconds, so each worker process starts one browser
+the first time it needs it and keeps it until the process exits. Pages come
+from a shared browser context that is replaced every BROWSER_CONTEXT_MAX_USES
+pages. The browser itself is restarted after BROWSER_MAX_USES pages, when
+the process tree grows past BROWSER_MAX_RSS_MB, or after it crashes.
+Requests for the resource types in BROWSER_BLOCKED_RESOURCES are aborted,
+because we only read the DOM.
+
+Playwright's sync API is bound to the thread that started it, so each process
+has one browser thread that owns the browser and runs page tasks one at a
+time; task threads hand their work to it with `run()`. A thread or gevent
+pool therefore still starts a single Chromium per process. The state is
+dropped after a fork, and `shutdown()` runs on worker shutdown and at exit.
+"""
+
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+from playwright.sync_api import Error as PlaywrightError
+from playwright.sync_api import sync_playwright
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.browser_pool")
+
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "200"))
+BROWSER_CONTEXT_MAX_USES = int(os.getenv("BROWSER_CONTEXT_MAX_USES", "20"))
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1024"))
+# How long shutdown() waits for the running page task to finish
+BROWSER_SHUTDOWN_TIMEOUT = 30
+BROWSER_BLOCKED_RESOURCES = frozenset(
+    resource.strip()
+    for resource in os.getenv("BROWSER_BLOCKED_RESOURCES", "image,font").split(",")
+    if resource.strip()
+)
+
+
+def _descendant_rss_bytes() -> int | None:
+    """Resident memory of all processes below this one (driver + Chromium), Linux only."""
+    try:
+        children: dict[int, list[int]] = {}
+        rss_pages: dict[int, int] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # The command name may contain spaces, so split after its closing parenthesis
+            fields = stat[stat.rfind(")") + 2 :].split()
+            pid = int(entry)
+            children.setdefault(int(fields[1]), []).append(pid)
+            rss_pages[pid] = int(fields[21])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    total, stack = 0, list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class _BrowserState:
+    def __init__(self):
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.browser_uses = 0
+        self.context_uses = 0
+
+
+T = TypeVar("T")
+
+
+class BrowserPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._tasks: queue.Queue | None = None
+
+    def _task_queue(self) -> queue.Queue:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Never touch a browser or thread inherited from the parent process
+                self._pid = os.getpid()
+                self._tasks = queue.Queue()
+                threading.Thread(
+                    target=self._serve, args=(self._tasks, _BrowserState()), name="browser-pool", daemon=True
+                ).start()
+            return self._tasks
+
+    def _serve(self, tasks: queue.Queue, state: _BrowserState):
+        """The browser thread: runs page tasks until it gets None."""
+        while True:
+            task, future = tasks.get()
+            if task is None:
+                self._stop(state)
+                future.set_result(None)
+                # Tasks queued behind the shutdown would otherwise wait forever
+                while not tasks.empty():
+                    _, pending = tasks.get_nowait()
+                    if pending.set_running_or_notify_cancel():
+                        pending.set_exception(RuntimeError("The browser pool was shut down"))
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self._page(state) as page:
+                    future.set_result(task(page))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _block_resources(self, route):
+        if route.request.resource_type in BROWSER_BLOCKED_RESOURCES:
+            route.abort()
+        else:
+            route.continue_()
+
+    def _needs_restart(self, state: _BrowserState) -> bool:
+        if state.browser is None or not state.browser.is_connected():
+            return True
+        if state.browser_uses >= BROWSER_MAX_USES:
+            logger.info(f"Restarting browser after {state.browser_uses} pages")
+            return True
+        rss = _descendant_rss_bytes()
+        if rss is not None and rss > BROWSER_MAX_RSS_MB * 1024 * 1024:
+            logger.info(f"Restarting browser using {rss / (1024 * 1024):.0f} MB")
+            return True
+        return False
+
+    def _get_context(self, state: _BrowserState):
+        if self._needs_restart(state):
+            self._close(state)
+            if state.playwright is None:
+                state.playwright = sync_playwright().start()
+            state.browser = state.playwright.chromium.launch(headless=True)
+            state.browser_uses = 0
+            logger.info("Launched Chromium for Playwright fallbacks")
+
+        if state.context is None or state.context_uses >= BROWSER_CONTEXT_MAX_USES:
+            if state.context is not None:
+                state.context.close()
+            state.context = state.browser.new_context()
+            if BROWSER_BLOCKED_RESOURCES:
+                state.context.route("**/*", self._block_resources)
+            state.context_uses = 0
+        return state.context
+
+    @contextmanager
+    def _page(self, state: _BrowserState):
+        """Yields a fresh page from the pooled browser and closes it afterwards."""
+        context = self._get_context(state)
+        state.browser_uses += 1
+        state.context_uses += 1
+        page = context.new_page()
+        try:
+            yield page
+        except PlaywrightError:
+            # The browser may have crashed; start over on the next call
+            if not state.browser.is_connected():
+                self._close(state)
+            raise
+        finally:
+            if not page.is_closed():
+                try:
+                    page.close()
+                except PlaywrightError:
+                    pass
+
+    def run(self, task: Callable[..., T]) -> T:
+        """
+        Calls `task` with a fresh page on the browser thread and returns its
+        result or raises its exception. Blocks while other tasks run.
+        """
+        future = Future()
+        self._task_queue().put((task, future))
+        return future.result()
+
+    def _close(self, state: _BrowserState):
+        for closeable in (state.context, state.browser):
+            if closeable is not None:
+                try:
+                    closeable.close()
+                except PlaywrightError:
+                    pass
+        state.context = state.browser = None
+
+    def _stop(self, state: _BrowserState):
+        started = state.playwright is not None
+        self._close(state)
+        if started:
+            state.playwright.stop()
+            state.playwright = None
+            logger.info("Closed pooled Chromium")
+
+    def shutdown(self):
+        """Closes this process' browser and stops its Playwright driver and browser thread."""
+        with self._lock:
+            tasks = self._tasks if self._pid == os.getpid() else None
+            self._pid = self._tasks = None
+        if tasks is None:
+            return
+        future = Future()
+        tasks.put((None, future))
+        try:
+            future.result(timeout=BROWSER_SHUTDOWN_TIMEOUT)
+        except TimeoutError:
+            logger.warning(f"Pooled Chromium did not close within {BROWSER_SHUTDOWN_TIMEOUT}s")
+
+
+browser_pool = BrowserPool()
+# Thread and solo pools have no worker_process_shutdown, and a plain script has no signals at all
+atexit.register(browser_pool.shutdown)
@@ -0,0 +1,69 @@
+"""
+URL canonicalization for duplicate detection.
+
+Two uploads are the same link if their canonical forms match. The scheme is
+dropped (http and https count as one). The host is lowercased without
+`www.` and a default port. The fragment and tracking parameters (utm_*,
+fbclid, ...) are removed, the remaining query parameters are sorted, and a
+trailing slash is stripped. The canonical form is only used as a lookup key
+(videos.canonical_url); links are always fetched by the URL that was
+uploaded.
+
+SMD_TRACKING_PARAMS adds more parameter names to drop (comma separated).
+"""
+
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "ref",
+        "ref_src",
+        "ref_url",
+        "si",
+        "_ga",
+        "_gl",
+    }
+    | {param.strip().lower() for param in os.getenv("SMD_TRACKING_PARAMS", "").split(",") if param.strip()}
+)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def canonicalize_url(url: str) -> str:
+    """Returns the canonical form of `url`, e.g. `example.com/watch?v=1` for
+    `https://www.Example.com/watch/?utm_source=x&v=1#t=5`."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{port}"
+
+    path = parts.path.rstrip("/")
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not is_tracking_param(name)
+        )
+    )
+    return f"{host}{path}" + (f"?{query}" if query else "")
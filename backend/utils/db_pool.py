@@ -0,0 +1,175 @@
+"""
+SQLite connection management for the backend.
+
+Connections are kept open per thread (and per process, so Celery's prefork
+workers never inherit a connection from their parent) and are configured once
+with WAL journaling and tuned pragmas instead of paying the connect/PRAGMA cost
+on every query. Statement preparation is cached by sqlite3 per connection, so
+keeping connections alive also gives us prepared-statement reuse for free.
+
+A thread's connection is closed once the thread is gone, so short-lived
+threads (download segments, lease heartbeats) don't pile up connections and
+file descriptors in long-running workers.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+from utils.logging_config import get_logger
+
+logger = get_logger("db_pool")
+
+# Tunables, overridable through the environment for production boxes.
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "20000"))  # ~20MB page cache
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 256MB
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is safe with WAL
+CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+
+
+def _close_quietly(conn: sqlite3.Connection):
+    try:
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Error while closing pooled connection: {e}")
+
+
+class _ThreadConnection:
+    """
+    Holds a thread's connection in its thread-local storage. The storage is
+    dropped when the thread exits, and the connection is closed with it.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._finalizer = weakref.finalize(self, _close_quietly, conn)
+
+    def close(self):
+        self._finalizer()
+
+
+class ConnectionManager:
+    """
+    Hands out one long-lived, pre-configured connection per thread.
+
+    Connections run in autocommit mode; writes go through `transaction()`, which
+    takes the write lock up front with BEGIN IMMEDIATE so concurrent writers
+    queue on busy_timeout instead of failing with "database is locked" when a
+    deferred transaction tries to upgrade its lock.
+    """
+
+    def __init__(self, database_path: str, make_row_factory=None):
+        """
+        `make_row_factory` is called once per new connection and must return the
+        row factory for it, so factories may keep per-connection state.
+        """
+        self.database_path = database_path
+        self.make_row_factory = make_row_factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Only weakly held, so an exited thread's connection can be closed
+        self._connections: weakref.WeakSet[_ThreadConnection] = weakref.WeakSet()
+        self._pid = os.getpid()
+        self._wal_enabled = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        if not self._wal_enabled:
+            # journal_mode is persistent in the database file, so this only has
+            # to succeed once per process.
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            self._wal_enabled = mode.lower() == "wal"
+            logger.info(f"SQLite journal mode: {mode}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if self.make_row_factory is not None:
+            conn.row_factory = self.make_row_factory()
+        return conn
+
+    def _reset_after_fork(self):
+        """Drops connections inherited from a parent process; they must not be reused."""
+        with self._lock:
+            # Detached, not closed: the parent process still uses them
+            for holder in self._connections:
+                holder._finalizer.detach()
+            self._local = threading.local()
+            self._connections = weakref.WeakSet()
+            self._pid = os.getpid()
+        logger.debug(f"Connection pool reset after fork in process {self._pid}")
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use."""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            try:
+                conn = self._connect()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to establish database connection: {e}")
+                raise
+            holder = _ThreadConnection(conn)
+            self._local.holder = holder
+            with self._lock:
+                self._connections.add(holder)
+            logger.debug(
+                f"Opened pooled connection for thread {threading.current_thread().name}"
+            )
+        return holder.conn
+
+    def close_thread_connection(self):
+        """Closes the calling thread's connection, if it has one; the next query opens a new one."""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            return
+        self._local.holder = None
+        with self._lock:
+            self._connections.discard(holder)
+        holder.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed block in a single write transaction.
+
+        Nested uses join the outer transaction, so helpers can be composed
+        without committing halfway through.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def close_all(self):
+        """Closes every connection opened by this process."""
+        with self._lock:
+            holders, self._connections = list(self._connections), weakref.WeakSet()
+            self._local = threading.local()
+        if self._pid != os.getpid():
+            return
+        for holder in holders:
+            holder.close()
+        logger.info(f"Closed {len(holders)} pooled database connections")
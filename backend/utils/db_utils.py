@@ -1,6 +1,14 @@
+import html
 import os
+import re
 import sqlite3
+import time
+import uuid
+from utils.canonical_url import canonicalize_url
+from utils.db_pool import ConnectionManager
 from utils.logging_config import get_logger
+from utils.query_cache import GenerationLRUCache
+from utils.sampling import ReadyIdSampler
 
 # Initialize logger for database operations
 logger = get_logger("db_utils")
@@ -10,30 +18,52 @@ logger = get_logger("db_utils")
 current_dir = os.path.dirname(os.path.abspath(__file__))  # utils/
 parent_dir = os.path.dirname(current_dir)  # backend/
 DB_FOLDER = os.path.join(parent_dir, "db")
-DATABASE_PATH = os.path.join(DB_FOLDER, "videos.db")
+# SMD_DATABASE_PATH lets benchmarks and throwaway instances point at another file
+DATABASE_PATH = os.getenv("SMD_DATABASE_PATH", os.path.join(DB_FOLDER, "videos.db"))
 
 logger.info(f"Database path configured: {DATABASE_PATH}")
 
 
-def dict_factory(cursor, row):
+class DictRowFactory:
     """
-    Helper function to return database rows as dictionaries.
+    Row factory that returns database rows as dictionaries.
     This makes transitioning from TinyDB much easier as the data structure is the same.
+
+    The field names are only rebuilt when the cursor's description changes (once
+    per query) instead of for every row. Each connection gets its own instance.
     """
-    fields = [column[0] for column in cursor.description]
-    return {key: value for key, value in zip(fields, row)}
+
+    __slots__ = ("_description", "_fields")
+
+    def __init__(self):
+        self._description = None
+        self._fields: tuple[str, ...] = ()
+
+    def __call__(self, cursor, row):
+        description = cursor.description
+        if description is not self._description:
+            self._fields = tuple(column[0] for column in description)
+            self._description = description
+        return dict(zip(self._fields, row))
+
+
+# One long-lived connection per thread/process instead of one per call
+pool = ConnectionManager(DATABASE_PATH, make_row_factory=DictRowFactory)
 
 
 def get_db_connection():
-    """Creates and returns a database connection."""
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = dict_factory  # Return rows as dicts
-        logger.debug("Database connection established successfully")
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f"Failed to establish database connection: {e}")
-        raise
+    """Returns the calling thread's pooled database connection."""
+    return pool.connection()
+
+
+def close_db_connections():
+    """Closes all pooled connections of this process (used on shutdown)."""
+    pool.close_all()
+
+
+def close_thread_db_connection():
+    """Closes the calling thread's pooled connection, e.g. before a helper thread exits."""
+    pool.close_thread_connection()
 
 
 # --- Database Functions ---
@@ -42,30 +72,85 @@ def get_db_connection():
 def add_link(url: str, preview_id: str):
     """Inserts a new link into the database with a 'queued' status."""
     logger.info(f"Adding new link to database - URL: {url}, Preview ID: {preview_id}")
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO videos (url, preview_id, status) VALUES (?, ?, ?)",
-            (url, preview_id, "queued"),
-        )
-        conn.commit()
+        with pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO videos (url, canonical_url, preview_id, status, created_at) VALUES (?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))",
+                (url, canonicalize_url(url), preview_id, "queued"),
+            )
         logger.info(f"Successfully added link to database - Preview ID: {preview_id}")
     except sqlite3.Error as e:
         logger.error(f"Failed to add link to database - URL: {url}, Error: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
+
+
+# Stay well below SQLite's limit on bound parameters per statement
+SQL_IN_CHUNK_SIZE = 500
+
+
+def add_links_bulk(urls: list[str]):
+    """
+    Inserts many links with a 'queued' status in a single transaction.
+
+    Duplicates, both within `urls` and against the database, are detected by
+    canonical URL with a few chunked IN queries instead of one lookup per URL;
+    of several variants of one URL in `urls`, the first is kept and every
+    later copy is reported as a duplicate of it. Returns a tuple of (queued,
+    duplicates), each a list of {"url", "preview_id"} dicts in input order, so
+    that every entry of `urls` is in exactly one of them.
+    """
+    canonical_by_input = [canonicalize_url(url) for url in urls]
+    # canonical url -> first uploaded variant
+    unique_urls: dict[str, str] = {}
+    for url, canonical_url in zip(urls, canonical_by_input):
+        unique_urls.setdefault(canonical_url, url)
+    logger.info(f"Adding {len(unique_urls)} links to database in bulk ({len(urls) - len(unique_urls)} repeated in request)")
+    try:
+        with pool.transaction() as conn:
+            canonical_urls = list(unique_urls)
+            existing: dict[str, str] = {}
+            for start in range(0, len(canonical_urls), SQL_IN_CHUNK_SIZE):
+                chunk = canonical_urls[start : start + SQL_IN_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                for row in conn.execute(
+                    f"SELECT canonical_url, preview_id FROM videos WHERE canonical_url IN ({placeholders})", chunk
+                ):
+                    existing[row["canonical_url"]] = row["preview_id"]
+
+            queued = [
+                {"url": url, "preview_id": str(uuid.uuid4())}
+                for canonical_url, url in unique_urls.items()
+                if canonical_url not in existing
+            ]
+            # The write lock is held since the lookup, so OR IGNORE is only a safety net
+            conn.executemany(
+                "INSERT OR IGNORE INTO videos (url, canonical_url, preview_id, status, created_at) VALUES (?, ?, ?, 'queued', CAST(strftime('%s', 'now') AS INTEGER))",
+                [(item["url"], canonicalize_url(item["url"]), item["preview_id"]) for item in queued],
+            )
+
+        preview_ids = {**{canonicalize_url(item["url"]): item["preview_id"] for item in queued}, **existing}
+        duplicates = []
+        seen: set[str] = set()
+        for url, canonical_url in zip(urls, canonical_by_input):
+            if canonical_url not in existing and canonical_url not in seen:
+                # The first copy of a new link, which is the one that was queued
+                seen.add(canonical_url)
+                continue
+            duplicates.append({"url": url, "preview_id": preview_ids[canonical_url]})
+        logger.info(f"Bulk insert completed - queued: {len(queued)}, duplicates: {len(duplicates)}")
+        return queued, duplicates
+    except sqlite3.Error as e:
+        logger.error(f"Failed to add links to database in bulk: {e}")
+        raise
 
 
 def get_link_by_url(url: str):
-    """Fetches a single record by its URL."""
+    """Fetches a single record by its URL, or any variant with the same canonical URL."""
     logger.debug(f"Querying database for URL: {url}")
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM videos WHERE url = ?", (url,))
+        cursor.execute("SELECT * FROM videos WHERE canonical_url = ? LIMIT 1", (canonicalize_url(url),))
         result = cursor.fetchone()
         if result:
             logger.debug(f"Found existing record for URL: {url}")
@@ -75,9 +160,6 @@ def get_link_by_url(url: str):
     except sqlite3.Error as e:
         logger.error(f"Database error while querying URL {url}: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
 def get_link_by_preview_id(preview_id: str):
@@ -96,51 +178,180 @@ def get_link_by_preview_id(preview_id: str):
     except sqlite3.Error as e:
         logger.error(f"Database error while querying preview_id {preview_id}: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
+
+
+def get_link_statuses(preview_ids: list[str]) -> list[dict]:
+    """Returns the processing status of each known preview_id."""
+    conn = get_db_connection()
+    try:
+        results = []
+        for start in range(0, len(preview_ids), SQL_IN_CHUNK_SIZE):
+            chunk = preview_ids[start : start + SQL_IN_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            results.extend(
+                conn.execute(
+                    f"SELECT preview_id, status, stage, error_message, attempts FROM videos WHERE preview_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            )
+        return results
+    except sqlite3.Error as e:
+        logger.error(f"Database error while reading statuses of {len(preview_ids)} links: {e}")
+        raise
+
+
+def get_preview_summaries(preview_ids: list[str]) -> list[dict]:
+    """Returns what a client needs to render each known preview_id, in one query per SQL_IN_CHUNK_SIZE ids."""
+    conn = get_db_connection()
+    try:
+        results = []
+        for start in range(0, len(preview_ids), SQL_IN_CHUNK_SIZE):
+            chunk = preview_ids[start : start + SQL_IN_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            results.extend(
+                conn.execute(
+                    "SELECT preview_id, status, stage, error_message, title, poster_url, preview_path, duration, preview_size "
+                    f"FROM videos WHERE preview_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            )
+        return results
+    except sqlite3.Error as e:
+        logger.error(f"Database error while reading previews of {len(preview_ids)} links: {e}")
+        raise
+
+
+def mark_link_processing(preview_id: str, lease_seconds: int) -> int | None:
+    """
+    Moves a queued link to 'processing' once a worker picks it up, starting a
+    new attempt that holds a lease for `lease_seconds`.
+
+    Returns the attempt number, or None if the link is no longer queued
+    (another worker already took it, or it was deleted).
+    """
+    logger.debug(f"Marking preview_id {preview_id} as processing")
+    try:
+        with pool.transaction() as conn:
+            row = conn.execute(
+                """
+                UPDATE videos
+                SET status = 'processing', stage = 'fetch', attempts = attempts + 1,
+                    lease_expires_at = CAST(strftime('%s','now') AS INTEGER) + ?,
+                    heartbeat_at = CAST(strftime('%s','now') AS INTEGER), next_attempt_at = NULL
+                WHERE preview_id = ? AND status = 'queued'
+                RETURNING attempts
+                """,
+                (lease_seconds, preview_id),
+            ).fetchone()
+        return row["attempts"] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error in mark_link_processing for preview_id {preview_id}: {e}")
+        raise
+
+
+def claim_queued_links(runner_id: str, limit: int, lease_seconds: int) -> list[dict]:
+    """
+    Atomically moves up to `limit` of the oldest queued links that are due to
+    'processing' for the local task runner `runner_id`, starting a new attempt
+    for each. Returns their url, preview_id and attempt number (`attempts`).
+    """
+    try:
+        with pool.transaction() as conn:
+            return conn.execute(
+                """
+                UPDATE videos
+                SET status = 'processing', stage = 'fetch', claimed_by = ?,
+                    claimed_at = CAST(strftime('%s','now') AS INTEGER),
+                    attempts = attempts + 1,
+                    lease_expires_at = CAST(strftime('%s','now') AS INTEGER) + ?,
+                    heartbeat_at = CAST(strftime('%s','now') AS INTEGER), next_attempt_at = NULL
+                WHERE id IN (
+                    SELECT id FROM videos
+                    WHERE status = 'queued'
+                      AND COALESCE(next_attempt_at, 0) <= CAST(strftime('%s','now') AS INTEGER)
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING url, preview_id, attempts
+                """,
+                (runner_id, lease_seconds, limit),
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while claiming queued links for runner {runner_id}: {e}")
+        raise
+
+
+def requeue_orphaned_links(hostname: str, is_alive) -> int:
+    """
+    Puts links back in the queue that were claimed by a local runner on
+    `hostname` whose process no longer exists (`is_alive(pid)` is False).
+    Returns the number of links requeued.
+    """
+    try:
+        with pool.transaction() as conn:
+            runners = conn.execute(
+                "SELECT DISTINCT claimed_by FROM videos WHERE status = 'processing' AND claimed_by LIKE ?",
+                (f"{hostname}:%",),
+            ).fetchall()
+            dead = [
+                row["claimed_by"]
+                for row in runners
+                if not is_alive(int(row["claimed_by"].rpartition(":")[2]))
+            ]
+            if not dead:
+                return 0
+            placeholders = ",".join("?" * len(dead))
+            cursor = conn.execute(
+                f"""
+                UPDATE videos SET status = 'queued', stage = NULL, claimed_by = NULL, claimed_at = NULL
+                WHERE status = 'processing' AND claimed_by IN ({placeholders})
+                """,
+                dead,
+            )
+        logger.info(f"Requeued {cursor.rowcount} links claimed by dead runners: {', '.join(dead)}")
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"Database error while requeuing orphaned links: {e}")
+        raise
 
 
 def update_link_to_ready(
-    preview_id: str, title: str, poster_url: str | None, preview_path: str | None
+    preview_id: str,
+    attempt: int,
+    title: str,
+    poster_url: str | None,
+    preview_path: str | None,
+    duration: float | None = None,
+    source_size: int | None = None,
+    preview_size: int | None = None,
+    content_hash: str | None = None,
 ):
-    """Updates a link's status to 'ready' and populates its data."""
+    """
+    Updates a link's status to 'ready' and populates its data. Returns False,
+    and changes nothing, if attempt `attempt` is no longer the link's current
+    one (it was reaped or retried meanwhile, or the link was deleted).
+    """
     logger.info(f"Starting update_link_to_ready for preview_id: {preview_id}")
     logger.debug(f"Received data - Title: '{title}', Poster URL: {poster_url}, Preview Path: {preview_path}")
+    logger.debug(f"Media info - Duration: {duration}, Source size: {source_size}, Preview size: {preview_size}")
 
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE videos 
-            SET status = 'ready', title = ?, poster_url = ?, preview_path = ?
-            WHERE preview_id = ?
-            """,
-            (title, poster_url, preview_path, preview_id),
-        )
-        conn.commit()
+        # videos_fts is kept in sync with the new title by triggers on the videos table
+        with pool.transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE videos 
+                SET status = 'ready', title = ?, poster_url = ?, preview_path = ?,
+                    duration = ?, source_size = ?, preview_size = ?, content_hash = ?,
+                    stage = NULL, source_path = NULL, lease_expires_at = NULL
+                WHERE preview_id = ? AND attempts = ? AND status = 'processing'
+                """,
+                (title, poster_url, preview_path, duration, source_size, preview_size, content_hash, preview_id, attempt),
+            )
+        if cursor.rowcount != 1:
+            logger.warning(f"Attempt {attempt} for preview_id {preview_id} is no longer current, not marking it ready")
+            return False
         logger.info(f"Successfully updated video status to 'ready' for preview_id: {preview_id}")
-
-        cursor.execute("SELECT id from videos WHERE preview_id = ?", (preview_id,))
-        result = cursor.fetchone()
-        logger.debug(f"Fetched video record from DB. Result: {result}")
-
-        if result and title:
-            video_id = result["id"]
-            logger.debug(f"Updating FTS for video_id: {video_id} with title: '{title}'")
-            try:
-                cursor.execute(
-                    "REPLACE INTO videos_fts(rowid, title) VALUES(?, ?)",
-                    (video_id, title),
-                )
-                conn.commit()
-                logger.info(f"Successfully updated videos_fts table for video_id: {video_id}")
-            except sqlite3.Error as e:
-                logger.error(f"Failed to update FTS table for video_id {video_id}: {e}")
-                raise
-        else:
-            logger.warning(f"Skipping FTS update - result: {result}, title: '{title}'")
+        return True
 
     except sqlite3.Error as e:
         logger.error(f"Database error in update_link_to_ready for preview_id {preview_id}: {e}")
@@ -149,140 +360,576 @@ def update_link_to_ready(
         logger.error(f"Unexpected error in update_link_to_ready for preview_id {preview_id}: {e}")
         raise
     finally:
-        conn.close()
-        logger.debug("Database connection closed")
         logger.info(f"Completed update_link_to_ready for preview_id: {preview_id}")
 
 
-def update_link_to_failed(preview_id: str, error_msg: str):
-    """Updates a link's status to 'failed' and records the error."""
-    logger.warning(f"Updating link to failed status - preview_id: {preview_id}, error: {error_msg}")
+STAGE_FIELDS = frozenset({"title", "poster_url", "source_url", "source_path", "source_size", "content_hash"})
+
+
+def update_link_stage(preview_id: str, stage: str, lease_seconds: int | None = None, **fields):
+    """
+    Records that a link moved on to pipeline `stage`, together with any
+    intermediate results (see STAGE_FIELDS) the next stage will need.
+
+    `lease_seconds` replaces the job's lease, covering the wait for the
+    worker that runs the next stage.
+    """
+    unknown = set(fields) - STAGE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown stage fields: {', '.join(sorted(unknown))}")
+
+    assignments = "".join(f", {name} = ?" for name in fields)
+    params = list(fields.values())
+    if lease_seconds is not None:
+        assignments += ", lease_expires_at = CAST(strftime('%s','now') AS INTEGER) + ?"
+        params.append(lease_seconds)
+    logger.debug(f"Moving preview_id {preview_id} to stage '{stage}'")
+    try:
+        with pool.transaction() as conn:
+            conn.execute(
+                f"UPDATE videos SET stage = ?{assignments} WHERE preview_id = ?",
+                (stage, *params, preview_id),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Database error in update_link_stage for preview_id {preview_id}: {e}")
+        raise
+
+
+def find_reusable_preview(source_url: str | None = None, content_hash: str | None = None):
+    """
+    Returns preview_path, duration, source_size, preview_size and content_hash
+    of a ready link with the same video source or content, or None.
+    """
+    if content_hash is not None:
+        column, value = "content_hash", content_hash
+    elif source_url is not None:
+        column, value = "source_url", source_url
+    else:
+        return None
     conn = get_db_connection()
     try:
-        conn.execute(
-            "UPDATE videos SET status = 'failed', error_message = ? WHERE preview_id = ?",
-            (error_msg, preview_id),
-        )
-        conn.commit()
+        return conn.execute(
+            f"""
+            SELECT preview_path, duration, source_size, preview_size, content_hash FROM videos
+            WHERE {column} = ? AND status = 'ready' AND preview_path IS NOT NULL
+            LIMIT 1
+            """,
+            (value,),
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while looking up a reusable preview by {column}: {e}")
+        raise
+
+
+def update_link_to_failed(preview_id: str, attempt: int | None, error_msg: str) -> bool:
+    """
+    Updates a link's status to 'failed' and records the error. Returns False,
+    and changes nothing, if attempt `attempt` is no longer the link's current
+    one. Without an attempt (it failed before starting one), only a queued or
+    processing link is marked.
+    """
+    logger.warning(f"Updating link to failed status - preview_id: {preview_id}, error: {error_msg}")
+    if attempt is not None:
+        condition, params = "attempts = ? AND status = 'processing'", (attempt,)
+    else:
+        condition, params = "status IN ('queued', 'processing')", ()
+    try:
+        with pool.transaction() as conn:
+            cursor = conn.execute(
+                f"""
+                UPDATE videos SET status = 'failed', error_message = ?, lease_expires_at = NULL
+                WHERE preview_id = ? AND {condition}
+                """,
+                (error_msg, preview_id, *params),
+            )
+        if cursor.rowcount != 1:
+            logger.warning(f"Attempt {attempt} for preview_id {preview_id} is no longer current, not marking it failed")
+            return False
         logger.info(f"Successfully updated link to failed status for preview_id: {preview_id}")
+        return True
     except sqlite3.Error as e:
         logger.error(f"Failed to update link to failed status for preview_id {preview_id}: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
-def get_random_ready_links(limit: int):
-    """Fetches a given number of random links that are ready."""
-    logger.debug(f"Fetching {limit} random ready links")
+def renew_job_lease(preview_id: str, attempt: int, lease_seconds: int, stage: str | None = None) -> bool:
+    """
+    Extends the lease of attempt `attempt` by `lease_seconds` from now, if
+    that attempt is still the link's current one (and at `stage`, if given).
+    Returns False otherwise.
+    """
+    stage_filter = " AND stage = ?" if stage is not None else ""
+    try:
+        with pool.transaction() as conn:
+            cursor = conn.execute(
+                f"""
+                UPDATE videos
+                SET lease_expires_at = CAST(strftime('%s','now') AS INTEGER) + ?,
+                    heartbeat_at = CAST(strftime('%s','now') AS INTEGER)
+                WHERE preview_id = ? AND attempts = ? AND status = 'processing'{stage_filter}
+                """,
+                (lease_seconds, preview_id, attempt, *((stage,) if stage is not None else ())),
+            )
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        logger.error(f"Database error while renewing lease for preview_id {preview_id}: {e}")
+        raise
+
+
+def schedule_link_retry(preview_id: str, attempt: int, error_msg: str, delay: float) -> bool:
+    """
+    Puts a link whose attempt `attempt` failed back in the queue, due in
+    `delay` seconds. Returns False if that attempt was no longer current.
+    """
+    logger.info(f"Scheduling retry for preview_id {preview_id} in {delay:.0f}s after attempt {attempt}")
+    try:
+        with pool.transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE videos
+                SET status = 'queued', stage = NULL, error_message = ?,
+                    claimed_by = NULL, claimed_at = NULL, heartbeat_at = NULL,
+                    next_attempt_at = CAST(strftime('%s','now') AS INTEGER) + ?,
+                    lease_expires_at = NULL
+                WHERE preview_id = ? AND attempts = ? AND status = 'processing'
+                """,
+                (error_msg, int(delay), preview_id, attempt),
+            )
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        logger.error(f"Database error while scheduling retry for preview_id {preview_id}: {e}")
+        raise
+
+
+def requeue_expired_links(max_attempts: int) -> tuple[list[dict], list[dict]]:
+    """
+    Finds processing links whose lease has run out. Queued links are left
+    alone: their task message is still waiting in the broker, and sending
+    another one would only pile up duplicates behind a long backlog.
+
+    Links with attempts left are queued again; the others are marked 'failed'.
+    Returns (requeued, failed) lists of dicts with url and preview_id (and
+    error_message for the failed ones).
+    """
+    now = int(time.time())
+    try:
+        with pool.transaction() as conn:
+            expired = conn.execute(
+                """
+                SELECT url, preview_id, attempts FROM videos
+                WHERE status = 'processing' AND COALESCE(lease_expires_at, 0) < ?
+                """,
+                (now,),
+            ).fetchall()
+            if not expired:
+                return [], []
+
+            requeued, failed = [], []
+            for row in expired:
+                item = {"url": row["url"], "preview_id": row["preview_id"]}
+                if row["attempts"] >= max_attempts:
+                    item["error_message"] = f"Job lease expired after {row['attempts']} attempts"
+                    failed.append(item)
+                else:
+                    requeued.append(item)
+
+            if requeued:
+                conn.executemany(
+                    """
+                    UPDATE videos
+                    SET status = 'queued', stage = NULL, claimed_by = NULL, claimed_at = NULL,
+                        heartbeat_at = NULL, next_attempt_at = NULL, lease_expires_at = NULL
+                    WHERE preview_id = ?
+                    """,
+                    [(item["preview_id"],) for item in requeued],
+                )
+            if failed:
+                conn.executemany(
+                    "UPDATE videos SET status = 'failed', error_message = ?, lease_expires_at = NULL WHERE preview_id = ?",
+                    [(item["error_message"], item["preview_id"]) for item in failed],
+                )
+        return requeued, failed
+    except sqlite3.Error as e:
+        logger.error(f"Database error while requeuing expired links: {e}")
+        raise
+
+
+# --- Host Limits ---
+# Shared state of utils/host_limits.py. Times are unix seconds as floats.
+
+
+def take_host_token(host: str, rate: float, burst: float, now: float) -> float:
+    """
+    Takes one token from `host`'s bucket, refilled at `rate` per second up to
+    `burst`. Returns 0 if a token was taken, otherwise the seconds until one
+    is available (and takes nothing).
+    """
+    try:
+        with pool.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM host_buckets WHERE host = ?", (host,)).fetchone()
+            tokens = burst if row is None else min(burst, row["tokens"] + (now - row["updated_at"]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                """
+                INSERT INTO host_buckets (host, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(host) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                """,
+                (host, tokens, now),
+            )
+        return wait
+    except sqlite3.Error as e:
+        logger.error(f"Database error while taking a request token for {host}: {e}")
+        raise
+
+
+def set_host_tokens(host: str, tokens: float, now: float):
+    """Overwrites `host`'s token balance; a negative balance pauses requests until it refills."""
+    try:
+        with pool.transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO host_buckets (host, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(host) DO UPDATE SET tokens = MIN(tokens, excluded.tokens), updated_at = excluded.updated_at
+                """,
+                (host, tokens, now),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Database error while throttling {host}: {e}")
+        raise
+
+
+def try_acquire_host_slot(host: str, holder: str, max_slots: int, expires_at: float) -> bool:
+    """Takes one of `host`'s `max_slots` download slots for `holder` unless all are held."""
+    try:
+        with pool.transaction() as conn:
+            conn.execute("DELETE FROM host_slots WHERE host = ? AND expires_at < ?", (host, time.time()))
+            held = conn.execute("SELECT COUNT(*) AS count FROM host_slots WHERE host = ?", (host,)).fetchone()
+            if held["count"] >= max_slots:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO host_slots (host, holder, expires_at) VALUES (?, ?, ?)",
+                (host, holder, expires_at),
+            )
+            return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while acquiring a download slot for {host}: {e}")
+        raise
+
+
+def renew_host_slot(host: str, holder: str, expires_at: float):
+    try:
+        with pool.transaction() as conn:
+            conn.execute(
+                "UPDATE host_slots SET expires_at = ? WHERE host = ? AND holder = ?",
+                (expires_at, host, holder),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Database error while renewing a download slot for {host}: {e}")
+        raise
+
+
+def release_host_slot(host: str, holder: str):
+    try:
+        with pool.transaction() as conn:
+            conn.execute("DELETE FROM host_slots WHERE host = ? AND holder = ?", (host, holder))
+    except sqlite3.Error as e:
+        logger.error(f"Database error while releasing a download slot for {host}: {e}")
+        raise
+
+
+def get_ready_generation() -> int:
+    """Returns the ready-set generation, which changes whenever a video becomes or stops being ready."""
     conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        # ORDER BY RANDOM() is an efficient way to get random rows in SQLite
-        cursor.execute(
-            "SELECT * FROM videos WHERE status = 'ready' ORDER BY RANDOM() LIMIT ?",
-            (limit,),
+        row = conn.execute("SELECT generation FROM ready_stats WHERE id = 1").fetchone()
+        return row["generation"] if row else 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while reading ready generation: {e}")
+        raise
+
+
+def get_ready_ids() -> list[int]:
+    """Returns the ids of all ready videos (an index-only scan)."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT id FROM videos WHERE status = 'ready' ORDER BY id").fetchall()
+        return [row["id"] for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Database error while loading ready ids: {e}")
+        raise
+
+
+ready_sampler = ReadyIdSampler(get_ready_generation, get_ready_ids)
+
+
+# --- List Projections ---
+# Grids only need a handful of columns per tile, so list queries select these
+# instead of SELECT *. Clients can ask for more (or fewer) with `fields=`.
+LIST_FIELDS_DEFAULT = ("id", "preview_id", "title", "url", "poster_url", "preview_path")
+LIST_FIELDS_ALLOWED = frozenset(
+    LIST_FIELDS_DEFAULT + ("duration", "created_at", "source_size", "preview_size")
+)
+# Always returned, since clients need them to page and to address previews
+LIST_FIELDS_REQUIRED = ("id", "preview_id")
+
+
+def parse_list_fields(fields: str | None) -> tuple[str, ...]:
+    """
+    Turns a comma separated `fields` parameter into a validated column tuple.
+
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return LIST_FIELDS_DEFAULT
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - LIST_FIELDS_ALLOWED)
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(sorted(LIST_FIELDS_ALLOWED))}"
         )
-        results = cursor.fetchall()
-        logger.debug(f"Retrieved {len(results)} random ready links")
-        return results
+    # dict.fromkeys keeps the order while dropping duplicates
+    return tuple(dict.fromkeys(LIST_FIELDS_REQUIRED + tuple(requested)))
+
+
+def _select_list(fields: tuple[str, ...], table_alias: str = "") -> str:
+    """Builds the column list for a projection; `fields` must come from parse_list_fields."""
+    prefix = f"{table_alias}." if table_alias else ""
+    return ", ".join(f"{prefix}{field}" for field in fields)
+
+
+def get_ready_links_by_ids(ids: list[int], fields: tuple[str, ...] = LIST_FIELDS_DEFAULT):
+    """Fetches the ready records for the given ids, preserving the order of `ids`."""
+    if not ids:
+        return []
+    conn = get_db_connection()
+    try:
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(
+            f"SELECT {_select_list(fields)} FROM videos WHERE status = 'ready' AND id IN ({placeholders})",
+            ids,
+        ).fetchall()
+        rows_by_id = {row["id"]: row for row in rows}
+        # Rows deleted since the ids were picked are simply skipped
+        return [rows_by_id[video_id] for video_id in ids if video_id in rows_by_id]
     except sqlite3.Error as e:
-        logger.error(f"Database error while fetching random ready links: {e}")
+        logger.error(f"Database error while fetching links by ids: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
-def get_latest_ready_links(limit: int, page: int):
-    """Fetches a paginated list of the latest links that are ready."""
-    logger.debug(f"Fetching latest ready links - limit: {limit}, page: {page}")
+def get_random_ready_links(
+    limit: int, seed: int | None = None, fields: tuple[str, ...] = LIST_FIELDS_DEFAULT
+):
+    """
+    Fetches a given number of random links that are ready.
+
+    Ids are drawn from the in-memory ready id index in O(limit) rather than
+    sorting the whole table with ORDER BY RANDOM(). A `seed` makes the pick
+    reproducible while the set of ready videos stays the same.
+    """
+    logger.debug(f"Fetching {limit} random ready links (seed: {seed})")
+    ids = ready_sampler.sample(limit, seed=seed)
+    results = get_ready_links_by_ids(ids, fields)
+    logger.debug(f"Retrieved {len(results)} random ready links")
+    return results
+
+
+def get_shuffled_ready_links(
+    session: str, offset: int, limit: int, fields: tuple[str, ...] = LIST_FIELDS_DEFAULT
+):
+    """
+    Fetches one page of a session's no-repeat shuffle of all ready links.
+
+    Returns the records together with the total number of videos in the shuffle.
+    """
+    logger.debug(f"Fetching shuffled ready links - session: {session}, offset: {offset}, limit: {limit}")
+    ids, total = ready_sampler.shuffle_page(session, offset, limit)
+    results = get_ready_links_by_ids(ids, fields)
+    logger.debug(f"Retrieved {len(results)} shuffled ready links")
+    return results, total
+
+
+def get_latest_ready_links(
+    limit: int,
+    page: int = 1,
+    after_id: int | None = None,
+    fields: tuple[str, ...] = LIST_FIELDS_DEFAULT,
+):
+    """
+    Fetches a list of the latest links that are ready, newest first.
+
+    With `after_id` the query seeks straight to the rows older than that id on
+    the (status, id) index (keyset pagination), so every page costs the same no
+    matter how deep it is. Without it, classic page/offset pagination is used.
+    """
+    logger.debug(f"Fetching latest ready links - limit: {limit}, page: {page}, after_id: {after_id}")
     conn = get_db_connection()
-    # Calculate offset for pagination
-    offset = (page - 1) * limit
+    columns = _select_list(fields)
     try:
         cursor = conn.cursor()
         # ORDER BY id DESC gets the newest entries first
-        cursor.execute(
-            "SELECT * FROM videos WHERE status = 'ready' ORDER BY id DESC LIMIT ? OFFSET ?",
-            (limit, offset),
-        )
+        if after_id is not None:
+            cursor.execute(
+                f"SELECT {columns} FROM videos WHERE status = 'ready' AND id < ? ORDER BY id DESC LIMIT ?",
+                (after_id, limit),
+            )
+        else:
+            # Calculate offset for pagination. The skipped rows are walked on the
+            # covering (status, id) index only; full rows are read just for the page.
+            offset = (page - 1) * limit
+            cursor.execute(
+                f"""
+                SELECT {columns} FROM videos
+                WHERE id IN (
+                    SELECT id FROM videos WHERE status = 'ready' ORDER BY id DESC LIMIT ? OFFSET ?
+                )
+                ORDER BY id DESC
+                """,
+                (limit, offset),
+            )
         results = cursor.fetchall()
-        logger.debug(f"Retrieved {len(results)} latest ready links for page {page}")
+        logger.debug(f"Retrieved {len(results)} latest ready links")
         return results
     except sqlite3.Error as e:
         logger.error(f"Database error while fetching latest ready links: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
 def count_ready_links():
-    """Counts the total number of links with 'ready' status."""
+    """Returns the number of links with 'ready' status from the trigger-maintained counter."""
     logger.debug("Counting ready links")
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM videos WHERE status = 'ready'")
-        # fetchone() will return a dict like {'COUNT(*)': 123}
-        count_dict = cursor.fetchone()
-        count = count_dict["COUNT(*)"] if count_dict else 0
+        cursor.execute("SELECT ready_count FROM ready_stats WHERE id = 1")
+        stats = cursor.fetchone()
+        count = stats["ready_count"] if stats else 0
         logger.debug(f"Found {count} ready links")
         return count
     except sqlite3.Error as e:
         logger.error(f"Database error while counting ready links: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
 def delete_link_by_preview_id(preview_id: str):
-    """Deletes a record by its preview_id and returns the deleted record."""
-    logger.info(f"Deleting link with preview_id: {preview_id}")
-    # First, get the record so we know the preview_path for file deletion
-    record_to_delete = get_link_by_preview_id(preview_id)
-    if not record_to_delete:
-        logger.warning(f"No record found for preview_id: {preview_id}")
-        return None
+    """
+    Deletes a record by its preview_id and returns the deleted record.
 
-    conn = get_db_connection()
+    Previews can be shared by several links (same source content), so the
+    returned record's `preview_in_use` tells whether other links still
+    reference its preview file.
+    """
+    logger.info(f"Deleting link with preview_id: {preview_id}")
     try:
-        conn.execute("DELETE FROM videos WHERE preview_id = ?", (preview_id,))
-        conn.commit()
+        with pool.transaction() as conn:
+            # First, get the record so we know the preview_path for file deletion.
+            # Reading inside the write transaction keeps it consistent with the delete.
+            record_to_delete = get_link_by_preview_id(preview_id)
+            if not record_to_delete:
+                logger.warning(f"No record found for preview_id: {preview_id}")
+                return None
+
+            conn.execute("DELETE FROM videos WHERE preview_id = ?", (preview_id,))
+            record_to_delete["preview_in_use"] = bool(
+                record_to_delete["preview_path"]
+                and conn.execute(
+                    "SELECT 1 FROM videos WHERE preview_path = ? LIMIT 1", (record_to_delete["preview_path"],)
+                ).fetchone()
+            )
         logger.info(f"Successfully deleted record for preview_id: {preview_id}")
         return record_to_delete
     except sqlite3.Error as e:
         logger.error(f"Database error while deleting preview_id {preview_id}: {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
 
 
-def search_videos_by_title(query: str):
-    """Performs a full text search on titles of the video table and returns the results"""
-    logger.info(f"Searching videos by title with query: '{query}'")
+# Hot search results, dropped whenever a video becomes ready or is deleted
+search_cache = GenerationLRUCache(max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "256")))
+
+_SEARCH_TOKEN = re.compile(r"\w+", re.UNICODE)
+# snippet() marks matches with these private use characters instead of tags,
+# so the title can be HTML-escaped before the <mark> tags go in
+_MARK_START, _MARK_END = "\ue000", "\ue001"
+
+
+def highlight_snippet(snippet: str | None) -> str | None:
+    """Turns a raw snippet into safe HTML: the title escaped, its matches in <mark> tags."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def build_fts_query(query: str) -> str | None:
+    """
+    Turns free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted so FTS5 operators and syntax characters in user input
+    are matched literally instead of raising syntax errors, and the last word
+    becomes a prefix query so results show up while the user is still typing.
+    Returns None if the query contains no searchable words.
+    """
+    tokens = _SEARCH_TOKEN.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_videos_by_title(
+    query: str,
+    limit: int = 24,
+    offset: int = 0,
+    fields: tuple[str, ...] = LIST_FIELDS_DEFAULT,
+):
+    """
+    Performs a ranked full text search on the titles of ready videos.
+
+    Results are ordered by bm25 relevance, paginated with `limit`/`offset` and
+    come with a highlighted `title_snippet`, HTML with the title escaped and
+    its matches wrapped in <mark>. Returns a tuple of
+    (results, has_more).
+    """
+    logger.info(f"Searching videos by title with query: '{query}', limit: {limit}, offset: {offset}")
+    match_expression = build_fts_query(query)
+    if match_expression is None:
+        logger.info(f"Search query '{query}' contains no searchable words")
+        return [], False
+
+    generation = get_ready_generation()
+    cache_key = (match_expression, limit, offset, fields)
+    cached = search_cache.get(cache_key, generation)
+    if cached is not None:
+        logger.debug(f"Search cache hit for query: '{query}'")
+        return cached
+
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        # One extra row tells us whether there is another page
         cursor.execute(
-            """
-            SELECT  v.id, v.title, v.url, v.poster_url, v.preview_path, v.preview_id
-            FROM videos_fts f
-            JOIN videos v ON v.id = f.rowid
-            WHERE videos_fts MATCH ?
+            f"""
+            SELECT  {_select_list(fields, "v")},
+                    snippet(videos_fts, 0, ?, ?, '…', 16) AS title_snippet
+            FROM videos_fts
+            JOIN videos v ON v.id = videos_fts.rowid
+            WHERE videos_fts MATCH ? AND v.status = 'ready'
+            ORDER BY bm25(videos_fts), v.id DESC
+            LIMIT ? OFFSET ?
         """,
-            (query,),
+            (_MARK_START, _MARK_END, match_expression, limit + 1, offset),
         )
         results = cursor.fetchall()
+        for result in results:
+            result["title_snippet"] = highlight_snippet(result["title_snippet"])
+        has_more = len(results) > limit
+        results = results[:limit]
+        search_cache.put(cache_key, (results, has_more), generation)
         logger.info(f"Search completed - found {len(results)} results for query: '{query}'")
-        return results
+        return results, has_more
     except sqlite3.Error as e:
         logger.error(f"Database error while searching videos with query '{query}': {e}")
         raise
-    finally:
-        conn.close()
-        logger.debug("Database connection closed")
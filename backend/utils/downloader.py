@@ -0,0 +1,331 @@
+"""
+Resumable, segmented HTTP downloader for source videos.
+
+Downloads go to `<dest>.part` and are only renamed to `<dest>` once the size
+(and optionally the SHA-256) has been verified. When the host supports range
+requests and the file is large enough, it is fetched as DOWNLOAD_SEGMENTS
+concurrent ranges written in place into the preallocated part file. Progress
+is checkpointed to `<dest>.part.json`, so a dropped connection - or a retried
+task - continues where it stopped instead of starting from zero. Single
+stream downloads record their URL and size there too, and a part file is only
+resumed if both still match.
+
+All requests share one pooled requests.Session per process.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+from utils.host_limits import host_download_slot, wait_for_host
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.downloader")
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+# Files smaller than two of these are downloaded as a single stream
+DOWNLOAD_MIN_SEGMENT_SIZE = int(os.getenv("DOWNLOAD_MIN_SEGMENT_SIZE", str(8 * 1024 * 1024)))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "5"))
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", "10"))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60"))
+# Sent with requests to source sites, which often turn away unknown clients
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+# Write the resume checkpoint at most this often (seconds)
+CHECKPOINT_INTERVAL = 2.0
+
+
+class DownloadError(Exception):
+    pass
+
+
+@dataclass
+class DownloadStats:
+    path: str
+    size: int
+    seconds: float
+    segments: int
+    resumed_bytes: int
+
+    @property
+    def mib_per_second(self) -> float:
+        transferred = self.size - self.resumed_bytes
+        return transferred / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """The process-wide pooled session; recreated after a fork (e.g. Celery prefork workers)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(DOWNLOAD_SEGMENTS * 2, 10))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _timeout() -> tuple[float, float]:
+    return (DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+
+
+def get_range_support(url: str, headers: dict) -> tuple[bool, int | None]:
+    """
+    Checks whether the host serves byte ranges for `url`.
+
+    Asks for the first byte only; a 206 answer means the file can be fetched
+    (and seeked) in pieces. Returns (supported, total size in bytes or None
+    if unknown).
+    """
+    wait_for_host(url)
+    try:
+        with get_session().get(
+            url, headers={**headers, "Range": "bytes=0-0"}, stream=True, timeout=_timeout()
+        ) as r:
+            if r.status_code != 206:
+                return False, None
+            # Content-Range: bytes 0-0/12345
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            return True, int(total) if total.isdigit() else None
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Range request to {url} failed: {e}")
+        return False, None
+
+
+def _load_sidecar(path: str) -> dict:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_sidecar(path: str, state: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+class _Checkpoint:
+    """Per-segment progress of a part file, persisted next to it as JSON."""
+
+    def __init__(self, path: str, url: str, total: int, segments: list[list[int]]):
+        self.path = path
+        self.url = url
+        self.total = total
+        # [start, end (inclusive), bytes done]
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    @classmethod
+    def load_or_create(cls, path: str, url: str, total: int, count: int) -> "_Checkpoint":
+        state = _load_sidecar(path)
+        # A single stream download leaves no segments, so its part file is rewritten
+        if state.get("url") == url and state.get("total") == total and state.get("segments"):
+            return cls(path, url, total, state["segments"])
+
+        size = -(-total // count)
+        segments = [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+        return cls(path, url, total, segments)
+
+    @property
+    def done(self) -> int:
+        return sum(segment[2] for segment in self.segments)
+
+    def advance(self, index: int, length: int):
+        with self._lock:
+            self.segments[index][2] += length
+            if time.monotonic() - self._last_save >= CHECKPOINT_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        _save_sidecar(self.path, {"url": self.url, "total": self.total, "segments": self.segments})
+        self._last_save = time.monotonic()
+
+
+def _is_client_error(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+
+def _with_retries(description: str, attempt):
+    """Calls `attempt()` until it succeeds, backing off exponentially between failures."""
+    for retry in range(DOWNLOAD_RETRIES + 1):
+        try:
+            return attempt()
+        except (requests.exceptions.RequestException, DownloadError) as e:
+            if _is_client_error(e):
+                # Asking again won't change a 403 or 404
+                raise DownloadError(f"{description} failed: {e}") from e
+            if retry == DOWNLOAD_RETRIES:
+                raise DownloadError(f"{description} failed after {retry + 1} attempts: {e}") from e
+            delay = min(2**retry, 30)
+            logger.warning(f"{description} failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def _download_segment(url: str, headers: dict, fd: int, checkpoint: _Checkpoint, index: int):
+    def attempt():
+        start, end, done = checkpoint.segments[index]
+        if start + done > end:
+            return
+        wait_for_host(url)
+        with get_session().get(
+            url,
+            headers={**headers, "Range": f"bytes={start + done}-{end}"},
+            stream=True,
+            timeout=_timeout(),
+        ) as r:
+            if r.status_code != 206:
+                raise DownloadError(f"expected 206 for segment {index}, got {r.status_code}")
+            position = start + done
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                checkpoint.advance(index, len(chunk))
+        if position != end + 1:
+            raise DownloadError(f"segment {index} ended at byte {position}, expected {end + 1}")
+
+    _with_retries(f"Segment {index} of {url}", attempt)
+
+
+def _download_segmented(url: str, headers: dict, part_path: str, total: int, segments: int) -> int:
+    """Fills `part_path` with `segments` concurrent range requests. Returns the bytes resumed."""
+    if not os.path.exists(part_path):
+        # A checkpoint is useless without its part file
+        _remove_if_exists(part_path + ".json")
+    checkpoint = _Checkpoint.load_or_create(part_path + ".json", url, total, segments)
+    resumed = checkpoint.done
+    if resumed:
+        logger.info(f"Resuming download of {url} at {resumed}/{total} bytes")
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+    try:
+        os.ftruncate(fd, total)
+        with ThreadPoolExecutor(max_workers=len(checkpoint.segments), thread_name_prefix="download") as pool:
+            futures = [
+                pool.submit(_download_segment, url, headers, fd, checkpoint, index)
+                for index in range(len(checkpoint.segments))
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        checkpoint.save()
+        os.close(fd)
+    return resumed
+
+
+def _download_stream(url: str, headers: dict, part_path: str, total: int | None, resumable: bool) -> int:
+    """Appends the response body to `part_path`. Returns the bytes resumed."""
+    sidecar_path = part_path + ".json"
+    state = _load_sidecar(sidecar_path)
+    if os.path.exists(part_path) and not (
+        state.get("url") == url and state.get("total") == total and state.get("segments") is None
+    ):
+        # From another URL, a file that changed size on the host, or a segmented
+        # download whose part file is preallocated to full size: appending is wrong
+        logger.info(f"Discarding part file {part_path}, it doesn't belong to this download of {url}")
+        _remove_if_exists(part_path)
+    _save_sidecar(sidecar_path, {"url": url, "total": total, "segments": None})
+
+    resumed = os.path.getsize(part_path) if resumable and os.path.exists(part_path) else 0
+    if resumed:
+        logger.info(f"Resuming download of {url} at byte {resumed}")
+
+    def attempt():
+        offset = os.path.getsize(part_path) if resumable and os.path.exists(part_path) else 0
+        request_headers = {**headers, "Range": f"bytes={offset}-"} if offset else headers
+        wait_for_host(url)
+        with get_session().get(url, headers=request_headers, stream=True, timeout=_timeout()) as r:
+            r.raise_for_status()
+            # A 200 to a range request means the host sent the whole file again
+            mode = "ab" if offset and r.status_code == 206 else "wb"
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+
+    _with_retries(f"Download of {url}", attempt)
+    return resumed
+
+
+def _remove_if_exists(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def download_file(
+    url: str,
+    dest_path: str,
+    headers: dict | None = None,
+    expected_size: int | None = None,
+    sha256: str | None = None,
+) -> DownloadStats:
+    """
+    Downloads `url` to `dest_path` and returns transfer statistics.
+
+    `expected_size` defaults to the size the host reports. Raises DownloadError
+    if the download fails for good or the result does not verify; the part file
+    is kept in that case so the next attempt can resume it.
+    """
+    headers = headers or {}
+    part_path = dest_path + ".part"
+    started = time.perf_counter()
+
+    # Caps the concurrent downloads per host across all workers (utils/host_limits.py)
+    with host_download_slot(url):
+        resumable, total = get_range_support(url, headers)
+        expected_size = expected_size or total
+        segments = 1
+        if resumable and total and total >= 2 * DOWNLOAD_MIN_SEGMENT_SIZE:
+            segments = max(1, min(DOWNLOAD_SEGMENTS, total // DOWNLOAD_MIN_SEGMENT_SIZE))
+
+        if segments > 1:
+            resumed = _download_segmented(url, headers, part_path, total, segments)
+        else:
+            resumed = _download_stream(url, headers, part_path, total, resumable)
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"Downloaded {size} bytes from {url}, expected {expected_size}")
+    if sha256 is not None and _sha256(part_path) != sha256.lower():
+        os.remove(part_path)
+        raise DownloadError(f"SHA-256 mismatch for {url}")
+
+    os.replace(part_path, dest_path)
+    _remove_if_exists(part_path + ".json")
+
+    stats = DownloadStats(dest_path, size, time.perf_counter() - started, segments, resumed)
+    logger.info(
+        f"Downloaded {size / (1024 * 1024):.1f} MiB from {url} in {stats.seconds:.2f}s "
+        f"({stats.mib_per_second:.1f} MiB/s, {segments} segment(s), {resumed} bytes resumed)"
+    )
+    return stats
@@ -0,0 +1,309 @@
+"""
+Per-domain registry of extractors that pull title, poster and video source
+out of an uploaded URL.
+
+`get_extractor(url)` returns the first registered extractor that matches
+the URL, and falls back to GenericExtractor otherwise. Each extractor
+declares:
+
+- `requires_page`: False when everything can be derived from the URL itself
+- `requires_playwright`: True to skip the plain GET and render right away
+
+Built in, in lookup order:
+
+- DirectMediaExtractor: URLs that already point at a video file; nothing is fetched
+- MetadataExtractor: regex extraction of OpenGraph tags and JSON-LD
+  VideoObjects, without building a DOM. Enabled per domain via
+  SMD_METADATA_DOMAINS
+- GenericExtractor: the BeautifulSoup fallback chain, for unknown hosts.
+  Hosts listed in SMD_PLAYWRIGHT_DOMAINS go straight to the browser
+
+Site specific extractors subclass Extractor and are added with `register()`.
+"""
+
+import html
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from utils.host_limits import get_host
+from utils.logging_config import get_logger
+from utils.page_fetch import MEDIA_URL_PATTERN, PageResult, acquire_page, render_page
+
+logger = get_logger("utils.extractors")
+
+
+@dataclass
+class Extraction:
+    title: str | None = None
+    poster_url: str | None = None
+    video_src: str | None = None
+
+
+def _split_env_list(name: str) -> tuple[str, ...]:
+    return tuple(item.strip().lower() for item in os.getenv(name, "").split(",") if item.strip())
+
+
+def normalize_media_url(video_src: str | None, base_url: str):
+    """Resolves protocol-relative and relative sources; drops browser-only blob: URLs."""
+    if not video_src or video_src.startswith("blob:"):
+        return None
+    if video_src.startswith("//"):
+        video_src = "https:" + video_src
+        logger.debug(f"Fixed protocol-relative URL: {video_src}")
+    return urljoin(base_url, video_src)
+
+
+def pick_media_url(media_urls: list[str]):
+    """Prefers progressive files over playlists, which can't be downloaded directly."""
+    if not media_urls:
+        return None
+    return min(media_urls, key=lambda media_url: ".m3u8" in media_url or ".mpd" in media_url)
+
+
+class Extractor(ABC):
+    # Hosts this extractor handles; subdomains match too
+    domains: tuple[str, ...] = ()
+    requires_page = True
+    requires_playwright = False
+
+    def matches(self, url: str) -> bool:
+        host = get_host(url)
+        return any(host == domain or host.endswith("." + domain) for domain in self.domains)
+
+    @abstractmethod
+    def extract(self, url: str, page: PageResult | None) -> Extraction:
+        """Pulls what it can out of `url` and its fetched `page` (None if not `requires_page`)."""
+
+    def has_video(self, page: PageResult) -> bool:
+        """Whether a statically fetched page is enough, or it needs rendering."""
+        return self.extract(page.url, page).video_src is not None
+
+
+class DirectMediaExtractor(Extractor):
+    requires_page = False
+
+    def matches(self, url: str) -> bool:
+        return MEDIA_URL_PATTERN.search(urlparse(url).path) is not None
+
+    def extract(self, url: str, page: PageResult | None) -> Extraction:
+        return Extraction(title=PurePosixPath(urlparse(url).path).stem, video_src=url)
+
+
+META_TAG_PATTERN = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+JSON_LD_PATTERN = re.compile(
+    r"""<script\b[^>]*type\s*=\s*["']?application/ld\+json["']?[^>]*>(.*?)</script>""",
+    re.IGNORECASE | re.DOTALL,
+)
+TITLE_PATTERN = re.compile(r"<title\b[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+def parse_meta_tags(page_html: str) -> dict[str, str]:
+    """First value of every <meta property|name|itemprop=... content=...> tag."""
+    meta = {}
+    for tag in META_TAG_PATTERN.findall(page_html):
+        attributes = {
+            name.lower(): html.unescape(double or single or bare)
+            for name, double, single, bare in ATTRIBUTE_PATTERN.findall(tag)
+        }
+        key = attributes.get("property") or attributes.get("name") or attributes.get("itemprop")
+        if key and "content" in attributes:
+            meta.setdefault(key.lower(), attributes["content"])
+    return meta
+
+
+def _first(value):
+    return value[0] if isinstance(value, list) and value else value
+
+
+def find_json_ld_video(page_html: str) -> dict | None:
+    """The first schema.org VideoObject in the page's JSON-LD blocks."""
+    for block in JSON_LD_PATTERN.findall(page_html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                node_type = node.get("@type")
+                if node_type == "VideoObject" or (isinstance(node_type, list) and "VideoObject" in node_type):
+                    return node
+                stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+    return None
+
+
+class MetadataExtractor(Extractor):
+    """Reads OpenGraph and JSON-LD metadata with regexes; never builds a DOM."""
+
+    def __init__(self, domains: tuple[str, ...]):
+        self.domains = domains
+
+    def extract(self, url: str, page: PageResult | None) -> Extraction:
+        meta = parse_meta_tags(page.html)
+        video = find_json_ld_video(page.html) or {}
+
+        title = meta.get("og:title") or _first(video.get("name"))
+        if not title:
+            title_match = TITLE_PATTERN.search(page.html)
+            title = html.unescape(title_match.group(1)).strip() if title_match else None
+
+        poster_url = meta.get("og:image") or _first(video.get("thumbnailUrl")) or meta.get("thumbnailurl")
+        video_src = (
+            meta.get("og:video:secure_url")
+            or meta.get("og:video:url")
+            or meta.get("og:video")
+            or _first(video.get("contentUrl"))
+            or pick_media_url(page.media_urls)
+        )
+        return Extraction(
+            title=title or None,
+            poster_url=poster_url,
+            video_src=normalize_media_url(video_src, page.final_url),
+        )
+
+
+def get_poster_url_from_video(soup: BeautifulSoup):
+    poster_url = None
+
+    # First, try the video tag's 'poster' attribute
+    video_tag = soup.find("video")
+    if isinstance(video_tag, Tag):
+        poster_url = video_tag.get("poster")
+
+    # If not found, try finding a div with class "fp-poster" containing an img tag
+    if poster_url is None:
+        fp_poster_div = soup.find("div", class_="fp-poster")
+        if isinstance(fp_poster_div, Tag):
+            img_tag = fp_poster_div.find("img")
+            if isinstance(img_tag, Tag):
+                poster_url = img_tag.get("src")
+
+    # As a final fallback, try the meta tag for "thumbnailUrl"
+    if poster_url is None:
+        meta_tag = soup.find("meta", attrs={"itemprop": "thumbnailUrl"})
+        if isinstance(meta_tag, Tag):
+            poster_url = meta_tag.get("content")
+
+    if isinstance(poster_url, list):
+        poster_url = poster_url[0] if poster_url else None
+    return poster_url
+
+
+def get_video_src_from_soup(soup: BeautifulSoup):
+    video_src = None
+    video_tag = soup.find("video")
+
+    if isinstance(video_tag, Tag):
+        video_src = video_tag.get("src")
+        if not video_src:
+            source_tag = video_tag.find("source")
+            if not source_tag:
+                parent = video_tag.parent
+                if parent:
+                    source_tag = parent.find("source")
+            if isinstance(source_tag, Tag):
+                video_src = source_tag.get("src")
+
+    # blob: URLs only exist inside the browser that created them
+    if not isinstance(video_src, str) or video_src.startswith("blob:"):
+        return None
+    return video_src
+
+
+class GenericExtractor(Extractor):
+    """The slow path: full BeautifulSoup parse with a chain of fallbacks."""
+
+    def __init__(self, domains: tuple[str, ...] = (), requires_playwright: bool = False):
+        self.domains = domains
+        self.requires_playwright = requires_playwright
+
+    def has_video(self, page: PageResult) -> bool:
+        return get_video_src_from_soup(page.soup) is not None
+
+    def extract(self, url: str, page: PageResult | None) -> Extraction:
+        soup = page.soup
+        title = soup.title.string if soup.title and soup.title.string else None
+
+        logger.debug("Starting video source extraction")
+        video_src = get_video_src_from_soup(soup)
+        logger.debug(f"Found video source from HTML: {video_src}")
+        if not video_src and page.media_urls:
+            video_src = pick_media_url(page.media_urls)
+            logger.debug(f"Using media request captured while rendering: {video_src}")
+
+        return Extraction(
+            title=title,
+            poster_url=get_poster_url_from_video(soup),
+            video_src=normalize_media_url(video_src, page.final_url),
+        )
+
+
+_registry: list[Extractor] = []
+generic_extractor = GenericExtractor()
+
+
+def register(extractor: Extractor) -> Extractor:
+    """Adds `extractor` to the registry; earlier registrations win."""
+    _registry.append(extractor)
+    return extractor
+
+
+def get_extractor(url: str) -> Extractor:
+    for extractor in _registry:
+        if extractor.matches(url):
+            return extractor
+    return generic_extractor
+
+
+def extract_video_info(url: str, headers: dict) -> Extraction:
+    """Runs the matching extractor, falling back to the generic path if it finds no video."""
+    extractor = get_extractor(url)
+    logger.debug(f"Using {type(extractor).__name__} for URL: {url}")
+    if not extractor.requires_page:
+        return extractor.extract(url, None)
+
+    if extractor.requires_playwright:
+        page = render_page(url)
+    elif isinstance(extractor, GenericExtractor):
+        page = acquire_page(url, headers, has_video=extractor.has_video)
+    else:
+        # Don't render a page the generic fallback could handle statically
+        page = acquire_page(
+            url,
+            headers,
+            has_video=lambda page: extractor.has_video(page) or generic_extractor.has_video(page),
+        )
+    extraction = extractor.extract(url, page)
+
+    if extraction.video_src is None and not isinstance(extractor, GenericExtractor):
+        logger.debug(f"{type(extractor).__name__} found no video, trying the generic extractor")
+        if not page.rendered and not generic_extractor.has_video(page):
+            page = render_page(url)
+        fallback = generic_extractor.extract(url, page)
+        extraction = Extraction(
+            title=extraction.title or fallback.title,
+            poster_url=extraction.poster_url or fallback.poster_url,
+            video_src=fallback.video_src,
+        )
+
+    if extraction.video_src is None:
+        logger.error("Could not find video source")
+    return extraction
+
+
+register(DirectMediaExtractor())
+if metadata_domains := _split_env_list("SMD_METADATA_DOMAINS"):
+    register(MetadataExtractor(metadata_domains))
+if playwright_domains := _split_env_list("SMD_PLAYWRIGHT_DOMAINS"):
+    register(GenericExtractor(playwright_domains, requires_playwright=True))
@@ -0,0 +1,151 @@
+"""
+HTTP delivery of preview files: validators, conditional requests, byte
+ranges and offloading to a front proxy.
+
+Every response carries a strong ETag and Last-Modified. Preview files are
+written once and renamed into place, never modified, so size plus mtime
+identify their content. Requests whose If-None-Match (or, without one,
+If-Modified-Since) still matches get a bodiless 304. Range requests are
+answered with 206, multiple ranges as a proper multipart/byteranges body.
+
+PREVIEW_SENDFILE hands the bytes off to the proxy in front of the API
+instead of streaming them through Python:
+
+- `x-accel-redirect` (nginx): the response names the file as
+  PREVIEW_ACCEL_PREFIX (POSTER_ACCEL_PREFIX for posters) + file name, which
+  must map to an `internal` location aliasing the file's directory.
+- `x-sendfile` (Apache mod_xsendfile, lighttpd): the response names the
+  absolute path of the file.
+
+The proxy then takes care of ranges itself.
+"""
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from secrets import token_hex
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.file_delivery")
+
+SENDFILE_MODES = ("", "x-accel-redirect", "x-sendfile")
+PREVIEW_SENDFILE = os.getenv("PREVIEW_SENDFILE", "").lower()
+PREVIEW_ACCEL_PREFIX = os.getenv("PREVIEW_ACCEL_PREFIX", "/internal/previews/")
+
+if PREVIEW_SENDFILE not in SENDFILE_MODES:
+    raise ValueError(f"Unknown PREVIEW_SENDFILE '{PREVIEW_SENDFILE}', expected x-accel-redirect or x-sendfile")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RangedFileResponse(FileResponse):
+    """
+    FileResponse whose multi-range answers follow RFC 9110: the multipart
+    type goes into Content-Type, and parts are delimited with CRLF.
+    """
+
+    async def _handle_multiple_ranges(self, send, ranges, file_size, send_header_only):
+        boundary = token_hex(13)
+        content_type = self.headers["content-type"]
+        # The CRLF ending a part belongs to the next delimiter
+        part_headers = [
+            (b"" if index == 0 else b"\r\n")
+            + (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for index, (start, end) in enumerate(ranges)
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        content_length = (
+            sum(len(header) for header in part_headers) + sum(end - start for start, end in ranges) + len(closing)
+        )
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for header, (start, end) in zip(part_headers, ranges):
+                await send({"type": "http.response.body", "body": header, "more_body": True})
+                await file.seek(start)
+                while start < end:
+                    chunk = await file.read(min(self.chunk_size, end - start))
+                    start += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def is_not_modified(request: Request, etag: str, modified_at: float) -> bool:
+    """Whether the client's cached copy, going by its validators, is still current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses the weak comparison
+        return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modified_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve_file(
+    request: Request,
+    path: str,
+    media_type: str,
+    cache_control: str,
+    filename: str | None = None,
+    headers: dict | None = None,
+    accel_prefix: str = PREVIEW_ACCEL_PREFIX,
+) -> Response:
+    """
+    Answers `request` with the file at `path`: a 304, a sendfile hand-off
+    or the (ranged) file itself. Raises FileNotFoundError if it is missing.
+
+    `accel_prefix` is the internal nginx location of the file's directory.
+    """
+    stat_result = os.stat(path)
+    etag = make_etag(stat_result)
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        logger.debug(f"Not modified: {path}")
+        return Response(status_code=304, headers=headers)
+
+    if PREVIEW_SENDFILE == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = accel_prefix + quote(os.path.basename(path))
+        return Response(media_type=media_type, headers=headers)
+    if PREVIEW_SENDFILE == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(media_type=media_type, headers=headers)
+
+    return RangedFileResponse(
+        path,
+        media_type=media_type,
+        headers=headers,
+        filename=filename,
+        stat_result=stat_result,
+        content_disposition_type="inline",
+    )
@@ -0,0 +1,79 @@
+"""
+Content fingerprints of source videos.
+
+A fingerprint is a SHA-256 over the file size and three samples of
+FINGERPRINT_SAMPLE_SIZE bytes from the head, middle and tail of the file
+(the whole file if it is small), cut to 32 hex characters. That is cheap
+enough to compute for every upload, and it can be computed the same way
+from a downloaded file or, with three range requests, straight from a
+remote source without downloading it. Two uploads with the same fingerprint
+share one preview, and previews are stored under it (see
+utils/upload_link.py).
+"""
+
+import hashlib
+import os
+
+import requests
+from utils.downloader import DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT, get_session
+from utils.host_limits import wait_for_host
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.fingerprint")
+
+FINGERPRINT_SAMPLE_SIZE = int(os.getenv("FINGERPRINT_SAMPLE_SIZE", str(256 * 1024)))
+
+
+def _sample_ranges(size: int) -> list[tuple[int, int]]:
+    """(offset, length) of the sampled parts of a `size` byte file."""
+    if size <= 3 * FINGERPRINT_SAMPLE_SIZE:
+        return [(0, size)]
+    middle = size // 2 - FINGERPRINT_SAMPLE_SIZE // 2
+    return [
+        (0, FINGERPRINT_SAMPLE_SIZE),
+        (middle, FINGERPRINT_SAMPLE_SIZE),
+        (size - FINGERPRINT_SAMPLE_SIZE, FINGERPRINT_SAMPLE_SIZE),
+    ]
+
+
+def _digest(size: int, samples: list[bytes]) -> str:
+    digest = hashlib.sha256(f"{size}:".encode())
+    for sample in samples:
+        digest.update(sample)
+    return digest.hexdigest()[:32]
+
+
+def fingerprint_file(path: str) -> str:
+    size = os.path.getsize(path)
+    samples = []
+    with open(path, "rb") as f:
+        for offset, length in _sample_ranges(size):
+            f.seek(offset)
+            samples.append(f.read(length))
+    return _digest(size, samples)
+
+
+def fingerprint_url(url: str, headers: dict, size: int) -> str | None:
+    """
+    Fingerprints a remote file of known `size` with range requests. Returns
+    None if the host doesn't answer them exactly.
+    """
+    if size <= 0:
+        return None
+    samples = []
+    try:
+        for offset, length in _sample_ranges(size):
+            wait_for_host(url)
+            response = get_session().get(
+                url,
+                headers={**headers, "Range": f"bytes={offset}-{offset + length - 1}"},
+                timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT),
+            )
+            if response.status_code != 206 or len(response.content) != length:
+                logger.warning(f"Host did not honor range request for fingerprinting {url} ({response.status_code})")
+                return None
+            samples.append(response.content)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not fingerprint {url}: {e}")
+        return None
+    return _digest(size, samples)
@@ -0,0 +1,171 @@
+"""
+Per-host request rate and download concurrency limits for outbound fetches.
+
+Every request to a source site (page fetches, renders, range probes and
+downloads) first takes a token from its host's bucket. Buckets refill at
+`rate` tokens per second up to `burst`. Whole downloads, including ffmpeg
+streaming a remote source, additionally hold one of the host's
+`max_downloads` slots. Buckets and slots live in the SQLite database, so
+every worker process, Celery or local, shares the same limits. A bulk
+import from one host is spread out instead of tripping the host's anti-bot
+defenses, which would then escalate to Playwright renders.
+
+Defaults come from HOST_RATE_PER_SECOND, HOST_BURST and HOST_MAX_DOWNLOADS
+(0 disables the respective limit). HOST_LIMITS overrides them per domain as
+comma separated `domain=rate/burst/max_downloads` entries, e.g.
+`HOST_LIMITS=example.com=0.5/2/1,cdn.example.org=10/20/8`. Subdomains match
+too.
+
+A 429 answer drains the host's bucket for the Retry-After period. A caller
+that would have to wait longer than HOST_MAX_WAIT_SECONDS gets
+HostThrottledError instead, and the job is retried later (see
+utils/job_lifecycle.py) rather than blocking a worker.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from utils.db_utils import (
+    close_thread_db_connection,
+    release_host_slot,
+    renew_host_slot,
+    set_host_tokens,
+    take_host_token,
+    try_acquire_host_slot,
+)
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.host_limits")
+
+HOST_MAX_WAIT_SECONDS = float(os.getenv("HOST_MAX_WAIT_SECONDS", "300"))
+# Slots of a crashed worker are freed after this long without renewal
+HOST_SLOT_TTL_SECONDS = float(os.getenv("HOST_SLOT_TTL_SECONDS", "120"))
+HOST_SLOT_POLL_SECONDS = float(os.getenv("HOST_SLOT_POLL_SECONDS", "1"))
+# Used for 429 answers without a usable Retry-After header
+HOST_THROTTLE_SECONDS = float(os.getenv("HOST_THROTTLE_SECONDS", "60"))
+
+
+class HostThrottledError(Exception):
+    """A host's limits would have kept the caller waiting too long."""
+
+
+@dataclass(frozen=True)
+class HostLimit:
+    rate: float
+    burst: float
+    max_downloads: int
+
+
+def _parse_host_limits(value: str) -> dict[str, HostLimit]:
+    limits = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        domain, _, spec = entry.partition("=")
+        domain = domain.strip().lower()
+        try:
+            rate, burst, max_downloads = spec.split("/")
+            limits[domain[4:] if domain.startswith("www.") else domain] = HostLimit(
+                float(rate), float(burst), int(max_downloads)
+            )
+        except ValueError:
+            raise ValueError(f"Invalid HOST_LIMITS entry '{entry.strip()}', expected domain=rate/burst/max_downloads")
+    return limits
+
+
+DEFAULT_HOST_LIMIT = HostLimit(
+    rate=float(os.getenv("HOST_RATE_PER_SECOND", "2")),
+    burst=float(os.getenv("HOST_BURST", "5")),
+    max_downloads=int(os.getenv("HOST_MAX_DOWNLOADS", "2")),
+)
+HOST_LIMITS = _parse_host_limits(os.getenv("HOST_LIMITS", ""))
+
+
+def get_host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def get_host_limit(host: str) -> HostLimit:
+    """The most specific HOST_LIMITS entry for `host`, or the defaults."""
+    parts = host.split(".")
+    for i in range(len(parts)):
+        limit = HOST_LIMITS.get(".".join(parts[i:]))
+        if limit is not None:
+            return limit
+    return DEFAULT_HOST_LIMIT
+
+
+def wait_for_host(url: str, max_wait: float = HOST_MAX_WAIT_SECONDS):
+    """
+    Blocks until the host of `url` may be sent another request. Raises
+    HostThrottledError if that would take more than `max_wait` seconds;
+    0 never blocks.
+    """
+    host = get_host(url)
+    limit = get_host_limit(host)
+    if not host or limit.rate <= 0:
+        return
+
+    deadline = time.monotonic() + max_wait
+    while (wait := take_host_token(host, limit.rate, limit.burst, time.time())) > 0:
+        if time.monotonic() + wait > deadline:
+            raise HostThrottledError(f"Rate limit for {host} would delay the request by more than {max_wait:.0f}s")
+        logger.debug(f"Rate limited by {host}, waiting {wait:.2f}s")
+        time.sleep(wait)
+
+
+def throttle_host(url: str, retry_after: str | None = None):
+    """Stops requests to the host of `url` for the Retry-After period of a 429 answer."""
+    host = get_host(url)
+    limit = get_host_limit(host)
+    if not host or limit.rate <= 0:
+        return
+    seconds = float(retry_after) if retry_after and retry_after.strip().isdigit() else HOST_THROTTLE_SECONDS
+    logger.warning(f"{host} asked us to slow down, pausing requests for {seconds:.0f}s")
+    # A negative balance takes `seconds` to refill back to one token
+    set_host_tokens(host, 1 - seconds * limit.rate, time.time())
+
+
+@contextmanager
+def host_download_slot(url: str):
+    """Holds one of the host's download slots while the block runs."""
+    host = get_host(url)
+    limit = get_host_limit(host)
+    if not host or limit.max_downloads <= 0:
+        yield
+        return
+
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + HOST_MAX_WAIT_SECONDS
+    while not try_acquire_host_slot(host, holder, limit.max_downloads, time.time() + HOST_SLOT_TTL_SECONDS):
+        if time.monotonic() > deadline:
+            raise HostThrottledError(f"All {limit.max_downloads} download slots for {host} stayed busy")
+        time.sleep(HOST_SLOT_POLL_SECONDS)
+
+    stopped = threading.Event()
+
+    def renew():
+        try:
+            while not stopped.wait(HOST_SLOT_TTL_SECONDS / 3):
+                try:
+                    renew_host_slot(host, holder, time.time() + HOST_SLOT_TTL_SECONDS)
+                except Exception as e:
+                    logger.warning(f"Could not renew download slot for {host}: {e}")
+        finally:
+            close_thread_db_connection()
+
+    thread = threading.Thread(target=renew, name=f"slot-{host}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+        release_host_slot(host, holder)
@@ -0,0 +1,212 @@
+"""
+Leases, heartbeats and retries for link processing jobs.
+
+Every attempt at processing a link holds a lease on its videos row
+(`lease_expires_at`). The worker running a stage renews the lease every
+JOB_HEARTBEAT_SECONDS; while a job waits in a queue for its next stage, the
+lease is JOB_QUEUE_TIMEOUT_SECONDS long. A worker that dies, or a task
+message between two stages that gets lost, therefore leaves a lease that
+runs out, and `reap_expired_jobs` (a Celery beat task, or the local runner's
+loop) puts the link back in the queue with a new attempt; stale messages of
+the old attempt stop at their next stage. Links that are still 'queued' are
+never dispatched again: their message is waiting in the broker.
+
+Failures are sorted into error classes (see `classify_error`). Transient
+ones are retried with exponential backoff and jitter according to the
+class' RetryPolicy. Everything else, or a job that has used up its
+attempts, ends up 'failed' as before. `attempts` counts the attempts made so
+far; stages of an attempt that was reaped or retried in the meantime notice
+that the count moved on and stop.
+"""
+
+import os
+import random
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import requests
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from utils.db_utils import (
+    close_thread_db_connection,
+    renew_job_lease,
+    requeue_expired_links,
+    schedule_link_retry,
+    update_link_to_failed,
+)
+from utils.downloader import DownloadError
+from utils.host_limits import HostThrottledError
+from utils.logging_config import get_logger
+from utils.status_events import publish_status, publish_status_events, status_event
+from utils.task_dispatch import enqueue_link, enqueue_links
+
+logger = get_logger("utils.job_lifecycle")
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+# How long a job may wait in a queue for the worker of its next stage before it is reaped
+JOB_QUEUE_TIMEOUT_SECONDS = int(os.getenv("JOB_QUEUE_TIMEOUT_SECONDS", "3600"))
+JOB_REAPER_INTERVAL_SECONDS = float(os.getenv("JOB_REAPER_INTERVAL_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "1800"))
+
+
+class WorkerCrashedError(Exception):
+    """The process running a job died before the job finished."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+    def delay(self, attempt: int) -> float | None:
+        """Seconds to wait after failed attempt `attempt`, or None once attempts are used up."""
+        if attempt >= self.max_attempts:
+            return None
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # Equal jitter: links that failed together (e.g. a host outage) don't retry together
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+# Error classes without a policy ("permanent") are never retried
+RETRY_POLICIES = {
+    "network": RetryPolicy(JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS, JOB_RETRY_MAX_SECONDS),
+    "throttled": RetryPolicy(JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS * 4, JOB_RETRY_MAX_SECONDS * 2),
+    "browser": RetryPolicy(min(3, JOB_MAX_ATTEMPTS), JOB_RETRY_BASE_SECONDS * 2, JOB_RETRY_MAX_SECONDS),
+    "database": RetryPolicy(JOB_MAX_ATTEMPTS, 5, 60),
+    "crash": RetryPolicy(min(3, JOB_MAX_ATTEMPTS), JOB_RETRY_BASE_SECONDS, JOB_RETRY_MAX_SECONDS),
+}
+
+
+def classify_error(error: BaseException | None) -> str:
+    """
+    Names the error class of a failure: 'network', 'throttled', 'browser',
+    'database', 'crash' or 'permanent'. Wrapped errors are classified by their cause.
+    """
+    while error is not None:
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            status_code = error.response.status_code
+            if status_code == 429:
+                return "throttled"
+            if status_code == 408 or status_code >= 500:
+                return "network"
+            return "permanent"
+        if isinstance(error, HostThrottledError):
+            return "throttled"
+        if isinstance(
+            error,
+            (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError, socket.timeout),
+        ):
+            return "network"
+        if isinstance(error, PlaywrightTimeoutError):
+            return "browser"
+        if isinstance(error, sqlite3.OperationalError):
+            # "database is locked" and friends
+            return "database"
+        if isinstance(error, WorkerCrashedError):
+            return "crash"
+        if isinstance(error, DownloadError) and error.__cause__ is None:
+            # Short or corrupt transfers; the next attempt resumes the part file
+            return "network"
+        error = error.__cause__
+    return "permanent"
+
+
+def is_transient(error: BaseException) -> bool:
+    return classify_error(error) in RETRY_POLICIES
+
+
+def get_retry_delay(error: BaseException, attempt: int) -> float | None:
+    """Seconds until the next attempt after `error` ended attempt `attempt`, or None not to retry."""
+    policy = RETRY_POLICIES.get(classify_error(error))
+    return policy.delay(attempt) if policy else None
+
+
+def retry_or_fail(url: str, preview_id: str, attempt: int | None, error: BaseException) -> bool:
+    """
+    Schedules the next attempt if `error` is transient and the link has
+    attempts left; marks the link 'failed' otherwise. Returns True if retried.
+
+    Nothing happens if attempt `attempt` is no longer current: a newer
+    attempt owns the link and may already have finished it.
+    """
+    delay = get_retry_delay(error, attempt) if attempt is not None else None
+    if delay is not None:
+        if not schedule_link_retry(preview_id, attempt, str(error), delay):
+            logger.warning(f"Attempt {attempt} for preview_id {preview_id} failed after it was superseded: {error}")
+            return False
+        logger.warning(
+            f"Attempt {attempt} for preview_id {preview_id} failed ({classify_error(error)}: {error}), "
+            f"retrying in {delay:.0f}s"
+        )
+        publish_status(preview_id, "queued", error=str(error), attempt=attempt, retry_in=round(delay))
+        enqueue_link(url, preview_id, delay=delay)
+        return True
+
+    logger.error(f"FAILED to process URL: {url}, preview_id: {preview_id}, error: {error}")
+    if update_link_to_failed(preview_id, attempt, str(error)):
+        publish_status(preview_id, "failed", error=str(error))
+    return False
+
+
+def start_job_stage(preview_id: str, attempt: int, stage: str) -> bool:
+    """
+    Takes the lease for `stage` of attempt `attempt`. False means the job has
+    moved on without this message (reaped, retried or deleted), so the stage
+    must not run.
+    """
+    if renew_job_lease(preview_id, attempt, JOB_LEASE_SECONDS, stage=stage):
+        return True
+    logger.warning(f"Skipping stale {stage} stage of attempt {attempt} for preview_id: {preview_id}")
+    return False
+
+
+@contextmanager
+def job_heartbeat(preview_id: str, attempt: int):
+    """Renews the job's lease every JOB_HEARTBEAT_SECONDS while the block runs."""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    if not renew_job_lease(preview_id, attempt, JOB_LEASE_SECONDS):
+                        logger.warning(f"Attempt {attempt} for preview_id {preview_id} lost its lease")
+                        return
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not renew lease for preview_id {preview_id}: {e}")
+        finally:
+            # Every stage starts a new heartbeat thread; don't leave its connection behind
+            close_thread_db_connection()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{preview_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def reap_expired_jobs() -> int:
+    """
+    Requeues processing links whose lease ran out and dispatches them again;
+    links that have used up their attempts are marked 'failed'. Returns the number of
+    links requeued.
+    """
+    requeued, failed = requeue_expired_links(JOB_MAX_ATTEMPTS)
+    if not requeued and not failed:
+        return 0
+
+    logger.warning(f"Reaped expired jobs - requeued: {len(requeued)}, failed: {len(failed)}")
+    publish_status_events(
+        [status_event(item["preview_id"], "queued") for item in requeued]
+        + [status_event(item["preview_id"], "failed", error=item["error_message"]) for item in failed]
+    )
+    enqueue_links(requeued)
+    return len(requeued)
@@ -0,0 +1,193 @@
+"""
+In-process task runner for single box deployments without Redis or Celery.
+
+Enabled with SMD_TASK_BACKEND=local. The videos table doubles as the durable
+job queue: the runner claims 'queued' rows atomically (see
+claim_queued_links) and runs the whole pipeline (utils.upload_link.
+run_link_pipeline) for each one in a ProcessPoolExecutor with
+LOCAL_RUNNER_WORKERS processes. It is woken right away by uploads in the same
+process and polls every LOCAL_RUNNER_POLL_SECONDS for rows queued elsewhere.
+
+Every claim records the runner's hostname:pid. On startup, rows that are
+still 'processing' under a runner process that no longer exists are put back
+in the queue, so a crash or restart never loses work. While running, the
+loop also reaps expired job leases every JOB_REAPER_INTERVAL_SECONDS (see
+utils/job_lifecycle.py), and a worker process that crashes counts as a
+failed attempt that is retried.
+
+Status events from the worker processes travel back over a multiprocessing
+queue to this process' StatusBroadcaster, so the SSE stream works without
+Redis too.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from utils.async_db import run_db
+from utils.db_utils import claim_queued_links, requeue_orphaned_links
+from utils.job_lifecycle import (
+    JOB_LEASE_SECONDS,
+    JOB_REAPER_INTERVAL_SECONDS,
+    WorkerCrashedError,
+    reap_expired_jobs,
+    retry_or_fail,
+)
+from utils.logging_config import get_logger
+from utils.preview_engine import set_job_concurrency
+from utils.status_events import set_event_sink, status_broadcaster
+
+logger = get_logger("utils.local_runner")
+
+LOCAL_RUNNER_WORKERS = int(os.getenv("LOCAL_RUNNER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+LOCAL_RUNNER_POLL_SECONDS = float(os.getenv("LOCAL_RUNNER_POLL_SECONDS", "5"))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _init_worker_process(events):
+    set_event_sink(events.put)
+    set_job_concurrency(LOCAL_RUNNER_WORKERS)
+
+
+def _run_pipeline(url: str, preview_id: str, attempt: int):
+    # Imported in the worker process only; the API never needs Celery's task module
+    from utils.upload_link import run_link_pipeline
+
+    run_link_pipeline(url, preview_id, attempt)
+
+
+class LocalTaskRunner:
+    def __init__(self):
+        self.runner_id: str | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._events = None
+        self._event_thread: threading.Thread | None = None
+        self._in_flight = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the API process runs threads (DB executor, event pump)
+        return ProcessPoolExecutor(
+            max_workers=LOCAL_RUNNER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_process,
+            initargs=(self._events,),
+        )
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._events = multiprocessing.get_context("spawn").Queue()
+        set_event_sink(self._events.put)
+        self._event_thread = threading.Thread(target=self._pump_events, name="status-events", daemon=True)
+        self._event_thread.start()
+
+        self._executor = self._new_executor()
+        await run_db(requeue_orphaned_links, socket.gethostname(), _pid_alive)
+        self._task = self._loop.create_task(self._run())
+        logger.info(f"Local task runner {self.runner_id} started with {LOCAL_RUNNER_WORKERS} worker processes")
+
+    def wake(self):
+        """Claims newly queued links right away instead of at the next poll; thread safe."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _pump_events(self):
+        while (event := self._events.get()) is not None:
+            self._loop.call_soon_threadsafe(status_broadcaster.deliver, event)
+
+    async def _run(self):
+        last_reap = 0.0
+        while True:
+            if time.monotonic() - last_reap >= JOB_REAPER_INTERVAL_SECONDS:
+                last_reap = time.monotonic()
+                try:
+                    await run_db(reap_expired_jobs)
+                except Exception as e:
+                    logger.error(f"Local task runner could not reap expired jobs: {e}")
+
+            free = LOCAL_RUNNER_WORKERS - self._in_flight
+            if free > 0:
+                try:
+                    for row in await run_db(claim_queued_links, self.runner_id, free, JOB_LEASE_SECONDS):
+                        self._submit(row["url"], row["preview_id"], row["attempts"])
+                except Exception as e:
+                    logger.error(f"Local task runner could not claim links: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=LOCAL_RUNNER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _submit(self, url: str, preview_id: str, attempt: int):
+        logger.info(f"Local task runner starting attempt {attempt} for preview_id: {preview_id}")
+        self._in_flight += 1
+        executor = self._executor
+        future = asyncio.wrap_future(executor.submit(_run_pipeline, url, preview_id, attempt))
+        future.add_done_callback(partial(self._finished, executor, url, preview_id, attempt))
+
+    def _finished(self, executor: ProcessPoolExecutor, url: str, preview_id: str, attempt: int, future: asyncio.Future):
+        self._in_flight -= 1
+        self._wake.set()
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # A worker process died (e.g. killed for memory); every job it took down is retried
+            logger.error(f"Worker process crashed while processing preview_id: {preview_id}")
+            if self._executor is executor:
+                self._executor = self._new_executor()
+            error = WorkerCrashedError("Worker process crashed")
+        elif error is not None:
+            logger.error(f"Pipeline for preview_id {preview_id} raised: {error}")
+        if error is not None:
+            self._loop.create_task(self._fail(url, preview_id, attempt, error))
+
+    async def _fail(self, url: str, preview_id: str, attempt: int, error: Exception):
+        try:
+            await run_db(retry_or_fail, url, preview_id, attempt, error)
+        except Exception as e:
+            logger.error(f"Could not record the failure of preview_id {preview_id}: {e}")
+
+    async def stop(self):
+        """Stops claiming links; running pipelines are recovered on the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._events is not None:
+            set_event_sink(None)
+            self._events.put(None)
+            self._event_thread.join(timeout=5)
+            self._events = None
+        logger.info(f"Local task runner {self.runner_id} stopped")
+
+
+local_runner = LocalTaskRunner()
@@ -0,0 +1,328 @@
+"""
+Versioned schema migrations for the videos database.
+
+The schema version is stored in `PRAGMA user_version`. Every migration runs in
+its own BEGIN IMMEDIATE transaction together with the version bump, and the
+version is re-read once the write lock is held, so the API and the Celery
+workers can all call `apply_migrations` at startup without stepping on each
+other.
+
+To change the schema, append a new migration to MIGRATIONS. Never edit one
+that has already shipped.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Callable
+
+from utils.canonical_url import canonicalize_url
+from utils.logging_config import get_logger
+
+logger = get_logger("migrations")
+
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+    """
+    Executes several SQL statements inside the current transaction.
+
+    sqlite3's executescript() would COMMIT first, so statements are split with
+    sqlite3.complete_statement() (which understands trigger bodies) instead.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        raise ValueError(f"Incomplete SQL statement in migration: {statement!r}")
+
+
+def _initial_schema(conn: sqlite3.Connection):
+    # We add UNIQUE constraints to prevent duplicates at the database level
+    # and an error_message column for better debugging.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT UNIQUE NOT NULL,
+            title TEXT,
+            poster_url TEXT,
+            preview_path TEXT,
+            preview_id TEXT UNIQUE NOT NULL,
+            status TEXT NOT NULL,
+            error_message TEXT
+        );
+        """,
+    )
+
+    # prefix='2 3 4' adds prefix indexes so search-as-you-type queries like
+    # "son*" don't have to scan every term in the index.
+    existing_fts = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'"
+    ).fetchone()
+    if existing_fts and "prefix" not in existing_fts[0]:
+        # Databases from before prefix indexes: recreate, the next migration rebuilds it
+        logger.info("Recreating 'videos_fts' with prefix indexes")
+        conn.execute("DROP TABLE videos_fts")
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(title, content='videos', content_rowid='id', prefix='2 3 4')"
+    )
+
+
+def _fts_sync_triggers(conn: sqlite3.Connection):
+    # Keep the external-content FTS index in sync with the videos table.
+    # The index mirrors every row's title; search filters on status itself.
+    _execute_script(
+        conn,
+        """
+        CREATE TRIGGER IF NOT EXISTS videos_fts_after_insert
+        AFTER INSERT ON videos
+        BEGIN
+            INSERT INTO videos_fts(rowid, title) VALUES (NEW.id, NEW.title);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS videos_fts_after_delete
+        AFTER DELETE ON videos
+        BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS videos_fts_after_title_update
+        AFTER UPDATE OF title ON videos
+        BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            INSERT INTO videos_fts(rowid, title) VALUES (NEW.id, NEW.title);
+        END;
+        """,
+    )
+    # Indexes written before the triggers existed may hold stale rows for
+    # deleted videos, so start from a clean rebuild.
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+
+
+def _ready_counter(conn: sqlite3.Connection):
+    # Single-row counter of ready videos kept up to date by triggers, so the
+    # API never has to COUNT(*) the table. `generation` is bumped on every
+    # change to the set of ready videos, which lets readers cheaply tell
+    # whether anything they cached is stale.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS ready_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            ready_count INTEGER NOT NULL DEFAULT 0,
+            generation INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TRIGGER IF NOT EXISTS videos_ready_after_insert
+        AFTER INSERT ON videos WHEN NEW.status = 'ready'
+        BEGIN
+            UPDATE ready_stats
+            SET ready_count = ready_count + 1, generation = generation + 1
+            WHERE id = 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS videos_ready_after_delete
+        AFTER DELETE ON videos WHEN OLD.status = 'ready'
+        BEGIN
+            UPDATE ready_stats
+            SET ready_count = ready_count - 1, generation = generation + 1
+            WHERE id = 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS videos_ready_after_status_update
+        AFTER UPDATE OF status ON videos
+        WHEN (OLD.status = 'ready') != (NEW.status = 'ready')
+        BEGIN
+            UPDATE ready_stats
+            SET ready_count = ready_count + (CASE WHEN NEW.status = 'ready' THEN 1 ELSE -1 END),
+                generation = generation + 1
+            WHERE id = 1;
+        END;
+
+        INSERT OR REPLACE INTO ready_stats (id, ready_count, generation)
+        SELECT 1,
+               (SELECT COUNT(*) FROM videos WHERE status = 'ready'),
+               COALESCE((SELECT generation FROM ready_stats WHERE id = 1), 0) + 1;
+        """,
+    )
+
+
+def _media_columns_and_indexes(conn: sqlite3.Connection):
+    # created_at is unix seconds; rows from before this migration keep NULL.
+    # duration/source_size describe the original video, preview_size the preview file.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE videos ADD COLUMN created_at INTEGER;
+        ALTER TABLE videos ADD COLUMN duration REAL;
+        ALTER TABLE videos ADD COLUMN source_size INTEGER;
+        ALTER TABLE videos ADD COLUMN preview_size INTEGER;
+
+        CREATE INDEX IF NOT EXISTS idx_videos_status_id ON videos(status, id);
+        CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos(created_at);
+        """,
+    )
+
+
+def _pipeline_stage_columns(conn: sqlite3.Connection):
+    # Intermediate state of the staged Celery pipeline (fetch -> download -> transcode):
+    # the stage a queued video is waiting for, the resolved video source and
+    # the downloaded file, so a stage can be retried or inspected on its own.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE videos ADD COLUMN stage TEXT;
+        ALTER TABLE videos ADD COLUMN source_url TEXT;
+        ALTER TABLE videos ADD COLUMN source_path TEXT;
+        """,
+    )
+
+
+def _local_runner_claims(conn: sqlite3.Connection):
+    # Which local task runner (hostname:pid) claimed a processing link and
+    # when, so links claimed by a runner that died can be put back in the queue.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE videos ADD COLUMN claimed_by TEXT;
+        ALTER TABLE videos ADD COLUMN claimed_at INTEGER;
+        """,
+    )
+
+
+def _job_lease_columns(conn: sqlite3.Connection):
+    # Job lifecycle (utils/job_lifecycle.py): the number of processing attempts,
+    # the unix time the current attempt's lease runs out and its last
+    # heartbeat, and when a retried link is due again. The reaper finds
+    # expired leases through idx_videos_status_id, since only queued and
+    # processing rows are checked.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE videos ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE videos ADD COLUMN lease_expires_at INTEGER;
+        ALTER TABLE videos ADD COLUMN heartbeat_at INTEGER;
+        ALTER TABLE videos ADD COLUMN next_attempt_at INTEGER;
+        """,
+    )
+
+
+def _host_limit_tables(conn: sqlite3.Connection):
+    # Token buckets and download slots shared by all workers (utils/host_limits.py)
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS host_buckets (
+            host TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS host_slots (
+            host TEXT NOT NULL,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (host, holder)
+        ) WITHOUT ROWID;
+        """,
+    )
+
+
+def _content_dedup_columns(conn: sqlite3.Connection):
+    # canonical_url is the duplicate check key for uploads (utils/canonical_url.py);
+    # content_hash the fingerprint of the source video (utils/fingerprint.py),
+    # which also names the preview file. The source_url index lets a new
+    # upload of an already processed video reuse its preview right away, the
+    # preview_path index lets deletes check whether a preview is still shared.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE videos ADD COLUMN canonical_url TEXT;
+        ALTER TABLE videos ADD COLUMN content_hash TEXT;
+
+        CREATE INDEX IF NOT EXISTS idx_videos_canonical_url ON videos(canonical_url);
+        CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos(content_hash)
+            WHERE content_hash IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_videos_source_url ON videos(source_url)
+            WHERE source_url IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_videos_preview_path ON videos(preview_path)
+            WHERE preview_path IS NOT NULL;
+        """,
+    )
+    rows = conn.execute("SELECT id, url FROM videos").fetchall()
+    conn.executemany(
+        "UPDATE videos SET canonical_url = ? WHERE id = ?",
+        [(canonicalize_url(url), video_id) for video_id, url in rows],
+    )
+
+
+# (version, description, migration) - versions must be consecutive
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "initial videos and videos_fts schema", _initial_schema),
+    (2, "trigger-maintained videos_fts", _fts_sync_triggers),
+    (3, "ready_stats counter", _ready_counter),
+    (4, "created_at/duration/size columns and listing indexes", _media_columns_and_indexes),
+    (5, "pipeline stage columns", _pipeline_stage_columns),
+    (6, "local runner claim columns", _local_runner_claims),
+    (7, "job lease and retry columns", _job_lease_columns),
+    (8, "host rate limit tables", _host_limit_tables),
+    (9, "canonical url and content hash columns", _content_dedup_columns),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(database_path: str) -> int:
+    """
+    Brings the database at `database_path` up to LATEST_VERSION.
+
+    Returns the number of migrations applied. Runs ANALYZE afterwards if the
+    schema changed so the query planner knows about new indexes, and
+    `PRAGMA optimize` on every call to keep statistics fresh.
+    """
+    os.makedirs(os.path.dirname(database_path), exist_ok=True)
+    conn = sqlite3.connect(database_path, timeout=30, isolation_level=None)
+    applied = 0
+    try:
+        for version, description, migrate in MIGRATIONS:
+            if get_schema_version(conn) >= version:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                if get_schema_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+
+                started = time.perf_counter()
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                logger.error(f"Migration {version} ({description}) failed, rolled back")
+                raise
+
+            applied += 1
+            logger.info(
+                f"Applied migration {version}: {description} ({time.perf_counter() - started:.2f}s)"
+            )
+
+        if applied:
+            conn.execute("ANALYZE")
+            logger.info(f"Database schema migrated to version {LATEST_VERSION}")
+        else:
+            logger.debug(f"Database schema already at version {get_schema_version(conn)}")
+        conn.execute("PRAGMA optimize")
+        return applied
+    finally:
+        conn.close()
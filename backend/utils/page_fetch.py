@@ -0,0 +1,112 @@
+"""
+Page acquisition: fetch or render each uploaded URL at most once.
+
+`acquire_page` first tries a plain HTTP GET. It renders the page with the
+pooled Chromium only if the host answers 403 or the static HTML has no video
+source. While rendering, every media request the page makes (`.mp4`, `.m3u8`,
+...) is recorded. Players that build their <video> from script, or feed it
+through MediaSource, still reveal the file that way. The resulting PageResult
+is shared by the title, poster and video source extraction (see
+utils/extractors.py).
+"""
+
+import re
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable
+
+import requests
+from bs4 import BeautifulSoup
+from playwright.sync_api import TimeoutError
+from utils.browser_pool import browser_pool
+from utils.downloader import get_session
+from utils.host_limits import throttle_host, wait_for_host
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.page_fetch")
+
+MEDIA_URL_PATTERN = re.compile(r"\.(mp4|webm|mov|m4v|mkv|m3u8|mpd)(?:$|[?#])", re.IGNORECASE)
+
+
+@dataclass
+class PageResult:
+    url: str
+    final_url: str
+    html: str
+    rendered: bool = False
+    # Media URLs requested while rendering, in request order
+    media_urls: list[str] = field(default_factory=list)
+
+    @cached_property
+    def soup(self) -> BeautifulSoup:
+        """Parsed lazily, so extractors that only need the raw html skip the parse."""
+        return BeautifulSoup(self.html, features="html.parser")
+
+
+def fetch_page(url: str, headers: dict) -> PageResult:
+    """Plain GET. Raises requests.exceptions.HTTPError for error statuses."""
+    logger.debug(f"Fetching page content for URL: {url}")
+    wait_for_host(url)
+    response = get_session().get(url, headers=headers, timeout=20)
+    if response.status_code == 429:
+        throttle_host(url, response.headers.get("Retry-After"))
+    response.raise_for_status()
+    logger.debug("Successfully fetched page content with requests")
+    return PageResult(
+        url=url,
+        final_url=response.url,
+        html=response.text,
+    )
+
+
+def render_page(url: str) -> PageResult:
+    """Renders `url` in the pooled browser, waiting briefly for a <video> element."""
+    logger.debug(f"Rendering page with Playwright: {url}")
+    media_urls: list[str] = []
+
+    def record_media(request):
+        if request.resource_type == "media" or MEDIA_URL_PATTERN.search(request.url):
+            if request.url not in media_urls:
+                media_urls.append(request.url)
+
+    def render(page) -> tuple[str, str]:
+        page.on("request", record_media)
+        page.goto(url, timeout=30000)
+        try:
+            page.wait_for_selector("video", timeout=10000, state="attached")
+        except TimeoutError:
+            logger.debug("No <video> element appeared while rendering")
+        return page.content(), page.url
+
+    wait_for_host(url)
+    html, final_url = browser_pool.run(render)
+
+    logger.debug(f"Rendered page, captured {len(media_urls)} media requests")
+    return PageResult(
+        url=url,
+        final_url=final_url,
+        html=html,
+        rendered=True,
+        media_urls=media_urls,
+    )
+
+
+def acquire_page(url: str, headers: dict, has_video: Callable[[PageResult], bool]) -> PageResult:
+    """
+    Returns the page for `url`, rendering it only when needed.
+
+    `has_video` decides whether a statically fetched page is good enough.
+    """
+    try:
+        page = fetch_page(url, headers)
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 403:
+            logger.warning(f"HTTP 403 error, trying Playwright for URL: {url}")
+            return render_page(url)
+        logger.error(f"HTTP error {e.response.status_code} for URL: {url}")
+        raise
+
+    if has_video(page):
+        return page
+    logger.debug("No video source found in HTML, trying Playwright")
+    return render_page(url)
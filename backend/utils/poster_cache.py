@@ -0,0 +1,209 @@
+"""
+Local cache of poster thumbnails.
+
+A link's poster (the og:image or similar found on its page) is fetched once,
+when the link becomes ready (backfill_posters.py does the same for links
+that were ready before the cache existed). ffmpeg then turns it into small images at every
+width in POSTER_WIDTHS and in every format in POSTER_FORMATS: WebP by
+default, and AVIF as well if `avif` is added and ffmpeg has libaom-av1.
+Links without a usable poster get one cut from their preview instead.
+/api/poster/{preview_id} serves the thumbnails, so clients never hot-link
+third-party hosts.
+
+The cache is bounded by POSTER_CACHE_MAX_BYTES. Serving a thumbnail bumps
+its access time, and the least recently served thumbnails are evicted. An
+evicted poster is rendered again on its next request.
+"""
+
+import os
+import time
+import uuid
+
+import ffmpeg
+import requests
+from utils.downloader import DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT, get_session
+from utils.host_limits import HOST_MAX_WAIT_SECONDS, HostThrottledError, wait_for_host
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.poster_cache")
+
+_backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTER_CACHE_DIR = os.getenv("POSTER_CACHE_DIR", os.path.join(_backend_dir, "routes", "preview", "posters"))
+POSTER_WIDTHS = tuple(sorted(int(width) for width in os.getenv("POSTER_WIDTHS", "320,640").split(",") if width.strip()))
+POSTER_FORMATS = tuple(fmt.strip().lower() for fmt in os.getenv("POSTER_FORMATS", "webp").split(",") if fmt.strip())
+POSTER_QUALITY = int(os.getenv("POSTER_QUALITY", "75"))
+POSTER_CACHE_MAX_BYTES = int(os.getenv("POSTER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Larger remote images are not fetched
+POSTER_MAX_SOURCE_BYTES = int(os.getenv("POSTER_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+# Access times are only bumped this often (seconds), so serving doesn't write on every hit
+POSTER_TOUCH_INTERVAL = 3600
+
+POSTER_ENCODERS = {
+    "webp": {"vcodec": "libwebp", "quality": POSTER_QUALITY},
+    "avif": {"vcodec": "libaom-av1", "still-picture": 1, "crf": 35, "cpu-used": 6, "pix_fmt": "yuv420p"},
+}
+
+for _format in POSTER_FORMATS:
+    if _format not in POSTER_ENCODERS:
+        raise ValueError(f"Unknown POSTER_FORMATS entry '{_format}', expected one of {', '.join(POSTER_ENCODERS)}")
+
+os.makedirs(POSTER_CACHE_DIR, exist_ok=True)
+
+
+def get_poster_path(preview_id: str, width: int, format: str) -> str:
+    return os.path.join(POSTER_CACHE_DIR, f"{preview_id}.{width}.{format}")
+
+
+def select_poster_width(width: int | None) -> int:
+    """The smallest configured width of at least `width`, or the largest one."""
+    if width is not None:
+        for candidate in POSTER_WIDTHS:
+            if candidate >= width:
+                return candidate
+    return POSTER_WIDTHS[-1]
+
+
+def touch_poster(path: str):
+    """Marks a thumbnail as recently served. The mtime is kept, since ETags derive from it."""
+    try:
+        stat_result = os.stat(path)
+        now = time.time()
+        if now - stat_result.st_atime > POSTER_TOUCH_INTERVAL:
+            os.utime(path, (now, stat_result.st_mtime))
+    except OSError:
+        pass
+
+
+def _fetch_remote_poster(poster_url: str, headers: dict, save_path: str, max_wait: float) -> bool:
+    try:
+        wait_for_host(poster_url, max_wait)
+        with get_session().get(
+            poster_url, headers=headers, stream=True, timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+        ) as response:
+            response.raise_for_status()
+            received = 0
+            with open(save_path, "wb") as f:
+                for chunk in response.iter_content(64 * 1024):
+                    received += len(chunk)
+                    if received > POSTER_MAX_SOURCE_BYTES:
+                        logger.warning(f"Poster {poster_url} is larger than {POSTER_MAX_SOURCE_BYTES} bytes, skipping it")
+                        return False
+                    f.write(chunk)
+        return received > 0
+    except (requests.exceptions.RequestException, HostThrottledError, OSError) as e:
+        logger.warning(f"Could not fetch poster {poster_url}: {e}")
+        return False
+
+
+def render_posters(source: str, preview_id: str):
+    """
+    Renders every configured thumbnail of `preview_id` from the first frame
+    of `source` (an image or a video) in one ffmpeg run.
+
+    Raises ffmpeg.Error if ffmpeg fails.
+    """
+    targets = [(width, format) for width in POSTER_WIDTHS for format in POSTER_FORMATS]
+    token = uuid.uuid4().hex[:8]
+    partial_paths = {
+        target: os.path.join(POSTER_CACHE_DIR, f"{preview_id}.{target[0]}.{token}.part.{target[1]}")
+        for target in targets
+    }
+    split = ffmpeg.input(source).video.split()
+    outputs = [
+        split.stream(index)
+        # Never upscales; even heights keep the AV1 encoder happy
+        .filter("scale", f"min({width},iw)", -2)
+        .output(partial_paths[(width, format)], **{"frames:v": 1}, **POSTER_ENCODERS[format])
+        for index, (width, format) in enumerate(targets)
+    ]
+    try:
+        ffmpeg.merge_outputs(*outputs).run(overwrite_output=True, quiet=True)
+        for (width, format), partial_path in partial_paths.items():
+            os.replace(partial_path, get_poster_path(preview_id, width, format))
+    finally:
+        for partial_path in partial_paths.values():
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+
+def cache_poster(
+    preview_id: str,
+    poster_url: str | None,
+    headers: dict,
+    preview_sources: list[str],
+    max_wait: float = HOST_MAX_WAIT_SECONDS,
+) -> bool:
+    """
+    Fills the cache for `preview_id` from its remote `poster_url` or, failing
+    that, from the first existing file in `preview_sources` (e.g. the
+    preview's poster frame or the preview itself). Returns False if no
+    thumbnail could be made.
+
+    The remote poster is skipped if its host's rate limit would delay the
+    fetch by more than `max_wait` seconds.
+    """
+    download_path = os.path.join(POSTER_CACHE_DIR, f"{preview_id}.{uuid.uuid4().hex[:8]}.source")
+    try:
+        sources = []
+        if poster_url and _fetch_remote_poster(poster_url, headers, download_path, max_wait):
+            sources.append(download_path)
+        sources.extend(path for path in preview_sources if os.path.exists(path))
+
+        for source in sources:
+            try:
+                render_posters(source, preview_id)
+                logger.info(f"Cached poster of preview_id {preview_id} from {'remote' if source == download_path else source}")
+                evict_posters()
+                return True
+            except ffmpeg.Error as e:
+                logger.warning(f"Could not render poster of preview_id {preview_id} from {source}: {e.stderr.decode()}")
+        return False
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
+
+
+def evict_posters(max_bytes: int = POSTER_CACHE_MAX_BYTES) -> int:
+    """
+    Removes the least recently served thumbnails until the cache is back
+    under 90% of `max_bytes`. Returns the number of files removed.
+    """
+    entries = []
+    total = 0
+    with os.scandir(POSTER_CACHE_DIR) as it:
+        for entry in it:
+            # Renders in progress are not cache entries yet
+            if not entry.is_file() or ".part." in entry.name or entry.name.endswith(".source"):
+                continue
+            stat_result = entry.stat()
+            entries.append((stat_result.st_atime, stat_result.st_size, entry.path))
+            total += stat_result.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info(f"Evicted {removed} posters, cache now holds {total} bytes")
+    return removed
+
+
+def has_posters(preview_id: str) -> bool:
+    return all(
+        os.path.exists(get_poster_path(preview_id, width, format)) for width in POSTER_WIDTHS for format in POSTER_FORMATS
+    )
+
+
+def delete_posters(preview_id: str):
+    for width in POSTER_WIDTHS:
+        for format in POSTER_FORMATS:
+            path = get_poster_path(preview_id, width, format)
+            if os.path.exists(path):
+                os.remove(path)
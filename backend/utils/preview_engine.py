@@ -0,0 +1,263 @@
+"""
+Builds and runs the ffmpeg command that turns a source video into a preview.
+
+A preview is a series of one second excerpts spread evenly over the source.
+There are two ways to cut them, and which one is faster depends on the source:
+
+- "select": a single input and a `select` filter that keeps only the frames
+  inside the excerpts. The file is opened and demuxed once, but every frame is
+  decoded, so this wins for short sources.
+- "seek": one input per excerpt with keyframe-aligned input seeking
+  (`-ss` before `-i` plus `-noaccurate_seek`). Only a few GOPs around each
+  excerpt are decoded, which is what matters for multi-hour sources.
+
+"auto" (the default) picks "select" for sources up to
+PREVIEW_SELECT_MAX_DURATION seconds and "seek" above that. Remote sources
+(read straight from an http(s) URL) always use "seek" under "auto", so only
+the byte ranges around each excerpt are fetched.
+
+Besides the full preview, every preview gets a set of renditions (see
+`render_renditions`): smaller MP4s and WebMs for each height in
+PREVIEW_RENDITION_HEIGHTS, an animated WebP for hover effects and a JPEG
+poster frame. They are cut from the finished preview rather than the source,
+so they cost one cheap extra ffmpeg run and never refetch anything.
+
+Encoder settings come from the environment so they can be tuned per worker
+host without code changes. Run `python benchmarks/preview_engine.py` to
+compare the strategies on your own hardware.
+"""
+
+import math
+import os
+import time
+
+import ffmpeg
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.preview_engine")
+
+PREVIEW_STRATEGY = os.getenv("PREVIEW_STRATEGY", "auto")
+PREVIEW_SELECT_MAX_DURATION = float(os.getenv("PREVIEW_SELECT_MAX_DURATION", "600"))
+PREVIEW_CLIP_SECONDS = float(os.getenv("PREVIEW_CLIP_SECONDS", "1"))
+PREVIEW_VIDEO_CODEC = os.getenv("PREVIEW_VIDEO_CODEC", "libx264")
+PREVIEW_PRESET = os.getenv("PREVIEW_PRESET", "veryfast")
+PREVIEW_CRF = int(os.getenv("PREVIEW_CRF", "23"))
+# 0 lets ffmpeg pick one thread per core. Unset, workers running several jobs
+# at once give each ffmpeg its share of the cores (see set_job_concurrency).
+PREVIEW_THREADS = int(os.getenv("PREVIEW_THREADS", "0"))
+# Frame rate of "select" previews. Variable frame rate sources have no
+# FRAME_RATE for setpts to renumber the kept frames with, so they are
+# converted to this constant rate first.
+PREVIEW_SELECT_FPS = float(os.getenv("PREVIEW_SELECT_FPS", "30"))
+
+# Empty disables the smaller renditions
+PREVIEW_RENDITION_HEIGHTS = tuple(
+    sorted(int(height) for height in os.getenv("PREVIEW_RENDITION_HEIGHTS", "240,480").split(",") if height.strip())
+)
+# libvpx-vp9, or an AV1 encoder such as libaom-av1; empty skips the WebM renditions
+PREVIEW_WEBM_CODEC = os.getenv("PREVIEW_WEBM_CODEC", "libvpx-vp9")
+PREVIEW_WEBM_CRF = int(os.getenv("PREVIEW_WEBM_CRF", "36"))
+PREVIEW_HOVER_HEIGHT = int(os.getenv("PREVIEW_HOVER_HEIGHT", "180"))
+PREVIEW_HOVER_FPS = float(os.getenv("PREVIEW_HOVER_FPS", "8"))
+PREVIEW_POSTER_HEIGHT = int(os.getenv("PREVIEW_POSTER_HEIGHT", "480"))
+
+STRATEGIES = ("auto", "select", "seek")
+
+
+def set_job_concurrency(concurrency: int):
+    """
+    Caps ffmpeg at cores / `concurrency` threads, for a worker process that
+    runs `concurrency` preview jobs at once; otherwise every ffmpeg would use
+    every core. An explicit PREVIEW_THREADS wins.
+    """
+    global PREVIEW_THREADS
+    if "PREVIEW_THREADS" in os.environ or concurrency <= 1:
+        return
+    PREVIEW_THREADS = max(1, (os.cpu_count() or 1) // concurrency)
+    logger.info(f"Running ffmpeg with {PREVIEW_THREADS} threads for {concurrency} concurrent jobs")
+
+
+def get_clip_count(
+    duration: float, BaseClips: int = 5, ScalingFactor: float = 1.5, n_cap: int = 30
+) -> int:
+    """N = floor(BaseClips + ScalingFactor * sqrt(DurationInMinutes)), capped at n_cap."""
+    num_clips = math.floor(BaseClips + ScalingFactor * math.sqrt(duration / 60))
+    return min(num_clips, n_cap)
+
+
+def get_clip_starts(duration: float, num_clips: int) -> list[float]:
+    """Start times of `num_clips` excerpts, each centered in an equal slice of the video."""
+    interval = duration / num_clips
+    return [(i + 0.5) * interval for i in range(num_clips)]
+
+
+def is_remote_source(input_path: str) -> bool:
+    return input_path.startswith(("http://", "https://"))
+
+
+def resolve_strategy(duration: float, strategy: str = PREVIEW_STRATEGY, remote: bool = False) -> str:
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown preview strategy '{strategy}', expected one of {', '.join(STRATEGIES)}")
+    if strategy == "auto":
+        if remote:
+            return "seek"
+        return "select" if duration <= PREVIEW_SELECT_MAX_DURATION else "seek"
+    return strategy
+
+
+def _select_stream(input_path: str, starts: list[float], clip_seconds: float, input_options: dict):
+    expression = "+".join(f"between(t,{start:.3f},{start + clip_seconds:.3f})" for start in starts)
+    return (
+        ffmpeg.input(input_path, threads=PREVIEW_THREADS, **input_options)
+        # Before select: after it, fps would fill the gaps with duplicated frames
+        .video.filter("fps", PREVIEW_SELECT_FPS)
+        .filter("select", expression)
+        # Close the gaps left by the dropped frames
+        .filter("setpts", f"N/({PREVIEW_SELECT_FPS:g}*TB)")
+    )
+
+
+def _seek_stream(input_path: str, starts: list[float], clip_seconds: float, input_options: dict):
+    clips = [
+        ffmpeg.input(
+            input_path,
+            ss=f"{start:.3f}",
+            t=clip_seconds,
+            noaccurate_seek=None,
+            threads=PREVIEW_THREADS,
+            **input_options,
+        ).video.filter("setpts", "PTS-STARTPTS")  # Resets Timestamp for concatenation
+        for start in starts
+    ]
+    return ffmpeg.concat(*clips, v=1, a=0)
+
+
+def build_preview_command(
+    input_path: str,
+    output_path: str,
+    duration: float,
+    num_clips: int,
+    strategy: str = PREVIEW_STRATEGY,
+    clip_seconds: float = PREVIEW_CLIP_SECONDS,
+    input_options: dict | None = None,
+):
+    """
+    Returns the ffmpeg-python output node for a preview; call .run() or .compile() on it.
+
+    `input_options` are passed to every input, e.g. the HTTP `headers` for a remote source.
+    """
+    strategy = resolve_strategy(duration, strategy, is_remote_source(input_path))
+    starts = get_clip_starts(duration, num_clips)
+    if strategy == "select":
+        stream = _select_stream(input_path, starts, clip_seconds, input_options or {})
+    else:
+        stream = _seek_stream(input_path, starts, clip_seconds, input_options or {})
+
+    return stream.output(
+        output_path,
+        an=None,
+        vcodec=PREVIEW_VIDEO_CODEC,
+        preset=PREVIEW_PRESET,
+        crf=PREVIEW_CRF,
+        pix_fmt="yuv420p",
+        threads=PREVIEW_THREADS,
+        movflags="faststart",
+    )
+
+
+def render_preview(
+    input_path: str,
+    output_path: str,
+    duration: float,
+    num_clips: int,
+    strategy: str = PREVIEW_STRATEGY,
+    input_options: dict | None = None,
+) -> str:
+    """
+    Renders the preview to `output_path` and returns the strategy that was used.
+
+    Raises ffmpeg.Error if ffmpeg fails.
+    """
+    resolved = resolve_strategy(duration, strategy, is_remote_source(input_path))
+    started = time.perf_counter()
+    build_preview_command(
+        input_path, output_path, duration, num_clips, resolved, input_options=input_options
+    ).run(overwrite_output=True, quiet=True)
+    logger.info(
+        f"Rendered {num_clips} clips with the '{resolved}' strategy in {time.perf_counter() - started:.2f}s"
+    )
+    return resolved
+
+
+def get_rendition_names() -> list[str]:
+    """
+    Suffixes of the renditions rendered next to a preview, e.g. `240.webm` is
+    stored as `<file_id>.240.webm` beside `<file_id>.mp4`.
+    """
+    names = []
+    for height in PREVIEW_RENDITION_HEIGHTS:
+        names.append(f"{height}.mp4")
+        if PREVIEW_WEBM_CODEC:
+            names.append(f"{height}.webm")
+    return names + ["hover.webp", "poster.jpg"]
+
+
+def _fit_height(stream, height: int):
+    # Never upscales, and keeps both dimensions even as yuv420p requires
+    return stream.filter("scale", -2, f"trunc(min({height},ih)/2)*2")
+
+
+def _webm_options() -> dict:
+    options = {"vcodec": PREVIEW_WEBM_CODEC, "crf": PREVIEW_WEBM_CRF, "b:v": 0, "pix_fmt": "yuv420p"}
+    if PREVIEW_WEBM_CODEC in ("libvpx-vp9", "libaom-av1"):
+        # Trade a little compression for a much faster encode
+        options.update({"cpu-used": 5, "row-mt": 1})
+    return options
+
+
+def build_renditions_command(input_path: str, output_paths: dict[str, str]):
+    """
+    Returns the ffmpeg-python node that renders the renditions named in
+    `output_paths` (see `get_rendition_names`) from a finished preview in one run.
+    """
+    # One decode of the preview feeds every output
+    split = ffmpeg.input(input_path, threads=PREVIEW_THREADS).video.split()
+    outputs = []
+    for index, (name, path) in enumerate(output_paths.items()):
+        source = split.stream(index)
+        label, extension = name.split(".")
+        if name == "hover.webp":
+            stream = _fit_height(source.filter("fps", PREVIEW_HOVER_FPS), PREVIEW_HOVER_HEIGHT)
+            outputs.append(stream.output(path, vcodec="libwebp", loop=0, quality=60, an=None))
+        elif name == "poster.jpg":
+            stream = _fit_height(source, PREVIEW_POSTER_HEIGHT)
+            outputs.append(stream.output(path, **{"frames:v": 1, "q:v": 3}))
+        elif extension == "webm":
+            outputs.append(
+                _fit_height(source, int(label)).output(path, an=None, threads=PREVIEW_THREADS, **_webm_options())
+            )
+        else:
+            outputs.append(
+                _fit_height(source, int(label)).output(
+                    path,
+                    an=None,
+                    vcodec=PREVIEW_VIDEO_CODEC,
+                    preset=PREVIEW_PRESET,
+                    crf=PREVIEW_CRF,
+                    pix_fmt="yuv420p",
+                    threads=PREVIEW_THREADS,
+                    movflags="faststart",
+                )
+            )
+    return ffmpeg.merge_outputs(*outputs)
+
+
+def render_renditions(input_path: str, output_paths: dict[str, str]):
+    """
+    Renders the renditions in `output_paths` from the preview at `input_path`.
+
+    Raises ffmpeg.Error if ffmpeg fails.
+    """
+    started = time.perf_counter()
+    build_renditions_command(input_path, output_paths).run(overwrite_output=True, quiet=True)
+    logger.info(f"Rendered {len(output_paths)} renditions in {time.perf_counter() - started:.2f}s")
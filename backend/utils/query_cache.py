@@ -0,0 +1,93 @@
+"""
+Small in-process LRU caches.
+
+GenerationLRUCache ties its entries to a data generation. Callers pass the current generation (e.g. `ready_stats.generation`) on every
+lookup; when it differs from the one the cache was filled under, everything is
+dropped. Because the generation lives in the database, writes done by other
+processes (Celery workers, other API workers) invalidate the cache as well.
+
+TTLLRUCache is for lookups that must not touch the database at all; its
+entries simply expire after `ttl` seconds, which bounds how long another
+process' writes go unnoticed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class GenerationLRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._generation: int | None = None
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def _sync_generation(self, generation: int):
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Any | None:
+        """Returns the cached value for `key`, or None if missing or stale."""
+        with self._lock:
+            self._sync_generation(generation)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        """Stores `value` unless the cache has already moved past `generation`."""
+        with self._lock:
+            if self._generation is not None and generation < self._generation:
+                return
+            self._sync_generation(generation)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+
+class TTLLRUCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Returns the cached value for `key`, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,135 @@
+"""
+Random sampling of ready videos without ORDER BY RANDOM().
+
+The sampler keeps the ids of all ready videos in memory and only reloads them
+(an index-only scan) when the trigger-maintained `generation` in `ready_stats`
+changes. Drawing a sample is then O(limit) and only the chosen rows are read
+from the database.
+"""
+
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from utils.logging_config import get_logger
+
+logger = get_logger("sampling")
+
+MAX_SHUFFLE_SESSIONS = int(os.getenv("SHUFFLE_SESSION_CACHE_SIZE", "16"))
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """splitmix64 finalizer: a cheap, well distributed 64 bit integer hash."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def session_seed(session: str) -> int:
+    """Derives a stable integer seed from a client supplied session token."""
+    seed = 0
+    for byte in session.encode("utf-8"):
+        seed = _mix64(seed ^ byte)
+    return seed
+
+
+def _permute(index: int, size: int, seed: int) -> int:
+    """
+    Position of `index` in a pseudo-random permutation of range(size).
+
+    A four round Feistel network over the smallest even number of bits that
+    covers `size` is a bijection; results outside the range are fed back in
+    (cycle walking) until one lands inside it.
+    """
+    bits = max(2, (size - 1).bit_length())
+    half_bits = (bits + 1) // 2
+    mask = (1 << half_bits) - 1
+    round_keys = [_mix64(seed ^ round_number) for round_number in range(4)]
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_key in round_keys:
+            left, right = right, left ^ (_mix64(round_key ^ right) & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+class ReadyIdSampler:
+    """
+    In-memory index of ready video ids used for random and shuffled listings.
+
+    `load_generation` returns the current ready-set generation and `load_ids`
+    the ids of all ready videos; both are only called when needed.
+    """
+
+    def __init__(
+        self,
+        load_generation: Callable[[], int],
+        load_ids: Callable[[], list[int]],
+        max_sessions: int = MAX_SHUFFLE_SESSIONS,
+    ):
+        self._load_generation = load_generation
+        self._load_ids = load_ids
+        self._max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._generation: int | None = None
+        self._ids: list[int] = []
+        # Session -> the ready ids when it started. Sessions of one generation
+        # share its list, which is replaced on reload and never modified.
+        self._shuffles: OrderedDict[str, list[int]] = OrderedDict()
+
+    def _current_ids(self) -> tuple[int, list[int]]:
+        """Returns the cached ready ids, reloading them if the ready set changed."""
+        generation = self._load_generation()
+        with self._lock:
+            if generation != self._generation:
+                self._ids = self._load_ids()
+                self._generation = generation
+                logger.debug(
+                    f"Reloaded {len(self._ids)} ready ids for generation {generation}"
+                )
+            return self._generation, self._ids
+
+    def sample(self, limit: int, seed: int | None = None) -> list[int]:
+        """
+        Picks up to `limit` distinct random ready ids.
+
+        With a `seed` the result is reproducible for as long as the set of
+        ready videos does not change.
+        """
+        _, ids = self._current_ids()
+        rng = random.Random(seed) if seed is not None else random
+        return rng.sample(ids, min(limit, len(ids)))
+
+    def shuffle_page(self, session: str, offset: int, limit: int) -> tuple[list[int], int]:
+        """
+        Returns one page of a session's shuffled order together with its total size.
+
+        Every session walks its own fixed permutation of the videos that were
+        ready when it started, so consecutive pages never repeat or skip a
+        video. Videos added later show up in new sessions; deleted ones are
+        dropped when their rows are read. Pages are computed in O(limit)
+        without materializing the permutation.
+        """
+        with self._lock:
+            ids = self._shuffles.get(session)
+            if ids is not None:
+                self._shuffles.move_to_end(session)
+        if ids is None:
+            _, current = self._current_ids()
+            with self._lock:
+                # Another request of the same session may have started it meanwhile
+                ids = self._shuffles.setdefault(session, current)
+                self._shuffles.move_to_end(session)
+                if len(self._shuffles) > self._max_sessions:
+                    self._shuffles.popitem(last=False)
+
+        seed = session_seed(session)
+        end = min(offset + limit, len(ids))
+        return [ids[_permute(index, len(ids), seed)] for index in range(offset, end)], len(ids)
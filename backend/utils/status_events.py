@@ -0,0 +1,139 @@
+"""
+Processing status events, published by whoever changes a link's status and
+pushed to API clients over Server-Sent Events (see routes/status.py).
+
+Workers publish every transition (queued -> processing/<stage> -> ready or
+failed) to the STATUS_CHANNEL Redis channel. Each API process runs a single
+StatusBroadcaster that subscribes to that channel once and fans the events
+out to its connected clients, so clients no longer have to poll
+/api/preview/{preview_id} to find out when a preview is ready.
+
+Publishing is best effort: a missing Redis only costs the live updates, never
+the processing itself. The local task backend needs no Redis at all: it
+installs an event sink that routes events straight to its own broadcaster.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable
+
+import redis
+import redis.asyncio as aioredis
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.status_events")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATUS_CHANNEL = os.getenv("STATUS_CHANNEL", "smd:status")
+# Events buffered per SSE client before the oldest ones are dropped
+STATUS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("STATUS_SUBSCRIBER_QUEUE_SIZE", "256"))
+
+_client: redis.Redis | None = None
+_client_pid: int | None = None
+_client_lock = threading.Lock()
+# Replaces Redis as the event transport when set (see set_event_sink)
+_event_sink: Callable[[dict], None] | None = None
+
+
+def set_event_sink(sink: Callable[[dict], None] | None):
+    """Sends published events to `sink` instead of Redis; None restores Redis."""
+    global _event_sink
+    _event_sink = sink
+
+
+def _get_client() -> redis.Redis:
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+            _client_pid = os.getpid()
+        return _client
+
+
+def status_event(preview_id: str, status: str, stage: str | None = None, **details) -> dict:
+    return {"preview_id": preview_id, "status": status, "stage": stage, "time": time.time(), **details}
+
+
+def publish_status_events(events: list[dict]):
+    """Publishes several events in one round trip."""
+    if not events:
+        return
+    if _event_sink is not None:
+        for event in events:
+            _event_sink(event)
+        return
+    try:
+        pipe = _get_client().pipeline(transaction=False)
+        for event in events:
+            pipe.publish(STATUS_CHANNEL, json.dumps(event))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish {len(events)} status event(s): {e}")
+
+
+def publish_status(preview_id: str, status: str, stage: str | None = None, **details):
+    publish_status_events([status_event(preview_id, status, stage, **details)])
+
+
+class StatusBroadcaster:
+    """Relays STATUS_CHANNEL to in-process subscriber queues."""
+
+    def __init__(self):
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Returns a queue that receives every event published from now on."""
+        if _event_sink is None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STATUS_SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def deliver(self, event: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow client loses its oldest events rather than stalling everyone
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            client = aioredis.Redis.from_url(REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(STATUS_CHANNEL)
+                    logger.info(f"Subscribed to status channel '{STATUS_CHANNEL}'")
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        try:
+                            self.deliver(json.loads(message["data"]))
+                        except ValueError:
+                            logger.warning("Ignoring malformed status event")
+            except redis.RedisError as e:
+                logger.warning(f"Status channel unavailable ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await client.aclose()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+status_broadcaster = StatusBroadcaster()
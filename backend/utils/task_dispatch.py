@@ -0,0 +1,52 @@
+"""
+Hands newly queued links to the configured execution backend.
+
+SMD_TASK_BACKEND selects it:
+
+- `celery` (default): Celery workers fed through Redis (utils/upload_link.py)
+- `local`: utils/local_runner.py, worker processes owned by the API itself
+"""
+
+import os
+
+from utils.logging_config import get_logger
+
+logger = get_logger("utils.task_dispatch")
+
+TASK_BACKEND = os.getenv("SMD_TASK_BACKEND", "celery")
+TASK_BACKENDS = ("celery", "local")
+
+if TASK_BACKEND not in TASK_BACKENDS:
+    raise ValueError(f"Unknown SMD_TASK_BACKEND '{TASK_BACKEND}', expected one of {', '.join(TASK_BACKENDS)}")
+
+
+def enqueue_links(items: list[dict], delay: float | None = None):
+    """
+    Starts processing for links already stored as 'queued'.
+
+    `items` are dicts with `url` and `preview_id`, as returned by add_links_bulk.
+    `delay` postpones processing by that many seconds (used for retries).
+    """
+    if not items:
+        return
+
+    if TASK_BACKEND == "local":
+        from utils.local_runner import local_runner
+
+        # The runner claims the rows from the database itself, once they are due
+        local_runner.wake()
+        return
+
+    from celery import group
+    from utils.upload_link import process_link_task
+
+    if len(items) == 1:
+        process_link_task.apply_async((items[0]["url"], items[0]["preview_id"]), countdown=delay)
+    else:
+        group(process_link_task.s(item["url"], item["preview_id"]) for item in items).apply_async(
+            countdown=delay
+        )
+
+
+def enqueue_link(url: str, preview_id: str, delay: float | None = None):
+    enqueue_links([{"url": url, "preview_id": preview_id}], delay)
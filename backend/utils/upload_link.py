@@ -1,17 +1,44 @@
-import math
 import os
 import re
-from pathlib import PurePosixPath
-from urllib.parse import urlparse
+from contextlib import nullcontext
 
 import ffmpeg
-import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
-from celery import Celery
-from playwright.sync_api import TimeoutError, sync_playwright
-from utils.db_utils import update_link_to_failed, update_link_to_ready
+from celery import Celery, chain
+from celery.signals import worker_init, worker_process_shutdown, worker_shutdown
+from utils.browser_pool import browser_pool
+from utils.db_utils import (
+    DATABASE_PATH,
+    close_db_connections,
+    find_reusable_preview,
+    mark_link_processing,
+    update_link_stage,
+    update_link_to_ready,
+)
+from utils.downloader import DEFAULT_HEADERS, DownloadError, download_file, get_range_support
+from utils.extractors import extract_video_info
+from utils.fingerprint import fingerprint_file, fingerprint_url
+from utils.host_limits import host_download_slot, wait_for_host
+from utils.job_lifecycle import (
+    JOB_LEASE_SECONDS,
+    JOB_QUEUE_TIMEOUT_SECONDS,
+    JOB_REAPER_INTERVAL_SECONDS,
+    is_transient,
+    job_heartbeat,
+    reap_expired_jobs,
+    retry_or_fail,
+    start_job_stage,
+)
 from utils.logging_config import get_logger
+from utils.migrations import apply_migrations
+from utils.poster_cache import cache_poster
+from utils.preview_engine import (
+    get_clip_count,
+    get_rendition_names,
+    render_preview,
+    render_renditions,
+    set_job_concurrency,
+)
+from utils.status_events import publish_status
 
 # Initialize logger for upload processing
 logger = get_logger("utils.upload_link")
@@ -23,126 +50,116 @@ celery_app = Celery(
     backend="redis://localhost:6379/0",  # Where to store results (optional)
 )
 
+# With CELERY_STAGE_QUEUES=1 each pipeline stage has its own queue so I/O and
+# CPU work scale separately:
+#
+#   celery -A utils.upload_link worker -Q fetch -P threads -c 8
+#   celery -A utils.upload_link worker -Q download -P threads -c 16
+#   celery -A utils.upload_link worker -Q transcode -P prefork -c $(nproc)
+#
+# Not gevent: SQLite, pwrite and the downloader's segment threads all block
+# its hub, and its patched thread locals give every task its own connection.
+#
+# Off by default, so everything stays on the default "celery" queue that a
+# plain `celery -A utils.upload_link worker` consumes.
+CELERY_STAGE_QUEUES = os.getenv("CELERY_STAGE_QUEUES", "0") == "1"
+STAGE_TASK_ROUTES = {
+    "utils.upload_link.process_link_task": {"queue": "fetch"},
+    "utils.upload_link.download_source_task": {"queue": "download"},
+    "utils.upload_link.transcode_preview_task": {"queue": "transcode"},
+    "utils.upload_link.reap_expired_jobs_task": {"queue": "fetch"},
+}
+celery_app.conf.update(
+    task_routes=STAGE_TASK_ROUTES if CELERY_STAGE_QUEUES else {},
+    # Stages can run for minutes, so don't let one worker reserve a backlog
+    worker_prefetch_multiplier=1,
+    # Requeues links whose worker died or whose task message was lost;
+    # needs `celery -A utils.upload_link beat` (or a worker started with -B)
+    beat_schedule={
+        "reap-expired-jobs": {
+            "task": "utils.upload_link.reap_expired_jobs_task",
+            "schedule": JOB_REAPER_INTERVAL_SECONDS,
+        },
+    },
+)
 
-def get_url_identifier(url):
-    # Parse the URL to remove query parameters and fragments
-    parsed = urlparse(url)
-    # Get the path part and extract the last segment
-    last_segment = PurePosixPath(parsed.path).name
-    # Remove the extension if there is one
-    identifier = last_segment.split(".")[0]
-    return identifier
-
-
-def get_poster_url_from_video(soup: BeautifulSoup):
-    poster_url = None
-
-    # First, try the video tag's 'poster' attribute
-    video_tag = soup.find("video")
-    if isinstance(video_tag, Tag):
-        poster_url = video_tag.get("poster")
-
-    # If not found, try finding a div with class "fp-poster" containing an img tag
-    if poster_url is None:
-        fp_poster_div = soup.find("div", class_="fp-poster")
-        if isinstance(fp_poster_div, Tag):
-            img_tag = fp_poster_div.find("img")
-            if isinstance(img_tag, Tag):
-                poster_url = img_tag.get("src")
-
-    # As a final fallback, try the meta tag for "thumbnailUrl"
-    if poster_url is None:
-        meta_tag = soup.find("meta", attrs={"itemprop": "thumbnailUrl"})
-        if isinstance(meta_tag, Tag):
-            poster_url = meta_tag.get("content")
-
-    return poster_url
-
-
-def get_video_src_with_playwright(url: str):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        page.goto(url)
-        try:
-            page.wait_for_selector("video", timeout=10000, state="attached")
-            video_element = page.query_selector("video")
-        except TimeoutError:
-            video_element = None
-
-        if video_element:
-            src = video_element.get_attribute("src")
-            browser.close()
-            return src
-        else:
-            browser.close()
-            return None
+HEADERS = DEFAULT_HEADERS
 
+# "stream" cuts the preview straight from the remote file over HTTP range
+# requests when the host supports them and falls back to a full download
+# otherwise; "download" always downloads the whole file first.
+PREVIEW_SOURCE_MODE = os.getenv("PREVIEW_SOURCE_MODE", "stream")
+STREAM_READ_TIMEOUT = float(os.getenv("STREAM_READ_TIMEOUT", "20"))
 
-def fetch_page_with_playwright(url: str):
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        page.goto(url, timeout=30000)
-        html = page.content()
-        browser.close()
-        return BeautifulSoup(html, features="html.parser")
 
+@worker_init.connect
+def migrate_database_on_worker_start(**kwargs):
+    """Apply pending schema migrations once, before the worker starts consuming tasks."""
+    apply_migrations(DATABASE_PATH)
 
-def download_video(soup: BeautifulSoup, url: str, headers: dict):
-    logger.debug("Starting video source extraction")
-    video_src = None
-    video_tag = soup.find("video")
 
-    if isinstance(video_tag, Tag):
-        video_src = video_tag.get("src")
-        if not video_src:
-            source_tag = video_tag.find("source")
-            if not source_tag:
-                parent = video_tag.parent
-                if parent:
-                    source_tag = parent.find("source")
-            if isinstance(source_tag, Tag):
-                video_src = source_tag.get("src")
-
-    logger.debug(f"Found video source from HTML: {video_src}")
-    if not video_src:
-        logger.debug("No video source found in HTML, trying Playwright")
-        video_src = get_video_src_with_playwright(url)
-        logger.debug(f"Found video source with Playwright: {video_src}")
-    if not video_src:
-        logger.error("Could not find video source")
-        return None
+@worker_init.connect
+def share_cores_between_jobs(sender=None, **kwargs):
+    """Keep `-c N` concurrent ffmpeg runs from each using every core."""
+    concurrency = getattr(sender, "concurrency", None)
+    if concurrency:
+        set_job_concurrency(concurrency)
 
-    if not isinstance(video_src, str):
-        logger.error(f"Invalid video source type: {type(video_src)}")
-        return None
 
-    if video_src.startswith("//"):
-        video_src = "https:" + video_src
-        logger.debug(f"Fixed protocol-relative URL: {video_src}")
+@worker_process_shutdown.connect
+def close_worker_db_connections(**kwargs):
+    """Release the worker process' pooled database connections on shutdown."""
+    close_db_connections()
 
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    try:
-        with requests.get(video_src, headers=headers, stream=True) as r:
-            r.raise_for_status()
-            tmp_path = os.path.join(current_dir, "tmp")
-            os.makedirs(tmp_path, exist_ok=True)
-            save_path = os.path.join(tmp_path, get_url_identifier(video_src))
 
-            with open(save_path, "wb") as f:
-                logger.info(f"Downloading video to {save_path}")
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_worker_browser(**kwargs):
+    """
+    Close the worker process' pooled Chromium, if it ever started one.
+    worker_process_shutdown covers prefork children, worker_shutdown the
+    main process that runs the tasks of thread, gevent and solo pools.
+    """
+    browser_pool.shutdown()
+
 
+def download_video_src(video_src: str, headers: dict, preview_id: str):
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    tmp_path = os.path.join(current_dir, "tmp")
+    os.makedirs(tmp_path, exist_ok=True)
+    # Named after the job, not the URL: sources with the same file name must not
+    # share a part file, while a retry of the same job resumes it
+    save_path = os.path.join(tmp_path, preview_id)
+
+    try:
+        logger.info(f"Downloading video to {save_path}")
+        download_file(video_src, save_path, headers=headers)
         logger.info(f"Video download completed: {save_path}")
         return save_path
 
-    except requests.exceptions.RequestException as e:
+    except DownloadError as e:
+        if is_transient(e):
+            # Let the job be retried; the next attempt resumes the part file
+            raise
         logger.error(f"Failed to download video from {video_src}: {e}")
         return None
 
 
+def get_ffmpeg_http_options(headers: dict) -> dict:
+    """ffmpeg/ffprobe input options that make HTTP requests look like ours."""
+    return {
+        "headers": "".join(f"{name}: {value}\r\n" for name, value in headers.items()),
+        # Microseconds; without it a stalled host blocks the worker forever
+        "rw_timeout": int(STREAM_READ_TIMEOUT * 1_000_000),
+    }
+
+
+def get_video_duration(input_path: str, **probe_options) -> float:
+    """Returns the duration of a video in seconds using ffprobe."""
+    probe = ffmpeg.probe(input_path, **probe_options)
+    return float(probe["format"]["duration"])
+
+
 def generate_preview_from_video(
     input_path: str,
     output_path: str,
@@ -150,6 +167,8 @@ def generate_preview_from_video(
     BaseClips: int = 5,
     ScalingFactor: float = 1.5,
     n_cap: int = 30,
+    duration: float | None = None,
+    input_options: dict | None = None,
 ):
     """
     Generates a preview for a given video and saves it.
@@ -168,35 +187,24 @@ def generate_preview_from_video(
     - BaseClips is the minimum amount of clips and set to 5 by default.
     - ScalingFactor is set to 1.5 by default
     - N is capped at 30
+
+    Pass `duration` if the video was already probed to skip probing it again.
+    `input_path` may also be an http(s) URL, with `input_options` carrying the
+    request headers. How the clips are cut and encoded is decided in
+    utils/preview_engine.py.
     """
 
     try:
         logger.info(f"Processing {input_path} to create preview...")
         # Get video duration
-        probe = ffmpeg.probe(input_path)
-        duration = float(probe["format"]["duration"])
+        if duration is None:
+            duration = get_video_duration(input_path, **(input_options or {}))
 
         # Use formula to calculate number of clips
-        duration_min = duration / 60
-        num_clips = math.floor(BaseClips + ScalingFactor * math.sqrt(duration_min))
-
-        num_clips = min(num_clips, n_cap)
+        num_clips = get_clip_count(duration, BaseClips, ScalingFactor, n_cap)
         logger.info(f"Video Duration: {duration:.2f}s. Generating {num_clips} clips.")
 
-        interval = duration / num_clips
-        clips = []
-        for i in range(num_clips):
-            start_time = (i + 0.5) * interval
-            clip = ffmpeg.input(input_path, ss=start_time, t=1).filter(
-                "setpts", "PTS-STARTPTS"
-            )  # Resets Timestamp for concatenation
-            clips.append(clip)
-        # Concatenate Clips
-        (
-            ffmpeg.concat(*clips, v=1, a=0)
-            .output(output_path, movflags="faststart")
-            .run(overwrite_output=True, quiet=True)
-        )
+        render_preview(input_path, output_path, duration, num_clips, input_options=input_options)
         logger.info(f"Preview saved successfully to {output_path}")
         return file_id
     except ffmpeg.Error as e:
@@ -208,88 +216,359 @@ def generate_preview_from_video(
             logger.debug(f"Cleaned up temporary video at {input_path}")
 
 
-@celery_app.task
-def process_link_task(url: str, preview_id: str):
-    logger.info(f"Starting processing task for URL: {url}, preview_id: {preview_id}")
+def get_preview_output_path(file_id: str) -> str:
+    """
+    Returns the absolute path of the preview file `file_id` (the value stored
+    in videos.preview_path): the source's content fingerprint, or the
+    preview_id if the source could not be fingerprinted.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # utils/
+    parent_dir = os.path.dirname(current_dir)  # backend/
+    base_preview_path = os.path.join(parent_dir, "routes", "preview", "preview_videos")
+    os.makedirs(base_preview_path, exist_ok=True)
+    return os.path.join(base_preview_path, file_id + ".mp4")
+
+
+def get_rendition_path(file_id: str, name: str) -> str:
+    """Returns the absolute path of rendition `name` (e.g. `240.webm`) of preview `file_id`."""
+    return f"{get_preview_output_path(file_id)[: -len('.mp4')]}.{name}"
+
 
+def generate_renditions(file_id: str, preview_id: str):
+    """
+    Renders the renditions of preview `file_id` that don't exist yet from the
+    finished preview. A failure only costs the renditions; the preview route
+    falls back to the full preview without them.
+    """
+    missing = [name for name in get_rendition_names() if not os.path.exists(get_rendition_path(file_id, name))]
+    if not missing:
+        return
+    partial_paths = {name: get_rendition_path(file_id, f"{preview_id}.part.{name}") for name in missing}
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        soup = None
-
-        try:
-            logger.debug(f"Fetching page content for URL: {url}")
-            response = requests.get(url, headers=headers, timeout=20)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, features="html.parser")
-            logger.debug("Successfully fetched page content with requests")
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403:
-                logger.warning(f"HTTP 403 error, trying Playwright for URL: {url}")
-                soup = fetch_page_with_playwright(url)
-                logger.debug("Successfully fetched page content with Playwright")
-            else:
-                logger.error(f"HTTP error {e.response.status_code} for URL: {url}")
-                raise
+        render_renditions(get_preview_output_path(file_id), partial_paths)
+        for name, partial_path in partial_paths.items():
+            os.replace(partial_path, get_rendition_path(file_id, name))
+    except ffmpeg.Error as e:
+        logger.warning(f"Could not render renditions of preview {file_id}: {e.stderr.decode()}")
+    finally:
+        for partial_path in partial_paths.values():
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+
+def advance_job(preview_id: str, stage: str, **fields):
+    # The lease now covers the wait for a worker of the next stage
+    update_link_stage(preview_id, stage, lease_seconds=JOB_QUEUE_TIMEOUT_SECONDS, **fields)
+    publish_status(preview_id, "processing", stage)
+
+
+def get_poster_sources(preview_path: str | None) -> list[str]:
+    """Local files a poster can be cut from when the link has no usable remote one."""
+    if not preview_path:
+        return []
+    return [get_rendition_path(preview_path, "poster.jpg"), get_preview_output_path(preview_path)]
 
-        if not soup:
-            raise ValueError("Could not fetch page content")
+
+def finish_job(
+    url: str, preview_id: str, attempt: int, title: str, poster_url: str | None, preview_path: str | None, **media
+):
+    # Cached before the link turns ready, so clients never see it without a poster
+    try:
+        cache_poster(preview_id, poster_url, HEADERS, get_poster_sources(preview_path))
+    except Exception as e:
+        logger.warning(f"Could not cache poster for preview_id {preview_id}: {e}")
+    if not update_link_to_ready(preview_id, attempt, title, poster_url, preview_path, **media):
+        # Reaped or retried while this attempt ran; the newer attempt reports the outcome
+        return
+    publish_status(preview_id, "ready", title=title, has_preview=preview_path is not None)
+    logger.info(f"SUCCESS: Updated DB for URL: {url}, preview_id: {preview_id}")
+
+
+def reuse_existing_preview(job: dict, source_url: str | None = None, content_hash: str | None = None) -> bool:
+    """
+    Finishes the job with the preview of an already processed link that has
+    the same video source or content. Returns False if there is none.
+    """
+    existing = find_reusable_preview(source_url=source_url, content_hash=content_hash)
+    if existing is None or not os.path.exists(get_preview_output_path(existing["preview_path"])):
+        return False
+    logger.info(f"Reusing preview {existing['preview_path']} of identical source for preview_id: {job['preview_id']}")
+    finish_job(
+        job["url"],
+        job["preview_id"],
+        job["attempt"],
+        job["title"],
+        job["poster_url"],
+        existing["preview_path"],
+        duration=existing["duration"],
+        source_size=existing["source_size"],
+        preview_size=existing["preview_size"],
+        content_hash=existing["content_hash"],
+    )
+    return True
+
+
+def fail_job(url: str, preview_id: str, attempt: int | None, e: Exception):
+    """Retries transient failures with backoff, marks the link failed otherwise."""
+    retry_or_fail(url, preview_id, attempt, e)
+
+
+# Each stage returns the job dict for the next one, or None to end the
+# pipeline early (the stage has already updated the database). They are
+# chained by the Celery tasks below or, with the local task backend, by
+# run_link_pipeline.
+
+
+def fetch_stage(url: str, preview_id: str, attempt: int | None = None) -> dict | None:
+    """
+    Extracts title, poster and video source from the uploaded page.
+
+    `attempt` is passed when the link was already claimed (local runner);
+    otherwise the stage starts a new attempt itself.
+    """
+    logger.info(f"Starting processing task for URL: {url}, preview_id: {preview_id}")
+
+    try:
+        if attempt is None:
+            attempt = mark_link_processing(preview_id, JOB_LEASE_SECONDS)
+            if attempt is None:
+                logger.warning(f"preview_id {preview_id} is no longer queued, skipping")
+                return None
+        publish_status(preview_id, "processing", "fetch", attempt=attempt)
+        with job_heartbeat(preview_id, attempt):
+            extraction = extract_video_info(url, HEADERS)
 
         # Extract and clean title
-        if soup.title and soup.title.string:
-            logger.debug(f"Extracting title from page: {soup.title.string}")
+        if extraction.title:
+            logger.debug(f"Extracting title from page: {extraction.title}")
             domain_match = re.search(r"(?:https?://)?(?:www\.)?([^/]+)", url)
             if not domain_match:
-                title = soup.title.string
+                title = extraction.title
             else:
                 base_domain = domain_match.group(1)
                 pattern_to_remove = re.escape(base_domain)
                 title = re.sub(
-                    pattern_to_remove, "", soup.title.string, flags=re.IGNORECASE
+                    pattern_to_remove, "", extraction.title, flags=re.IGNORECASE
                 ).strip()
             logger.info(f"Extracted title: '{title}'")
         else:
             title = "N/A"
             logger.warning("No title found on page")
 
-        # Extract poster URL
-        poster_url_value = get_poster_url_from_video(soup)
-        if isinstance(poster_url_value, list):
-            final_poster_url = poster_url_value[0] if poster_url_value else None
-        else:
-            final_poster_url = poster_url_value
+        final_poster_url = extraction.poster_url
         logger.debug(f"Extracted poster URL: {final_poster_url}")
 
-        # Download video
-        logger.info(f"Starting video download for URL: {url}")
-        save_path = download_video(soup, url, headers=headers)
-
-        preview_path_value = None
-        if save_path:
-            logger.info(f"Video downloaded successfully, generating preview")
-            current_dir = os.path.dirname(os.path.abspath(__file__))  # utils/
-            parent_dir = os.path.dirname(current_dir)  # backend/
-            base_preview_path = os.path.join(
-                parent_dir, "routes", "preview", "preview_videos"
-            )
-            os.makedirs(base_preview_path, exist_ok=True)
-
-            file_id = get_url_identifier(url)
-            preview_save_path = os.path.join(base_preview_path, file_id + ".mp4")
-            preview_path_value = generate_preview_from_video(
-                save_path, preview_save_path, file_id
-            )
-            logger.info(f"Preview generated successfully: {preview_path_value}")
-        else:
+        video_src = extraction.video_src
+        if not video_src:
+            logger.warning("No video source found, skipping preview generation")
+            finish_job(url, preview_id, attempt, title, final_poster_url, None)
+            return None
+
+        job = {
+            "url": url,
+            "preview_id": preview_id,
+            "attempt": attempt,
+            "title": title,
+            "poster_url": final_poster_url,
+            "video_src": video_src,
+        }
+        # Another page (mirror, tracking variant, ...) led to the same video file
+        if reuse_existing_preview(job, source_url=video_src):
+            return None
+
+        advance_job(
+            preview_id, "download", title=title, poster_url=final_poster_url, source_url=video_src
+        )
+        return job
+
+    except Exception as e:
+        fail_job(url, preview_id, attempt, e)
+        return None
+
+
+def download_stage(job: dict, force_download: bool = False) -> dict | None:
+    """
+    Makes the source available to the transcode stage.
+
+    Hosts that support range requests are not downloaded at all (unless
+    `force_download`); the transcode stage streams them instead. The source
+    is fingerprinted either way, and if an identical source already has a
+    preview, the job finishes with that preview right here.
+    """
+    url, preview_id, attempt, video_src = job["url"], job["preview_id"], job["attempt"], job["video_src"]
+    logger.info(f"Starting download stage for preview_id: {preview_id}")
+
+    try:
+        if not start_job_stage(preview_id, attempt, "download"):
+            return None
+        if PREVIEW_SOURCE_MODE == "stream" and not force_download:
+            supported, total_size = get_range_support(video_src, HEADERS)
+            if supported:
+                content_hash = fingerprint_url(video_src, HEADERS, total_size) if total_size else None
+                if content_hash and reuse_existing_preview(job, content_hash=content_hash):
+                    return None
+                logger.info(f"Host supports range requests, transcode stage will stream {video_src}")
+                advance_job(preview_id, "transcode", source_size=total_size, content_hash=content_hash)
+                return {
+                    **job,
+                    "source": video_src,
+                    "source_size": total_size,
+                    "content_hash": content_hash,
+                    "streaming": True,
+                }
+            logger.info("Host does not support range requests, downloading the full video")
+
+        with job_heartbeat(preview_id, attempt):
+            save_path = download_video_src(video_src, HEADERS, preview_id)
+        if not save_path:
             logger.warning("No video downloaded, skipping preview generation")
+            finish_job(url, preview_id, attempt, job["title"], job["poster_url"], None)
+            return None
+
+        content_hash = fingerprint_file(save_path)
+        if reuse_existing_preview(job, content_hash=content_hash):
+            os.remove(save_path)
+            return None
 
-        final_preview_path = preview_path_value
-        update_link_to_ready(preview_id, title, final_poster_url, final_preview_path)
-        logger.info(f"SUCCESS: Updated DB for URL: {url}, preview_id: {preview_id}")
+        source_size = os.path.getsize(save_path)
+        advance_job(
+            preview_id, "transcode", source_path=save_path, source_size=source_size, content_hash=content_hash
+        )
+        return {
+            **job,
+            "source": save_path,
+            "source_size": source_size,
+            "content_hash": content_hash,
+            "streaming": False,
+        }
 
     except Exception as e:
-        logger.error(
-            f"FAILED to process URL: {url}, preview_id: {preview_id}, error: {e}"
+        fail_job(url, preview_id, attempt, e)
+        return None
+
+
+def transcode_stage(job: dict) -> dict | None:
+    """
+    Cuts the preview with ffmpeg and marks the link ready.
+
+    Returns the job again if streaming the source failed and it has to be
+    downloaded in full first.
+    """
+    url, preview_id, attempt, source = job["url"], job["preview_id"], job["attempt"], job["source"]
+    logger.info(f"Starting transcode stage for preview_id: {preview_id}")
+
+    try:
+        if not start_job_stage(preview_id, attempt, "transcode"):
+            return None
+        # Content addressed, so different URLs can never overwrite each other's preview
+        file_id = job.get("content_hash") or preview_id
+        preview_save_path = get_preview_output_path(file_id)
+        # Rendered beside the final file and renamed into place, so jobs with
+        # identical sources never write the same file at the same time
+        partial_save_path = f"{preview_save_path[: -len('.mp4')]}.{preview_id}.part.mp4"
+        input_options = get_ffmpeg_http_options(HEADERS) if job["streaming"] else {}
+        # Streaming from the source host counts as a download from it
+        download_slot = host_download_slot(source) if job["streaming"] else nullcontext()
+
+        with job_heartbeat(preview_id, attempt), download_slot:
+            if job["streaming"]:
+                wait_for_host(source)
+            duration = None
+            try:
+                duration = get_video_duration(source, **input_options)
+            except ffmpeg.Error as e:
+                logger.warning(f"Could not probe video duration: {e.stderr.decode()}")
+
+            preview_path_value = None
+            if os.path.exists(preview_save_path):
+                # A job with an identical source rendered it in the meantime
+                logger.info(f"Preview {file_id} already exists, skipping transcode")
+                preview_path_value = file_id
+                if not job["streaming"] and os.path.exists(source):
+                    os.remove(source)
+            elif duration is not None or not job["streaming"]:
+                preview_path_value = generate_preview_from_video(
+                    source, partial_save_path, file_id, duration=duration, input_options=input_options
+                )
+                if preview_path_value:
+                    os.replace(partial_save_path, preview_save_path)
+                elif os.path.exists(partial_save_path):
+                    os.remove(partial_save_path)
+
+        if not preview_path_value and job["streaming"]:
+            logger.warning("Streaming preview generation failed, falling back to a full download")
+            advance_job(preview_id, "download")
+            return job
+
+        preview_size = None
+        if preview_path_value and os.path.exists(preview_save_path):
+            preview_size = os.path.getsize(preview_save_path)
+            with job_heartbeat(preview_id, attempt):
+                generate_renditions(file_id, preview_id)
+        logger.info(f"Preview generated successfully: {preview_path_value}")
+
+        finish_job(
+            url,
+            preview_id,
+            attempt,
+            job["title"],
+            job["poster_url"],
+            preview_path_value,
+            duration=duration,
+            source_size=job["source_size"],
+            preview_size=preview_size,
+            content_hash=job.get("content_hash"),
         )
-        update_link_to_failed(preview_id, str(e))
+        return None
+
+    except Exception as e:
+        fail_job(url, preview_id, attempt, e)
+        return None
+
+
+def run_link_pipeline(url: str, preview_id: str, attempt: int | None = None):
+    """Runs all stages in the current process (used by utils/local_runner.py)."""
+    job = fetch_stage(url, preview_id, attempt)
+    if job is None:
+        return
+    downloaded = download_stage(job)
+    if downloaded is None:
+        return
+    retry_job = transcode_stage(downloaded)
+    if retry_job is not None:
+        downloaded = download_stage(retry_job, force_download=True)
+        if downloaded is not None:
+            transcode_stage(downloaded)
+
+
+@celery_app.task
+def process_link_task(url: str, preview_id: str):
+    """Fetch stage and pipeline entry point: extracts the page metadata, then queues download -> transcode."""
+    job = fetch_stage(url, preview_id)
+    if job is not None:
+        chain(download_source_task.s(job), transcode_preview_task.s()).apply_async()
+        logger.info(f"Queued download and transcode stages for preview_id: {preview_id}")
+
+
+@celery_app.task
+def download_source_task(job: dict, force_download: bool = False):
+    """Download stage; hosts that support range requests are streamed by the transcode stage instead."""
+    return download_stage(job, force_download)
+
+
+@celery_app.task
+def transcode_preview_task(job: dict | None):
+    """Transcode stage; falls back to a forced download if streaming the source failed."""
+    if job is None:
+        return
+    retry_job = transcode_stage(job)
+    if retry_job is not None:
+        chain(
+            download_source_task.s(retry_job, force_download=True), transcode_preview_task.s()
+        ).apply_async()
+
+
+@celery_app.task
+def reap_expired_jobs_task():
+    """Periodic (beat) task: requeues links whose lease ran out."""
+    return reap_expired_jobs()
@@ -19,6 +19,7 @@ type VideoCardProps = {
   title: string | null;
   thumbnail: string | null;
   preview_id: string | null;
+  preview_path?: string | null;
   videoUrl: string | null;
   onDelete: (id: string) => void;
 };
@@ -27,22 +28,44 @@ const VideoCard = ({
   title,
   thumbnail,
   preview_id,
+  preview_path,
   videoUrl,
   onDelete,
 }: VideoCardProps) => {
   const [isHovering, setIsHovering] = useState(false);
   const [isAlertOpen, setIsAlertOpen] = useState(false);
-  const [thumbnailSrc, setThumbnailSrc] = useState<string | null>(thumbnail);
+  const { serverUrl } = useSettings();
+  const [capturedThumbnail, setCapturedThumbnail] = useState<string | null>(
+    null
+  );
+  // Content addressed preview URLs can be cached by the browser for good
+  const previewUrl = preview_path
+    ? `${serverUrl}/previews/${preview_path}`
+    : preview_id
+    ? `${serverUrl}/preview/${preview_id}`
+    : null;
+  // The server keeps a local thumbnail of every poster (or a frame of the
+  // preview), so remote posters are only a fallback, and capturing a frame
+  // from the video is the last resort
+  const thumbnailCandidates = [
+    preview_id ? `${serverUrl}/poster/${preview_id}?width=320` : null,
+    thumbnail,
+  ].filter((src): src is string => !!src);
+  const [thumbnailIndex, setThumbnailIndex] = useState(0);
+  const thumbnailSrc = thumbnailCandidates[thumbnailIndex] ?? capturedThumbnail;
+  const posterFailed = thumbnailIndex >= thumbnailCandidates.length;
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const { toast } = useToast();
-  const { serverUrl } = useSettings();
-
-  const previewUrl = preview_id ? `${serverUrl}/preview/${preview_id}` : null;
 
   useEffect(() => {
-    // Generate thumbnail from video if no thumbnail is provided
-    if (!thumbnail && previewUrl && videoRef.current && canvasRef.current) {
+    // Generate thumbnail from video once every other source has failed
+    if (
+      posterFailed &&
+      previewUrl &&
+      videoRef.current &&
+      canvasRef.current
+    ) {
       const video = videoRef.current;
       const canvas = canvasRef.current;
       const context = canvas.getContext("2d");
@@ -68,7 +91,7 @@ const VideoCard = ({
                   video.videoWidth,
                   video.videoHeight
                 );
-                setThumbnailSrc(canvas.toDataURL("image/jpeg"));
+                setCapturedThumbnail(canvas.toDataURL("image/jpeg"));
               }
             },
             { once: true }
@@ -77,7 +100,7 @@ const VideoCard = ({
         { once: true }
       );
     }
-  }, [thumbnail, previewUrl]);
+  }, [posterFailed, previewUrl]);
 
   const handleDelete = async () => {
     if (!preview_id) return;
@@ -119,6 +142,11 @@ const VideoCard = ({
           alt={title || "Video thumbnail"}
           className="w-full h-full object-cover"
           loading="lazy"
+          onError={() => {
+            if (thumbnailIndex < thumbnailCandidates.length) {
+              setThumbnailIndex(thumbnailIndex + 1);
+            }
+          }}
         />
       );
     }
@@ -171,15 +199,22 @@ const VideoCard = ({
           {previewUrl && (
             <video
               ref={videoRef}
-              src={previewUrl}
               loop
               muted
               playsInline
+              // Grid tiles only need the small renditions, and only once hovered
+              preload={posterFailed ? "auto" : "none"}
               crossOrigin="anonymous" // Required for toDataURL
               className={`absolute inset-0 w-full h-full object-cover transition-opacity duration-300 ${
                 isHovering ? "opacity-100" : "opacity-0"
               }`}
-            />
+            >
+              <source
+                src={`${previewUrl}?size=240&format=webm`}
+                type="video/webm"
+              />
+              <source src={`${previewUrl}?size=240&format=mp4`} type="video/mp4" />
+            </video>
           )}
           <canvas ref={canvasRef} style={{ display: "none" }} />
         </div>
@@ -30,14 +30,25 @@ type Video = {
   thumbnail: string;
   videoUrl: string;
   preview_id: string;
+  preview_path: string | null;
+};
+
+type SearchResponse = {
+  results: ApiVideo[];
+  next_cursor: number | null;
 };
 
 type ViewMode = "random" | "latest" | "search";
 
+const SEARCH_PAGE_SIZE = 100;
+
 const VideoGrid = () => {
   const [videos, setVideos] = useState<Video[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [totalPages, setTotalPages] = useState(1);
+  // Cursor of the next page of search results, null once all are loaded
+  const [searchCursor, setSearchCursor] = useState<number | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const { serverUrl } = useSettings(); // 👈 2. Get serverUrl from context
   const [error, setError] = useState<string | null>(null); // 👈 3. Add state for fetch errors
 
@@ -65,6 +76,7 @@ const VideoGrid = () => {
         : thumbnailUrl,
       videoUrl: video.url,
       preview_id: video.preview_id,
+      preview_path: video.preview_path,
     };
   };
 
@@ -85,6 +97,7 @@ const VideoGrid = () => {
     setIsLoading(true);
     setError(null); // 👈 4. Clear previous errors on a new fetch
     setVideos([]);
+    setSearchCursor(null);
 
     try {
       let response;
@@ -101,8 +114,13 @@ const VideoGrid = () => {
           setIsLoading(false);
           return;
         }
-        response = await api.get<ApiVideo[]>(`/videos/search?query=${query}`);
-        setVideos(response.data.map(mapApiVideoToComponent));
+        response = await api.get<SearchResponse>(
+          `/videos/search?query=${encodeURIComponent(
+            query
+          )}&limit=${SEARCH_PAGE_SIZE}`
+        );
+        setVideos(response.data.results.map(mapApiVideoToComponent));
+        setSearchCursor(response.data.next_cursor);
         setTotalPages(1);
       }
     } catch (err) {
@@ -120,6 +138,35 @@ const VideoGrid = () => {
     fetchVideos();
   }, [fetchVideos]);
 
+  const loadMoreSearchResults = async () => {
+    if (!query || searchCursor === null) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await api.get<SearchResponse>(
+        `/videos/search?query=${encodeURIComponent(
+          query
+        )}&limit=${SEARCH_PAGE_SIZE}&cursor=${searchCursor}`
+      );
+      const more = response.data.results.map(mapApiVideoToComponent);
+      setVideos((currentVideos) => {
+        // Deletions shift the offsets, so a page may repeat a video
+        const seen = new Set(currentVideos.map((video) => video.id));
+        return [
+          ...currentVideos,
+          ...more.filter((video) => !seen.has(video.id)),
+        ];
+      });
+      setSearchCursor(response.data.next_cursor);
+    } catch (err) {
+      console.error("Failed to load more search results:", err);
+      setError(
+        "Could not connect to the server. Please verify the address in settings and check your network connection."
+      );
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   // ... (other useEffect remains unchanged)
   useEffect(() => {
     if (mode === "latest" && totalPages > 0) {
@@ -249,6 +296,19 @@ const VideoGrid = () => {
             </Button>
           )}
 
+          {!isLoading && mode === "search" && searchCursor !== null && (
+            <Button
+              onClick={loadMoreSearchResults}
+              disabled={isLoadingMore}
+              className="retro-button"
+            >
+              <RefreshCw
+                className={`w-4 h-4 mr-2 ${isLoadingMore ? "animate-spin" : ""}`}
+              />{" "}
+              Load More Results
+            </Button>
+          )}
+
           {!isLoading && mode === "latest" && totalPages > 1 && (
             // ... (Pagination remains unchanged)
             <div className="flex items-center gap-4">